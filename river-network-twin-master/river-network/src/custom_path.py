@@ -1,3 +1,4 @@
+import time
 from pathlib import Path
 
 import networkit as nk
@@ -21,14 +22,22 @@ from qgis.PyQt.QtWidgets import (
 )
 from qgis.utils import iface
 
+from .least_cost_path.astar import astar_path, cached_landmarks
+from .least_cost_path.cache import CACHE_DIR_NAME, cached_cost_graph, cached_cost_grid
 from .least_cost_path.least_cost_path import (
-    build_cost_graph,
     calculate_minimum_elevation,
     coord_to_pixel,
     pixel_to_coord,
 )
 from .river.point_selection_tool import PointSelectionTool
 
+# "dijkstra" — Дейкстра networkit по графу с остановкой на второй точке,
+# "astar" — A* по растру стоимости на Python (медленнее networkit; см.
+# astar.benchmark_point_queries перед переключением)
+POINT_QUERY_ENGINE = "dijkstra"
+# Таблицы ALT считаются один раз на растр стоимости и ускоряют A*
+USE_ALT_LANDMARKS = False
+
 
 class CustomPathBuilder:
     def __init__(self, project_folder: Path) -> None:
@@ -101,8 +110,17 @@ class CustomPathBuilder:
                 QMessageBox.warning(None, "Ошибка", "Не удалось загрузить DEM слой")
                 return
 
-            # Строим граф стоимости с учетом нового модуля least_cost_path
-            g, gt, n_rows, n_cols = build_cost_graph(dem_path, water_rasterized)
+            # Граф (или растр) стоимости строится один раз и берется из кэша,
+            # пока DEM и растр воды не изменились
+            cache_dir = Path(self.project_folder) / CACHE_DIR_NAME
+            g = grid = None
+            if POINT_QUERY_ENGINE == "astar":
+                grid = cached_cost_grid(dem_path, water_rasterized, cache_dir)
+                gt, n_rows, n_cols = grid.geotransform, grid.rows, grid.cols
+            else:
+                g, gt, n_rows, n_cols, node_index = cached_cost_graph(
+                    dem_path, water_rasterized, cache_dir
+                )
 
             # Преобразуем координаты
             src_crs = QgsProject.instance().crs()
@@ -137,9 +155,30 @@ class CustomPathBuilder:
             end_node = end_i * n_cols + end_j
 
             # Вычисляем путь
-            dijk = nk.distance.Dijkstra(g, start_node)
-            dijk.run()
-            node_path = dijk.getPath(end_node)
+            started = time.perf_counter()
+            if grid is not None:
+                landmarks = (
+                    cached_landmarks(grid, dem_path, water_rasterized)
+                    if USE_ALT_LANDMARKS
+                    else None
+                )
+                node_path, search = astar_path(grid, start_node, end_node, landmarks)
+                print(
+                    f"A*: раскрыто {search.settled} пикселей из "
+                    f"{n_rows * n_cols} за {time.perf_counter() - started:.3f} s",
+                    flush=True,
+                )
+            else:
+                # В графе только суша: пиксели переводятся в номера узлов
+                src, dst = node_index.to_node(start_node), node_index.to_node(end_node)
+                node_path = []
+                if src >= 0 and dst >= 0:
+                    dijk = nk.distance.Dijkstra(g, src, storePaths=True, target=dst)
+                    dijk.run()
+                    node_path = node_index.to_pixels(dijk.getPath(dst))
+                print(
+                    f"Dijkstra: {time.perf_counter() - started:.3f} s", flush=True
+                )
 
             if not node_path:
                 QMessageBox.information(
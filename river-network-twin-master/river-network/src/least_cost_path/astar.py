@@ -0,0 +1,259 @@
+"""Поиск пути между двумя точками алгоритмом A* (и ALT) по растру стоимости.
+
+Базовая эвристика — нижняя оценка по минимальному весу ребра: для весов
+``factor * (|dh| + eps)`` любой путь стоит не меньше ``|z_u - z_t|`` плюс
+``eps`` на единицу октильного расстояния. В режиме ALT дополнительно
+используются расстояния от нескольких опорных пикселей (landmarks) и
+неравенство треугольника.
+
+Поиск написан на Python и даже при сильном сокращении раскрытых пикселей
+обычно медленнее Дейкстры networkit; по умолчанию точечные запросы идут
+через networkit, а benchmark_point_queries сравнивает варианты на своих
+данных.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import networkit as nk
+import numpy as np
+
+from src.least_cost_path.cache import CACHE_DIR_NAME, cache_key, evict_cache, mark_used
+from src.least_cost_path.grid_search import (
+    DIRECTIONS,
+    MEAN_COST,
+    NO_LINK,
+    CostGrid,
+    SearchResult,
+    grid_graph,
+    shortest_path_tree,
+    trace_path,
+)
+
+DEFAULT_LANDMARKS = 8
+# Запас на округление расстояний, хранящихся во float32
+LANDMARK_SLACK = 1.0 - 1e-5
+
+
+def octile_distance(di: int, dj: int) -> float:
+    di, dj = abs(di), abs(dj)
+    return max(di, dj) + (math.sqrt(2) - 1) * min(di, dj)
+
+
+def build_landmarks(grid: CostGrid, count: int = DEFAULT_LANDMARKS) -> np.ndarray:
+    """Выбирает опорные пиксели и считает от них расстояния до всех пикселей.
+
+    Опорные пиксели выбираются жадно: каждый следующий — самый удалённый
+    (по стоимости) от уже выбранных. Возвращает массив float32 формы
+    ``(count, rows * cols)``; недостижимые пиксели имеют значение inf.
+    """
+    passable = np.flatnonzero(np.asarray(grid.passable).ravel())
+    if passable.size == 0:
+        return np.empty((0, grid.rows * grid.cols), dtype=np.float32)
+
+    tables = []
+    nearest = np.full(grid.rows * grid.cols, np.inf)
+    landmark = int(passable[0])
+    for _ in range(count):
+        cost = shortest_path_tree(grid, [landmark]).cost.ravel()
+        tables.append(cost.astype(np.float32))
+        nearest = np.minimum(nearest, cost)
+        candidates = np.where(np.isfinite(nearest), nearest, -1.0)
+        landmark = int(np.argmax(candidates))
+        if candidates[landmark] <= 0:
+            break
+    return np.stack(tables)
+
+
+def cached_landmarks(
+    grid: CostGrid,
+    raster_path: Path,
+    water_path: Optional[Path] = None,
+    count: int = DEFAULT_LANDMARKS,
+) -> np.ndarray:
+    """Таблицы ALT, сохранённые рядом с растром стоимости (в папке кэша)."""
+    key = cache_key(
+        raster_path, water_path, kind="landmarks", count=count, weight=grid.edge_weight
+    )
+    path = Path(raster_path).parent / CACHE_DIR_NAME / f"landmarks_{key}.npy"
+    if path.exists():
+        mark_used(path)
+        return np.load(path, mmap_mode="r")
+    tables = build_landmarks(grid, count)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(path, tables)
+    evict_cache(path.parent)
+    return tables
+
+
+def astar_path(
+    grid: CostGrid,
+    source: int,
+    target: int,
+    landmarks: Optional[np.ndarray] = None,
+) -> Tuple[List[int], SearchResult]:
+    """Кратчайший путь от ``source`` до ``target`` алгоритмом A*.
+
+    Возвращает путь (пустой, если цель недостижима) и результат поиска,
+    в котором ``settled`` — число раскрытых пикселей.
+    """
+    rows, cols = grid.rows, grid.cols
+    cost = np.full(rows * cols, np.inf)
+    backlink = np.full(rows * cols, NO_LINK, dtype=np.int8)
+    result = SearchResult(
+        cost=cost.reshape(rows, cols), backlink=backlink.reshape(rows, cols)
+    )
+    values_arr = np.ascontiguousarray(grid.values, dtype="float32").ravel()
+    passable_arr = np.ascontiguousarray(grid.passable, dtype=bool).ravel()
+    if not (passable_arr[source] and passable_arr[target]):
+        return [], result
+
+    values = memoryview(values_arr)
+    passable = memoryview(passable_arr)
+    dist = memoryview(cost)
+    link = memoryview(backlink)
+
+    mean_cost = grid.edge_weight == MEAN_COST
+    eps = grid.eps
+    ti, tj = divmod(target, cols)
+    zt = values[target]
+    if mean_cost:
+        # Вес ребра не меньше factor * минимальной стоимости пикселя
+        min_value = float(np.min(values_arr[passable_arr]))
+        step_floor = max(min_value, 0.0)
+    else:
+        step_floor = eps
+
+    alt: List[Tuple[memoryview, float]] = []
+    if landmarks is not None:
+        for table in landmarks:
+            table = np.ascontiguousarray(table, dtype=np.float32)
+            to_target = float(table[target])
+            if math.isfinite(to_target):
+                alt.append((memoryview(table), to_target))
+
+    sqrt2m1 = math.sqrt(2) - 1
+
+    def heuristic(v: int, vi: int, vj: int) -> float:
+        di = abs(vi - ti)
+        dj = abs(vj - tj)
+        if di > dj:
+            h = step_floor * (di + sqrt2m1 * dj)
+        else:
+            h = step_floor * (dj + sqrt2m1 * di)
+        if not mean_cost:
+            h += abs(values[v] - zt)
+        for table, to_target in alt:
+            dv = table[v]
+            if dv != math.inf:
+                bound = abs(to_target - dv) * LANDMARK_SLACK
+                if bound > h:
+                    h = bound
+        return h
+
+    steps = [
+        (k, di, dj, di * cols + dj, factor)
+        for k, (di, dj, factor) in enumerate(DIRECTIONS)
+    ]
+    si, sj = divmod(source, cols)
+    dist[source] = 0.0
+    heap = [(heuristic(source, si, sj), 0.0, source)]
+    heappop = heapq.heappop
+    heappush = heapq.heappush
+    settled = 0
+    while heap:
+        _, d, u = heappop(heap)
+        if d > dist[u]:
+            continue
+        settled += 1
+        if u == target:
+            break
+        i, j = divmod(u, cols)
+        hu = values[u]
+        for k, di, dj, step, factor in steps:
+            ni = i + di
+            nj = j + dj
+            if ni < 0 or ni >= rows or nj < 0 or nj >= cols:
+                continue
+            v = u + step
+            if not passable[v]:
+                continue
+            hv = values[v]
+            if mean_cost:
+                nd = d + factor * (hu + hv) * 0.5
+            else:
+                nd = d + factor * (abs(hu - hv) + eps)
+            if nd < dist[v]:
+                dist[v] = nd
+                link[v] = k
+                heappush(heap, (nd + heuristic(v, ni, nj), nd, v))
+
+    result.settled = settled
+    return trace_path(result, target), result
+
+
+def benchmark_point_queries(
+    grid: CostGrid,
+    pairs: Sequence[Tuple[int, int]],
+    landmarks: Optional[np.ndarray] = None,
+) -> List[Dict[str, float]]:
+    """Сравнивает Дейкстру networkit с A* и ALT на наборе пар.
+
+    Базовые варианты — ``nk.distance.Dijkstra`` по графу с теми же весами:
+    полное дерево (``networkit``) и с остановкой на цели
+    (``networkit_target``). Для каждой пары и метода возвращает словарь с
+    ключами ``method``, ``source``, ``target``, ``settled`` (для networkit
+    неизвестно — None), ``seconds`` и ``cost``.
+    """
+    graph, index = grid_graph(grid)
+    rows = []
+    for source, target in pairs:
+        src, dst = index.to_node(source), index.to_node(target)
+        for name, stop_early in (("networkit", False), ("networkit_target", True)):
+            started = time.perf_counter()
+            if stop_early:
+                dijk = nk.distance.Dijkstra(graph, src, storePaths=True, target=dst)
+            else:
+                dijk = nk.distance.Dijkstra(graph, src, storePaths=True)
+            dijk.run()
+            dijk.getPath(dst)
+            rows.append(
+                {
+                    "method": name,
+                    "source": source,
+                    "target": target,
+                    "settled": None,
+                    "seconds": time.perf_counter() - started,
+                    "cost": float(dijk.distance(dst)),
+                }
+            )
+        methods = [("astar", None)]
+        if landmarks is not None:
+            methods.append(("alt", landmarks))
+        for name, tables in methods:
+            started = time.perf_counter()
+            _, result = astar_path(grid, source, target, tables)
+            rows.append(
+                {
+                    "method": name,
+                    "source": source,
+                    "target": target,
+                    "settled": result.settled,
+                    "seconds": time.perf_counter() - started,
+                    "cost": float(result.cost.flat[target]),
+                }
+            )
+    for row in rows:
+        settled = "—" if row["settled"] is None else row["settled"]
+        print(
+            f"{row['method']:>16} {row['source']}->{row['target']}: "
+            f"{settled} пикселей, {row['seconds']:.3f} s, "
+            f"стоимость {row['cost']:.3f}",
+            flush=True,
+        )
+    return rows
@@ -0,0 +1,195 @@
+"""Кэш графа и растра стоимости, привязанный к содержимому растров.
+
+Ключ кэша строится из хэшей растра стоимости и растра воды. Готовый граф
+хранится в памяти на время сессии QGIS и в бинарном формате networkit в
+папке проекта, поэтому повторные запросы не перестраивают граф. Все
+файлы кэша (графы, растры, таблицы, снимки поверхностей) в одной папке
+занимают не больше CACHE_MAX_BYTES: после записи нового элемента
+вытесняются те, что дольше всего не использовались.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import networkit as nk
+import numpy as np
+
+from src.least_cost_path.grid import NodeIndex
+from src.least_cost_path.grid_search import HEIGHT_DIFF, CostGrid, load_cost_grid
+
+CACHE_DIR_NAME = "cache"
+# Увеличивается при изменении способа построения графа, чтобы старый кэш
+# на диске не использовался
+CACHE_VERSION = 2
+MEMORY_CACHE_SIZE = 2
+# Предельный объём файлов в папке кэша, байт; сверх него удаляются
+# элементы, которые дольше всего не использовались (последний записанный
+# остаётся)
+CACHE_MAX_BYTES = 4 << 30
+# Элемент кэша — файлы с общим началом имени "<вид>_<ключ>"; остальные
+# файлы папки (например, хранилище путей) не вытесняются
+_ENTRY_NAME = re.compile(r"^([a-z_]+_[0-9a-f]{16})\.")
+
+_file_digests: Dict[str, Tuple[int, int, str]] = {}
+_graphs: "OrderedDict[str, tuple]" = OrderedDict()
+_grids: "OrderedDict[str, CostGrid]" = OrderedDict()
+
+
+def file_digest(path: Path) -> str:
+    """SHA-1 содержимого файла; пересчитывается только при смене mtime/размера."""
+    stat = Path(path).stat()
+    cached = _file_digests.get(str(path))
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+
+    sha = hashlib.sha1()
+    with Path(path).open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    _file_digests[str(path)] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+
+def cache_key(*paths: Optional[Path], **params) -> str:
+    """Ключ по содержимому растров и параметрам построения."""
+    sha = hashlib.sha1(f"v{CACHE_VERSION}".encode())
+    for path in paths:
+        sha.update(file_digest(path).encode() if path is not None else b"-")
+    for name in sorted(params):
+        sha.update(f"{name}={params[name]}".encode())
+    return sha.hexdigest()[:16]
+
+
+def remember(store: OrderedDict, key: str, value) -> None:
+    """Кладёт значение в кэш в памяти, оставляя MEMORY_CACHE_SIZE последних."""
+    store[key] = value
+    store.move_to_end(key)
+    while len(store) > MEMORY_CACHE_SIZE:
+        store.popitem(last=False)
+
+
+def cached_cost_graph(raster_path: Path, water_path: Path, cache_dir: Path):
+    """То же, что build_cost_graph, но с кэшем в памяти и на диске."""
+    # Импорт здесь: least_cost_path сам использует ключи кэша этого модуля
+    from src.least_cost_path.least_cost_path import build_cost_graph
+
+    key = cache_key(raster_path, water_path, kind="graph")
+    if key in _graphs:
+        _graphs.move_to_end(key)
+        return _graphs[key]
+
+    graph_path, meta_path, pixels_path = _graph_files(
+        Path(cache_dir) / f"cost_graph_{key}.nkbg"
+    )
+    if graph_path.exists() and meta_path.exists() and pixels_path.exists():
+        mark_used(graph_path)
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        g = nk.graphio.readGraph(str(graph_path), nk.Format.NetworkitBinary)
+        index = NodeIndex.from_pixels(
+            np.load(pixels_path), meta["rows"], meta["cols"]
+        )
+        result = (g, tuple(meta["geotransform"]), meta["rows"], meta["cols"], index)
+    else:
+        result = build_cost_graph(raster_path, water_path)
+        g, gt, rows, cols, index = result
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        nk.graphio.writeGraph(g, str(graph_path), nk.Format.NetworkitBinary)
+        np.save(pixels_path, index.pixels)
+        meta_path.write_text(
+            json.dumps({"geotransform": list(gt), "rows": rows, "cols": cols}),
+            encoding="utf-8",
+        )
+        evict_cache(Path(cache_dir))
+
+    remember(_graphs, key, result)
+    return result
+
+
+def _graph_files(graph_path: Path) -> Tuple[Path, Path, Path]:
+    return (
+        graph_path,
+        graph_path.with_suffix(".json"),
+        graph_path.with_suffix(".pixels.npy"),
+    )
+
+
+def mark_used(path: Path) -> None:
+    """Отмечает использование файла кэша: по времени изменения вытесняются
+    давно не нужные элементы."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def evict_cache(cache_dir: Path, max_bytes: int = CACHE_MAX_BYTES) -> None:
+    """Удаляет давно не использованные элементы, пока их объём больше ``max_bytes``.
+
+    Файлы, открытые другим процессом (или как memmap в Windows), пропускаются.
+    """
+    entries: Dict[str, List[Path]] = {}
+    for path in Path(cache_dir).glob("*"):
+        match = _ENTRY_NAME.match(path.name)
+        if match and path.is_file():
+            entries.setdefault(match.group(1), []).append(path)
+
+    def last_used(files: List[Path]) -> int:
+        return max(path.stat().st_mtime_ns for path in files)
+
+    total = 0
+    ranked = sorted(entries.values(), key=last_used, reverse=True)
+    for rank, files in enumerate(ranked):
+        total += sum(path.stat().st_size for path in files)
+        if rank and total > max_bytes:
+            for path in files:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+
+def cached_cost_grid(
+    raster_path: Path,
+    water_path: Optional[Path],
+    cache_dir: Path,
+    edge_weight: str = HEIGHT_DIFF,
+) -> CostGrid:
+    """То же, что load_cost_grid, но массивы берутся из .npy через memmap."""
+    key = cache_key(raster_path, water_path, kind="grid", edge_weight=edge_weight)
+    if key in _grids:
+        _grids.move_to_end(key)
+        return _grids[key]
+
+    base = Path(cache_dir) / f"cost_grid_{key}"
+    values_path = base.with_suffix(".values.npy")
+    passable_path = base.with_suffix(".passable.npy")
+    meta_path = base.with_suffix(".json")
+    if values_path.exists() and passable_path.exists() and meta_path.exists():
+        mark_used(meta_path)
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        grid = CostGrid(
+            values=np.load(values_path, mmap_mode="r"),
+            passable=np.load(passable_path, mmap_mode="r"),
+            geotransform=tuple(meta["geotransform"]),
+            edge_weight=edge_weight,
+        )
+    else:
+        grid = load_cost_grid(raster_path, water_path, edge_weight=edge_weight)
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        np.save(values_path, grid.values)
+        np.save(passable_path, grid.passable)
+        meta_path.write_text(
+            json.dumps({"geotransform": list(grid.geotransform)}), encoding="utf-8"
+        )
+        evict_cache(Path(cache_dir))
+
+    remember(_grids, key, grid)
+    return grid
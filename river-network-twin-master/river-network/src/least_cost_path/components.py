@@ -0,0 +1,98 @@
+"""Компоненты связности суши для отсечения недостижимых пар точек.
+
+Маска воды делит растр на несвязанные участки суши (острова, берега
+широких рек). Пути между точками из разных участков не существуют, поэтому
+такие пары отбрасываются до поиска. Разметка строится по сериям суши в
+строках растра: узлы графа — серии, рёбра — 8-связные касания серий
+соседних строк; так граф на порядки меньше графа пикселей.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import networkit as nk
+import numpy as np
+
+from src.least_cost_path.cache import (
+    CACHE_DIR_NAME,
+    cache_key,
+    evict_cache,
+    mark_used,
+    remember,
+)
+from src.least_cost_path.grid import read_land_mask
+
+NO_COMPONENT = -1
+
+_components: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+
+def label_land_components(land: np.ndarray) -> np.ndarray:
+    """Номер компоненты 8-связности для каждого пикселя суши (NO_COMPONENT — вода)."""
+    rows, cols = land.shape
+    width = cols + 2
+    padded = np.zeros((rows, width), dtype=np.int8)
+    padded[:, 1:-1] = land
+    change = np.diff(padded, axis=1)
+    # Серии в порядке обхода по строкам; конец серии не включается
+    run_row, run_start = np.nonzero(change == 1)
+    _, run_end = np.nonzero(change == -1)
+    n_runs = run_row.size
+
+    labels = np.full(rows * cols, NO_COMPONENT, dtype=np.int32)
+    if n_runs == 0:
+        return labels.reshape(rows, cols)
+
+    # Серии следующей строки, касающиеся серии [s, e): конец >= s, начало <= e
+    start_keys = run_row.astype(np.int64) * width + run_start
+    end_keys = run_row.astype(np.int64) * width + run_end
+    next_row = (run_row.astype(np.int64) + 1) * width
+    lo = np.searchsorted(end_keys, next_row + run_start, side="left")
+    hi = np.searchsorted(start_keys, next_row + run_end, side="right")
+    counts = np.maximum(hi - lo, 0)
+    u = np.repeat(np.arange(n_runs, dtype=np.int64), counts)
+    v = np.arange(u.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    v = v + np.repeat(lo, counts)
+
+    if u.size:
+        graph = nk.GraphFromCoo(
+            (np.ones(u.size), (u, v.astype(np.int64))),
+            n=n_runs,
+            weighted=False,
+            directed=False,
+        )
+    else:
+        graph = nk.Graph(n_runs)
+    components = nk.components.ConnectedComponents(graph)
+    components.run()
+    run_component = np.array(components.getPartition().getVector(), dtype=np.int32)
+
+    labels[np.flatnonzero(land.ravel())] = np.repeat(run_component, run_end - run_start)
+    return labels.reshape(rows, cols)
+
+
+def cached_land_components(
+    water_path: Path, land: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """label_land_components для растра воды с кэшем в памяти и на диске."""
+    key = cache_key(water_path, kind="land_components")
+    if key in _components:
+        _components.move_to_end(key)
+        return _components[key]
+
+    path = Path(water_path).parent / CACHE_DIR_NAME / f"land_components_{key}.npy"
+    if path.exists():
+        mark_used(path)
+        labels = np.load(path, mmap_mode="r")
+    else:
+        if land is None:
+            land = read_land_mask(water_path)
+        labels = label_land_components(land)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.save(path, labels)
+        evict_cache(path.parent)
+    remember(_components, key, labels)
+    return labels
@@ -0,0 +1,235 @@
+"""Иерархический поиск путей: грубый уровень пирамиды и коридор на полном.
+
+Путь сначала ищется на укрупнённом растре, затем расширяется в коридор
+заданной ширины и уточняется на исходном разрешении только внутри него.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from src.least_cost_path.cache import CACHE_DIR_NAME, cache_key, evict_cache, mark_used
+from src.least_cost_path.grid import dilate_mask
+from src.least_cost_path.grid_search import CostGrid, shortest_path_tree, trace_path
+from src.least_cost_path.sssp import SearchBounds, SearchStats, within_radius
+
+
+def coarsen_grid(grid: CostGrid, factor: int) -> CostGrid:
+    """Уровень пирамиды: средняя стоимость блока ``factor x factor``.
+
+    Блок считается проходимым, если суши в нём не меньше половины.
+    """
+    rows, cols = grid.rows, grid.cols
+    c_rows = -(-rows // factor)
+    c_cols = -(-cols // factor)
+    pad = ((0, c_rows * factor - rows), (0, c_cols * factor - cols))
+
+    values = np.pad(np.asarray(grid.values, dtype=np.float64), pad, constant_values=0)
+    inside = np.pad(np.ones((rows, cols), dtype=np.float64), pad, constant_values=0)
+    land = np.pad(np.asarray(grid.passable, dtype=np.float64), pad, constant_values=0)
+    shape = (c_rows, factor, c_cols, factor)
+    n_inside = inside.reshape(shape).sum(axis=(1, 3))
+    coarse_values = values.reshape(shape).sum(axis=(1, 3)) / n_inside
+    coarse_passable = land.reshape(shape).sum(axis=(1, 3)) * 2 >= n_inside
+
+    gt = grid.geotransform
+    coarse_gt = (
+        gt[0],
+        gt[1] * factor,
+        gt[2] * factor,
+        gt[3],
+        gt[4] * factor,
+        gt[5] * factor,
+    )
+    return CostGrid(
+        values=coarse_values.astype("float32"),
+        passable=coarse_passable,
+        geotransform=coarse_gt,
+        edge_weight=grid.edge_weight,
+        eps=grid.eps,
+    )
+
+
+def cached_pyramid_level(
+    grid: CostGrid,
+    raster_path: Path,
+    water_path: Optional[Path],
+    factor: int,
+) -> CostGrid:
+    """Уровень пирамиды, сохранённый в папке кэша рядом с DEM."""
+    key = cache_key(
+        raster_path, water_path, kind="pyramid", factor=factor, weight=grid.edge_weight
+    )
+    base = Path(raster_path).parent / CACHE_DIR_NAME / f"pyramid_{key}"
+    values_path = base.with_suffix(".values.npy")
+    passable_path = base.with_suffix(".passable.npy")
+    meta_path = base.with_suffix(".json")
+    if values_path.exists() and passable_path.exists() and meta_path.exists():
+        mark_used(meta_path)
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        return CostGrid(
+            values=np.load(values_path),
+            passable=np.load(passable_path),
+            geotransform=tuple(meta["geotransform"]),
+            edge_weight=grid.edge_weight,
+            eps=grid.eps,
+        )
+
+    coarse = coarsen_grid(grid, factor)
+    base.parent.mkdir(parents=True, exist_ok=True)
+    np.save(values_path, coarse.values)
+    np.save(passable_path, coarse.passable)
+    meta_path.write_text(
+        json.dumps({"geotransform": list(coarse.geotransform)}), encoding="utf-8"
+    )
+    evict_cache(base.parent)
+    return coarse
+
+
+def _solve_in_corridor(
+    fine: CostGrid,
+    coarse: CostGrid,
+    factor: int,
+    source: int,
+    target: int,
+    coarse_path: List[int],
+    width: int,
+    max_cost: Optional[float],
+    min_value: Optional[float] = None,
+    stats: Optional[SearchStats] = None,
+) -> List[int]:
+    """Ищет путь на полном разрешении внутри коридора вокруг грубого пути."""
+    c_rows, c_cols = np.divmod(np.asarray(coarse_path), coarse.cols)
+    radius = -(-width // factor)
+    r0 = max(0, int(c_rows.min()) - radius)
+    r1 = min(coarse.rows, int(c_rows.max()) + radius + 1)
+    c0 = max(0, int(c_cols.min()) - radius)
+    c1 = min(coarse.cols, int(c_cols.max()) + radius + 1)
+
+    window = np.zeros((r1 - r0, c1 - c0), dtype=bool)
+    window[c_rows - r0, c_cols - c0] = True
+    window = dilate_mask(window, radius)
+    window = np.repeat(np.repeat(window, factor, axis=0), factor, axis=1)
+
+    fr0, fc0 = r0 * factor, c0 * factor
+    fr1 = min(fine.rows, r1 * factor)
+    fc1 = min(fine.cols, c1 * factor)
+    corridor = window[: fr1 - fr0, : fc1 - fc0]
+    sub = CostGrid(
+        values=fine.values[fr0:fr1, fc0:fc1],
+        passable=fine.passable[fr0:fr1, fc0:fc1] & corridor,
+        geotransform=fine.geotransform,
+        edge_weight=fine.edge_weight,
+        eps=fine.eps,
+    )
+
+    sub_cols = fc1 - fc0
+
+    def to_local(node: int) -> int:
+        i, j = divmod(node, fine.cols)
+        return (i - fr0) * sub_cols + (j - fc0)
+
+    local_source = to_local(source)
+    local_target = to_local(target)
+    tree = shortest_path_tree(
+        sub,
+        [local_source],
+        targets=[local_target],
+        max_cost=max_cost,
+        min_value=min_value,
+    )
+    if stats is not None:
+        stats.add(tree)
+    local_path = trace_path(tree, local_target)
+    if not local_path:
+        return []
+    li, lj = np.divmod(np.asarray(local_path), sub_cols)
+    return ((li + fr0) * fine.cols + (lj + fc0)).tolist()
+
+
+def corridor_paths_from_source(
+    fine: CostGrid,
+    coarse: CostGrid,
+    factor: int,
+    source: int,
+    targets: Sequence[int],
+    width: int,
+    bounds: Optional[SearchBounds] = None,
+    stats: Optional[SearchStats] = None,
+) -> List[List[int]]:
+    """Пути от ``source`` до ``targets`` через поиск в коридорах.
+
+    ``width`` — полуширина коридора в пикселях полного разрешения. Если путь
+    внутри коридора не найден (например, коридор перекрыт водой, невидимой на
+    грубом уровне), пара пересчитывается на всём растре. Ограничение
+    ``bounds.max_drop`` применяется к уточнению каждой пары отдельно.
+    """
+    if bounds is None:
+        bounds = SearchBounds()
+    in_radius = within_radius(source, targets, fine.cols, bounds.max_radius)
+    wanted = [t for t, ok in zip(targets, in_radius) if ok]
+    if not wanted:
+        return [[] for _ in targets]
+
+    def to_coarse(node: int) -> int:
+        i, j = divmod(node, fine.cols)
+        return (i // factor) * coarse.cols + (j // factor)
+
+    # Клетки с терминалами открываем даже если на грубом уровне в них вода
+    coarse_nodes = [to_coarse(source)] + [to_coarse(t) for t in wanted]
+    passable = np.array(coarse.passable, dtype=bool)
+    passable.flat[coarse_nodes] = True
+    open_coarse = CostGrid(
+        values=coarse.values,
+        passable=passable,
+        geotransform=coarse.geotransform,
+        edge_weight=coarse.edge_weight,
+        eps=coarse.eps,
+    )
+    coarse_tree = shortest_path_tree(
+        open_coarse, [coarse_nodes[0]], targets=coarse_nodes[1:]
+    )
+
+    paths = []
+    for target, ok in zip(targets, in_radius):
+        if not ok:
+            paths.append([])
+            continue
+        coarse_path = trace_path(coarse_tree, to_coarse(target))
+        floor = None
+        if bounds.max_drop is not None:
+            floor = (
+                min(float(fine.values.flat[source]), float(fine.values.flat[target]))
+                - bounds.max_drop
+            )
+        path = []
+        if coarse_path:
+            path = _solve_in_corridor(
+                fine,
+                coarse,
+                factor,
+                source,
+                target,
+                coarse_path,
+                width,
+                bounds.max_cost,
+                floor,
+                stats,
+            )
+        if not path:
+            tree = shortest_path_tree(
+                fine,
+                [source],
+                targets=[target],
+                max_cost=bounds.max_cost,
+                min_value=floor,
+            )
+            if stats is not None:
+                stats.add(tree)
+            path = trace_path(tree, target)
+        paths.append(path)
+    return paths
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from osgeo import gdal
+
+# Половина 8-связной окрестности: вниз, вправо, вниз-влево, вниз-вправо.
+# Вторая половина получается автоматически, так как граф неориентированный.
+NEIGHBOUR_OFFSETS = (
+    (1, 0, 1.0),
+    (0, 1, 1.0),
+    (1, -1, math.sqrt(2)),
+    (1, 1, math.sqrt(2)),
+)
+
+
+def read_land_mask(water_path) -> np.ndarray:
+    """Читает растр воды и возвращает булеву маску суши (True — проходимо)."""
+    ds_water = gdal.Open(str(water_path))
+    band = ds_water.GetRasterBand(1)
+    arr_water = band.ReadAsArray().astype(float)
+    nodata_water = band.GetNoDataValue()
+    if nodata_water is not None:
+        arr_water[arr_water == nodata_water] = 0
+    return arr_water == 0
+
+
+@dataclass
+class NodeIndex:
+    """Плотная нумерация проходимых пикселей для узлов графа.
+
+    Пиксель задаётся плоским индексом ``i * cols + j``, узел — номером среди
+    проходимых пикселей в том же порядке. ``nodes`` хранит номер узла для
+    каждого пикселя (-1 для воды), ``pixels`` — обратное соответствие.
+    """
+
+    pixels: np.ndarray
+    nodes: np.ndarray
+    cols: int
+
+    @classmethod
+    def from_mask(cls, passable: np.ndarray) -> "NodeIndex":
+        return cls.from_pixels(
+            np.flatnonzero(passable.ravel()), passable.shape[0], passable.shape[1]
+        )
+
+    @classmethod
+    def from_pixels(cls, pixels: np.ndarray, rows: int, cols: int) -> "NodeIndex":
+        pixels = np.asarray(pixels, dtype=np.int64)
+        nodes = np.full(rows * cols, -1, dtype=np.int32)
+        nodes[pixels] = np.arange(pixels.size, dtype=np.int32)
+        return cls(pixels=pixels, nodes=nodes, cols=cols)
+
+    @property
+    def size(self) -> int:
+        return int(self.pixels.size)
+
+    def to_node(self, pixel: int) -> int:
+        """Номер узла для пикселя или -1, если пиксель непроходим."""
+        return int(self.nodes[pixel])
+
+    def to_pixels(self, nodes: Sequence[int]) -> List[int]:
+        """Переводит путь из номеров узлов обратно в индексы пикселей."""
+        return self.pixels[np.asarray(nodes, dtype=np.int64)].tolist()
+
+
+def pixels_to_coords(
+    pixels: np.ndarray, cols: int, gt: Sequence[float]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Координаты центров пикселей по их плоским индексам ``i * cols + j``."""
+    i, j = np.divmod(np.asarray(pixels, dtype=np.int64), cols)
+    x = gt[0] + (j + 0.5) * gt[1] + (i + 0.5) * gt[2]
+    y = gt[3] + (j + 0.5) * gt[4] + (i + 0.5) * gt[5]
+    return x, y
+
+
+def coords_to_pixels(
+    x: np.ndarray, y: np.ndarray, gt: Sequence[float]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Строка и столбец пикселя, содержащего каждую точку (может быть вне растра)."""
+    inv = 1.0 / (gt[1] * gt[5] - gt[2] * gt[4])
+    dx = np.asarray(x, dtype=np.float64) - gt[0]
+    dy = np.asarray(y, dtype=np.float64) - gt[3]
+    j = np.floor(inv * (gt[5] * dx - gt[2] * dy)).astype(np.int64)
+    i = np.floor(inv * (-gt[4] * dx + gt[1] * dy)).astype(np.int64)
+    return i, j
+
+
+def grid_edges(
+    passable: np.ndarray,
+    index: Optional[NodeIndex] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Возвращает концы рёбер решётки и множители длины в виде массивов.
+
+    Рёбра упорядочены так же, как при обходе растра по строкам с перебором
+    ``NEIGHBOUR_OFFSETS``: от этого зависит порядок смежности в networkit,
+    а значит и выбор среди равных по стоимости путей. Если задан ``index``,
+    концы рёбер возвращаются номерами узлов, а не пикселей; нумерация
+    монотонна, поэтому порядок рёбер не меняется.
+    """
+    rows, cols = passable.shape
+    ids = np.arange(rows * cols, dtype=np.int64).reshape(rows, cols)
+
+    targets = np.zeros((rows, cols, len(NEIGHBOUR_OFFSETS)), dtype=np.int64)
+    valid = np.zeros((rows, cols, len(NEIGHBOUR_OFFSETS)), dtype=bool)
+    factors = np.array([f for _, _, f in NEIGHBOUR_OFFSETS], dtype=np.float64)
+
+    for k, (di, dj, _) in enumerate(NEIGHBOUR_OFFSETS):
+        src_rows = slice(0, rows - di)
+        dst_rows = slice(di, rows)
+        src_cols = slice(max(0, -dj), cols - max(0, dj))
+        dst_cols = slice(max(0, dj), cols - max(0, -dj))
+        targets[src_rows, src_cols, k] = ids[dst_rows, dst_cols]
+        valid[src_rows, src_cols, k] = (
+            passable[src_rows, src_cols] & passable[dst_rows, dst_cols]
+        )
+
+    u = np.broadcast_to(ids[:, :, None], targets.shape)[valid]
+    v = targets[valid]
+    factor = np.broadcast_to(factors, targets.shape)[valid]
+    if index is not None:
+        u = index.nodes[u].astype(np.int64)
+        v = index.nodes[v].astype(np.int64)
+    return u, v, factor
+
+
+def dilate_mask(mask: np.ndarray, radius: int) -> np.ndarray:
+    """Расширение булевой маски квадратом со стороной ``2 * radius + 1``."""
+    for axis in (0, 1):
+        grown = mask.copy()
+        for shift in range(1, radius + 1):
+            if shift >= mask.shape[axis]:
+                break
+            head = [slice(None), slice(None)]
+            tail = [slice(None), slice(None)]
+            head[axis] = slice(shift, None)
+            tail[axis] = slice(None, -shift)
+            grown[tuple(head)] |= mask[tuple(tail)]
+            grown[tuple(tail)] |= mask[tuple(head)]
+        mask = grown
+    return mask
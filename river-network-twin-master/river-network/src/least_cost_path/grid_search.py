@@ -0,0 +1,623 @@
+"""Поиск кратчайших путей по растру стоимости с маской проходимости.
+
+Результат поиска — растры накопленной стоимости и обратных ссылок. Поиск
+выполняет Дейкстра networkit по графу только из пикселей суши с весами
+edge_weights; граф всего растра строится один раз и хранится в CostGrid.
+Если у растра задан ``implicit_search``, граф не строится: соседи и веса
+рёбер вычисляются на лету в цикле Python. Тогда на пиксель приходится 4 байта
+стоимости, 1 байт маски, 8 байт накопленной стоимости и 1 байт обратной
+ссылки, и полноразмерный DEM помещается в память без укрупнения пикселей,
+но поиск примерно в 10 раз медленнее.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+import sys
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import networkit as nk
+import numpy as np
+from osgeo import gdal
+
+from src.least_cost_path.grid import NodeIndex, grid_edges, read_land_mask
+
+# Полная 8-связная окрестность. Индекс направления хранится в растре
+# обратных ссылок, поэтому порядок элементов менять нельзя.
+DIRECTIONS = (
+    (-1, -1, math.sqrt(2)),
+    (-1, 0, 1.0),
+    (-1, 1, math.sqrt(2)),
+    (0, -1, 1.0),
+    (0, 1, 1.0),
+    (1, -1, math.sqrt(2)),
+    (1, 0, 1.0),
+    (1, 1, math.sqrt(2)),
+)
+NO_LINK = -1
+
+# Способы пересчёта значений растра в вес ребра
+HEIGHT_DIFF = "height_diff"  # factor * (|dh| + eps), как в least_cost_path
+MEAN_COST = "mean_cost"  # factor * (c_u + c_v) / 2, как в underground.network
+
+
+# Расстояние, которое networkit возвращает для недостижимых узлов
+UNREACHABLE = sys.float_info.max
+
+# Граф растра строится один раз, даже если поиск начат из нескольких потоков
+_graph_lock = threading.Lock()
+
+
+@dataclass
+class CostGrid:
+    """Растр стоимости и маска проходимых пикселей.
+
+    ``implicit_search`` — искать без графа networkit (см. описание модуля).
+    """
+
+    values: np.ndarray
+    passable: np.ndarray
+    geotransform: Tuple[float, ...]
+    edge_weight: str = HEIGHT_DIFF
+    eps: float = 1e-6
+    implicit_search: bool = False
+    _graph: Optional[Tuple[nk.Graph, NodeIndex]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    @property
+    def rows(self) -> int:
+        return self.values.shape[0]
+
+    @property
+    def cols(self) -> int:
+        return self.values.shape[1]
+
+
+@dataclass
+class SearchResult:
+    """Результат поиска: накопленная стоимость и обратные ссылки.
+
+    ``label`` (если запрошен) хранит номер ближайшего источника для каждого
+    пикселя, т.е. разбиение растра на области Вороного по стоимости.
+    ``settled`` — число окончательно найденных пикселей. Только поиск без
+    графа считает ``relaxed`` — число улучшений стоимости пикселей — и
+    ``pruned`` — число переходов, отброшенных из-за ограничения ``min_value``.
+    """
+
+    cost: np.ndarray
+    backlink: np.ndarray
+    settled: int = 0
+    label: Optional[np.ndarray] = None
+    relaxed: int = 0
+    pruned: int = 0
+
+
+def load_cost_grid(
+    raster_path: Path,
+    water_path: Optional[Path] = None,
+    edge_weight: str = HEIGHT_DIFF,
+) -> CostGrid:
+    """Загружает растр стоимости и (если задан) растр воды как CostGrid."""
+    dataset = gdal.Open(str(raster_path))
+    values = dataset.GetRasterBand(1).ReadAsArray().astype("float32")
+    if water_path is not None:
+        passable = read_land_mask(water_path)
+    else:
+        passable = np.ones(values.shape, dtype=bool)
+    return CostGrid(
+        values=values,
+        passable=passable,
+        geotransform=dataset.GetGeoTransform(),
+        edge_weight=edge_weight,
+    )
+
+
+def shortest_path_tree(
+    grid: CostGrid,
+    sources: Iterable[int],
+    with_labels: bool = False,
+    targets: Optional[Iterable[int]] = None,
+    max_cost: Optional[float] = None,
+    max_radius: Optional[float] = None,
+    min_value: Optional[float] = None,
+) -> SearchResult:
+    """Алгоритм Дейкстры от одного или нескольких пикселей-источников.
+
+    Источники задаются плоскими индексами ``i * cols + j``. Непроходимые
+    источники пропускаются. При ``with_labels`` каждому пикселю
+    присваивается порядковый номер источника, от которого он достигнут.
+
+    Поиск останавливается раньше, если заданы ``targets`` (все цели
+    достигнуты) или ``max_cost`` (фронт превысил стоимость). ``max_radius``
+    (в пикселях) не пускает поиск дальше этого расстояния от источника.
+    ``min_value`` запрещает переходы в пиксели со значением ниже него
+    (для DEM — нижняя граница высоты пути).
+    После ранней остановки конечная стоимость остаётся только у окончательно
+    найденных пикселей, а стоимость выше ``max_cost`` не сохраняется.
+    """
+    sources = list(sources)
+    if not grid.implicit_search:
+        roots: Dict[int, int] = {}
+        passable = grid.passable.flat
+        for idx, src in enumerate(sources):
+            if passable[src]:
+                roots.setdefault(src, idx)
+        return _graph_tree(
+            grid, roots, with_labels, targets, max_cost, max_radius, min_value
+        )
+    rows, cols = grid.rows, grid.cols
+    cost = np.full(rows * cols, np.inf)
+    backlink = np.full(rows * cols, NO_LINK, dtype=np.int8)
+    # Для ограничения по радиусу нужен источник каждого пикселя
+    with_labels = with_labels or max_radius is not None
+    label = np.full(rows * cols, -1, dtype=np.int32) if with_labels else None
+
+    # memoryview даёт быстрый поэлементный доступ без копирования массивов
+    values = memoryview(np.ascontiguousarray(grid.values, dtype="float32").ravel())
+    passable = memoryview(np.ascontiguousarray(grid.passable, dtype=bool).ravel())
+    dist = memoryview(cost)
+    link = memoryview(backlink)
+    lab = memoryview(label) if label is not None else None
+
+    steps = [
+        (k, di, dj, di * cols + dj, factor)
+        for k, (di, dj, factor) in enumerate(DIRECTIONS)
+    ]
+    mean_cost = grid.edge_weight == MEAN_COST
+    eps = grid.eps
+
+    heap = []
+    for idx, src in enumerate(sources):
+        if passable[src] and dist[src] != 0.0:
+            dist[src] = 0.0
+            heap.append((0.0, src))
+            if lab is not None:
+                lab[src] = idx
+    heapq.heapify(heap)
+
+    remaining = set(targets) if targets is not None else None
+    if remaining is not None:
+        remaining = {t for t in remaining if passable[t]}
+    origins = [divmod(src, cols) for src in sources]
+    radius_sq = max_radius * max_radius if max_radius is not None else None
+    floor = min_value if min_value is not None else -math.inf
+
+    heappop = heapq.heappop
+    heappush = heapq.heappush
+    settled = relaxed = pruned = 0
+    while heap:
+        if remaining is not None and not remaining:
+            break
+        d, u = heappop(heap)
+        if d > dist[u]:
+            continue
+        if max_cost is not None and d > max_cost:
+            heappush(heap, (d, u))
+            break
+        settled += 1
+        if remaining is not None:
+            remaining.discard(u)
+        i, j = divmod(u, cols)
+        if radius_sq is not None:
+            oi, oj = origins[lab[u]]
+        hu = values[u]
+        for k, di, dj, step, factor in steps:
+            ni = i + di
+            nj = j + dj
+            if ni < 0 or ni >= rows or nj < 0 or nj >= cols:
+                continue
+            if radius_sq is not None and (
+                (ni - oi) * (ni - oi) + (nj - oj) * (nj - oj) > radius_sq
+            ):
+                continue
+            v = u + step
+            if not passable[v]:
+                continue
+            hv = values[v]
+            if hv < floor:
+                pruned += 1
+                continue
+            if mean_cost:
+                nd = d + factor * (hu + hv) * 0.5
+            else:
+                nd = d + factor * (abs(hu - hv) + eps)
+            if nd < dist[v]:
+                relaxed += 1
+                dist[v] = nd
+                link[v] = k
+                if lab is not None:
+                    lab[v] = lab[u]
+                heappush(heap, (nd, v))
+
+    # Пиксели, оставшиеся в куче после ранней остановки, не окончательны
+    for d, v in heap:
+        if d == dist[v]:
+            dist[v] = math.inf
+
+    return SearchResult(
+        cost=cost.reshape(rows, cols),
+        backlink=backlink.reshape(rows, cols),
+        settled=settled,
+        label=label.reshape(rows, cols) if label is not None else None,
+        relaxed=relaxed,
+        pruned=pruned,
+    )
+
+
+def grid_graph(
+    grid: CostGrid, mask: Optional[np.ndarray] = None, roots: Sequence[int] = ()
+) -> Tuple[nk.Graph, NodeIndex]:
+    """Граф networkit по пикселям суши (или ``mask``) с весами edge_weights.
+
+    Если заданы ``roots`` (индексы пикселей), добавляется узел с номером
+    ``index.size``, соединённый с ними рёбрами нулевого веса, — общий
+    корень поиска от нескольких источников.
+    """
+    passable = np.asarray(grid.passable if mask is None else mask, dtype=bool)
+    index = NodeIndex.from_mask(passable)
+    u, v, factor = grid_edges(passable, index)
+    flat = np.asarray(grid.values).ravel()[index.pixels]
+    weights = edge_weights(grid, flat[u], flat[v], factor)
+    n = index.size
+    if len(roots):
+        root_nodes = index.nodes[np.asarray(roots, dtype=np.int64)].astype(np.int64)
+        u = np.concatenate([u, np.full(root_nodes.size, n, dtype=np.int64)])
+        v = np.concatenate([v, root_nodes])
+        weights = np.concatenate([weights, np.zeros(root_nodes.size)])
+        n += 1
+    graph = nk.GraphFromCoo((weights, (u, v)), n=n, weighted=True, directed=False)
+    return graph, index
+
+
+def _cached_graph(grid: CostGrid) -> Tuple[nk.Graph, NodeIndex]:
+    with _graph_lock:
+        if grid._graph is None:
+            grid._graph = grid_graph(grid)
+        return grid._graph
+
+
+def _graph_tree(
+    grid: CostGrid,
+    roots: Dict[int, int],
+    with_labels: bool,
+    targets: Optional[Iterable[int]],
+    max_cost: Optional[float],
+    max_radius: Optional[float],
+    min_value: Optional[float],
+) -> SearchResult:
+    """shortest_path_tree через Дейкстру networkit.
+
+    ``roots`` сопоставляет проходимым пикселям-источникам их номера. Поиск
+    с ``max_radius`` идёт по окну вокруг источников, с ``min_value`` или от
+    нескольких источников — по отдельно построенному графу, остальные — по
+    графу всего растра. Обратные ссылки восстанавливаются по стоимости:
+    предок пикселя — найденный раньше него сосед ``u``, для которого
+    ``cost[u] + w(u, v)`` в точности равно ``cost[v]``.
+    """
+    rows, cols = grid.rows, grid.cols
+    if max_radius is not None and roots:
+        window = _radius_window(grid, list(roots), max_radius)
+        if window is not None:
+            return _window_tree(
+                grid, window, roots, with_labels, targets, max_cost, max_radius, min_value
+            )
+
+    cost = np.full(rows * cols, np.inf)
+    backlink = np.full(rows * cols, NO_LINK, dtype=np.int8)
+    label = np.full(rows * cols, -1, dtype=np.int32) if with_labels else None
+    if targets is not None:
+        targets = [t for t in dict.fromkeys(targets) if grid.passable.flat[t]]
+    if not roots or targets == []:
+        return _result(grid, cost, backlink, label, 0)
+
+    root_pixels = np.fromiter(roots, dtype=np.int64, count=len(roots))
+    if max_radius is None and min_value is None and len(roots) == 1:
+        graph, index = _cached_graph(grid)
+        root = int(index.nodes[root_pixels[0]])
+    else:
+        mask = np.array(grid.passable, dtype=bool)
+        if min_value is not None:
+            # Сравнение в float64, как в поиске без графа
+            mask &= np.asarray(grid.values) >= np.float64(min_value)
+        if max_radius is not None:
+            mask &= _disks(rows, cols, root_pixels, max_radius)
+        mask.flat[root_pixels] = True
+        multi = len(roots) > 1
+        graph, index = grid_graph(grid, mask, root_pixels if multi else ())
+        root = index.size if multi else int(index.nodes[root_pixels[0]])
+
+    stop = None
+    if targets is not None:
+        target_nodes = [int(index.nodes[t]) for t in targets if index.nodes[t] >= 0]
+        if len(target_nodes) == 1:
+            stop = target_nodes[0]
+        elif target_nodes:
+            # Остановка на самой дальней цели, если достижимы все; иначе, как
+            # и поиск без графа, поиск проходит всю область
+            multi_target = nk.distance.MultiTargetDijkstra(graph, root, target_nodes)
+            multi_target.run()
+            distances = multi_target.getDistances()
+            if max(distances) < UNREACHABLE:
+                stop = target_nodes[int(np.argmax(distances))]
+    if stop is None:
+        dijk = nk.distance.Dijkstra(
+            graph, root, storePaths=False, storeNodesSortedByDistance=True
+        )
+    else:
+        dijk = nk.distance.Dijkstra(
+            graph,
+            root,
+            storePaths=False,
+            storeNodesSortedByDistance=True,
+            target=stop,
+        )
+    dijk.run()
+    order = np.asarray(dijk.getNodesSortedByDistance(), dtype=np.int64)
+    distances = np.asarray(dijk.getDistances())
+    if stop is not None and distances[stop] < UNREACHABLE and stop not in order[-1:]:
+        # Цель, на которой поиск остановился, в порядок не попадает
+        order = np.append(order, stop)
+    order = order[order < index.size]
+    dist = distances[order]
+    if max_cost is not None:
+        order = order[dist <= max_cost]
+        dist = dist[dist <= max_cost]
+    pixels = index.pixels[order]
+    cost[pixels] = dist
+
+    rank = np.full(rows * cols, -1, dtype=np.int64)
+    rank[pixels] = np.arange(pixels.size)
+    link = _recover_backlinks(grid, cost, rank, pixels)
+    link[np.isin(pixels, root_pixels)] = NO_LINK
+    backlink[pixels] = link
+
+    if label is not None:
+        offsets = np.array([di * cols + dj for di, dj, _ in DIRECTIONS])
+        parent = np.where(
+            link == NO_LINK,
+            np.arange(pixels.size),
+            rank[pixels - offsets[link]],
+        )
+        # Удвоение указателей: каждый пиксель получает корень своего дерева
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+        root_label = np.full(rows * cols, -1, dtype=np.int32)
+        root_label[root_pixels] = list(roots.values())
+        label[pixels] = root_label[pixels[parent]]
+    return _result(grid, cost, backlink, label, pixels.size)
+
+
+def _recover_backlinks(
+    grid: CostGrid, cost: np.ndarray, rank: np.ndarray, pixels: np.ndarray
+) -> np.ndarray:
+    """Направление от предка для каждого из ``pixels`` (NO_LINK — нет предка)."""
+    rows, cols = grid.rows, grid.cols
+    values = np.asarray(grid.values).ravel()
+    i, j = np.divmod(pixels, cols)
+    own_rank = rank[pixels]
+    own_cost = cost[pixels]
+    own_value = values[pixels]
+    link = np.full(pixels.size, NO_LINK, dtype=np.int8)
+    for k, (di, dj, factor) in enumerate(DIRECTIONS):
+        ui = i - di
+        uj = j - dj
+        ok = (link == NO_LINK) & (ui >= 0) & (ui < rows) & (uj >= 0) & (uj < cols)
+        u = np.where(ok, ui * cols + uj, 0)
+        ok &= (rank[u] >= 0) & (rank[u] < own_rank)
+        weight = edge_weights(grid, values[u], own_value, factor)
+        ok &= cost[u] + weight == own_cost
+        link[ok] = k
+    return link
+
+
+def _radius_window(
+    grid: CostGrid, roots: List[int], max_radius: float
+) -> Optional[Tuple[int, int, int, int]]:
+    """Окно ``(r0, r1, c0, c1)``, вне которого поиск не выйдет, или None,
+    если оно совпадает со всем растром."""
+    i, j = np.divmod(np.asarray(roots, dtype=np.int64), grid.cols)
+    reach = int(math.ceil(max_radius))
+    r0, r1 = max(0, int(i.min()) - reach), min(grid.rows, int(i.max()) + reach + 1)
+    c0, c1 = max(0, int(j.min()) - reach), min(grid.cols, int(j.max()) + reach + 1)
+    if (r0, r1, c0, c1) == (0, grid.rows, 0, grid.cols):
+        return None
+    return r0, r1, c0, c1
+
+
+def _window_tree(
+    grid: CostGrid,
+    window: Tuple[int, int, int, int],
+    roots: Dict[int, int],
+    with_labels: bool,
+    targets: Optional[Iterable[int]],
+    max_cost: Optional[float],
+    max_radius: Optional[float],
+    min_value: Optional[float],
+) -> SearchResult:
+    """Поиск по окну растра с переносом результата на весь растр."""
+    r0, r1, c0, c1 = window
+    cols, sub_cols = grid.cols, c1 - c0
+    sub = CostGrid(
+        values=grid.values[r0:r1, c0:c1],
+        passable=grid.passable[r0:r1, c0:c1],
+        geotransform=grid.geotransform,
+        edge_weight=grid.edge_weight,
+        eps=grid.eps,
+    )
+
+    def to_sub(pixel: int) -> Optional[int]:
+        i, j = divmod(pixel, cols)
+        if r0 <= i < r1 and c0 <= j < c1:
+            return (i - r0) * sub_cols + (j - c0)
+        return None
+
+    if targets is not None:
+        targets = [t for t in map(to_sub, targets) if t is not None]
+    part = _graph_tree(
+        sub,
+        {to_sub(pixel): idx for pixel, idx in roots.items()},
+        with_labels,
+        targets,
+        max_cost,
+        max_radius,
+        min_value,
+    )
+    cost = np.full((grid.rows, cols), np.inf)
+    backlink = np.full((grid.rows, cols), NO_LINK, dtype=np.int8)
+    cost[r0:r1, c0:c1] = part.cost
+    backlink[r0:r1, c0:c1] = part.backlink
+    label = None
+    if part.label is not None:
+        label = np.full((grid.rows, cols), -1, dtype=np.int32)
+        label[r0:r1, c0:c1] = part.label
+    return SearchResult(
+        cost=cost, backlink=backlink, settled=part.settled, label=label
+    )
+
+
+def _disks(rows: int, cols: int, centres: np.ndarray, radius: float) -> np.ndarray:
+    """Пиксели не дальше ``radius`` хотя бы от одного из центров."""
+    ii, jj = np.ogrid[:rows, :cols]
+    mask = np.zeros((rows, cols), dtype=bool)
+    for ci, cj in zip(*np.divmod(centres, cols)):
+        mask |= (ii - ci) ** 2 + (jj - cj) ** 2 <= radius * radius
+    return mask
+
+
+def _result(grid, cost, backlink, label, settled) -> SearchResult:
+    rows, cols = grid.rows, grid.cols
+    return SearchResult(
+        cost=cost.reshape(rows, cols),
+        backlink=backlink.reshape(rows, cols),
+        settled=settled,
+        label=label.reshape(rows, cols) if label is not None else None,
+    )
+
+
+def trace_path(result: SearchResult, node: int) -> List[int]:
+    """Восстанавливает путь от источника до ``node`` по обратным ссылкам."""
+    cols = result.cost.shape[1]
+    if not math.isfinite(result.cost.flat[node]):
+        return []
+    offsets = [di * cols + dj for di, dj, _ in DIRECTIONS]
+    link = memoryview(result.backlink.reshape(-1))
+    path = [node]
+    while link[node] != NO_LINK:
+        node -= offsets[link[node]]
+        path.append(node)
+    path.reverse()
+    return path
+
+
+def edge_weights(
+    grid: CostGrid, hu: np.ndarray, hv: np.ndarray, factor: float
+) -> np.ndarray:
+    """Векторный аналог веса ребра, используемого в shortest_path_tree."""
+    hu = hu.astype(np.float64)
+    hv = hv.astype(np.float64)
+    if grid.edge_weight == MEAN_COST:
+        return factor * (hu + hv) * 0.5
+    return factor * (np.abs(hu - hv) + grid.eps)
+
+
+def path_cost(grid: CostGrid, pixels: Sequence[int]) -> float:
+    """Стоимость пути из соседних пикселей с теми же весами рёбер."""
+    pixels = np.asarray(pixels, dtype=np.int64)
+    if pixels.size < 2:
+        return 0.0
+    i, j = np.divmod(pixels, grid.cols)
+    diagonal = (np.diff(i) != 0) & (np.diff(j) != 0)
+    factor = np.where(diagonal, math.sqrt(2), 1.0)
+    flat = np.asarray(grid.values).ravel()
+    return float(
+        edge_weights(grid, flat[pixels[:-1]], flat[pixels[1:]], factor).sum()
+    )
+
+
+def voronoi_adjacent_pairs(
+    grid: CostGrid, result: SearchResult
+) -> List[Tuple[int, int, int, int]]:
+    """Находит пары соседних областей Вороного и лучшее ребро между ними.
+
+    Возвращает кортежи ``(a, b, u, v)``, где ``a < b`` — номера источников,
+    а ``u`` (область ``a``) и ``v`` (область ``b``) — пиксели граничного ребра
+    с минимальной суммой ``cost[u] + w(u, v) + cost[v]``.
+    """
+    rows, cols = grid.rows, grid.cols
+    ids = np.arange(rows * cols, dtype=np.int64).reshape(rows, cols)
+    n_labels = int(result.label.max()) + 1
+    keys, totals, us, vs = [], [], [], []
+    # Достаточно половины окрестности: вторая даёт те же рёбра в обратную сторону
+    for di, dj, factor in DIRECTIONS[4:]:
+        src_rows = slice(0, rows - di)
+        dst_rows = slice(di, rows)
+        src_cols = slice(max(0, -dj), cols - max(0, dj))
+        dst_cols = slice(max(0, dj), cols - max(0, -dj))
+        la = result.label[src_rows, src_cols]
+        lb = result.label[dst_rows, dst_cols]
+        boundary = (
+            (la >= 0)
+            & (lb >= 0)
+            & (la != lb)
+            & grid.passable[src_rows, src_cols]
+            & grid.passable[dst_rows, dst_cols]
+        )
+        if not boundary.any():
+            continue
+        u = ids[src_rows, src_cols][boundary]
+        v = ids[dst_rows, dst_cols][boundary]
+        la = la[boundary].astype(np.int64)
+        lb = lb[boundary].astype(np.int64)
+        total = (
+            result.cost.flat[u]
+            + edge_weights(grid, grid.values.flat[u], grid.values.flat[v], factor)
+            + result.cost.flat[v]
+        )
+        # Ориентируем ребро так, чтобы u лежал в области с меньшим номером
+        swap = la > lb
+        keys.append(np.minimum(la, lb) * n_labels + np.maximum(la, lb))
+        totals.append(total)
+        us.append(np.where(swap, v, u))
+        vs.append(np.where(swap, u, v))
+
+    if not keys:
+        return []
+    keys = np.concatenate(keys)
+    totals = np.concatenate(totals)
+    us = np.concatenate(us)
+    vs = np.concatenate(vs)
+
+    order = np.lexsort((totals, keys))
+    first = np.ones(order.size, dtype=bool)
+    first[1:] = keys[order[1:]] != keys[order[:-1]]
+    best = order[first]
+    a, b = np.divmod(keys[best], n_labels)
+    return list(
+        zip(a.tolist(), b.tolist(), us[best].tolist(), vs[best].tolist())
+    )
+
+
+def voronoi_pair_paths(
+    grid: CostGrid, terminals: List[int]
+) -> Iterator[Tuple[int, int, List[int]]]:
+    """Пути только между терминалами с соседними областями Вороного.
+
+    Один проход Дейкстры от всех терминалов сразу заменяет отдельное дерево
+    для каждого терминала. Путь пары проходит по деревьям обеих областей и
+    через лучшее граничное ребро, поэтому не может пройти через третий
+    терминал. Выдаются тройки ``(a, b, path)`` в порядке номеров пар.
+    """
+    result = shortest_path_tree(grid, terminals, with_labels=True)
+    for a, b, u, v in voronoi_adjacent_pairs(grid, result):
+        head = trace_path(result, u)
+        tail = trace_path(result, v)
+        tail.reverse()
+        yield a, b, head + tail
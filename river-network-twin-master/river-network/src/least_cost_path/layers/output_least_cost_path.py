@@ -22,6 +22,8 @@ def build_output_least_cost_path(
     fields = QgsFields()
     fields.append(QgsField("start_id", QVariant.Int))
     fields.append(QgsField("end_id", QVariant.Int))
+    # Цепной код пути для точного восстановления пикселей (path_encoding)
+    fields.append(QgsField("chain", QVariant.String))
 
     # Готовим параметры сохранения (SaveVectorOptions)
     options = QgsVectorFileWriter.SaveVectorOptions()
@@ -0,0 +1,43 @@
+from pathlib import Path
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsField,
+    QgsFields,
+    QgsProject,
+    QgsVectorFileWriter,
+    QgsVectorLayer,
+    QgsWkbTypes,
+)
+from qgis.PyQt.QtCore import QVariant
+
+
+def build_output_path_network(
+    network_path: Path,
+    layer_name: str = "Least cost path network",
+    crs_auth_id: str = "EPSG:3857",
+) -> QgsVectorLayer:
+    crs = QgsCoordinateReferenceSystem(crs_auth_id)
+
+    # Число пар, проходящих по участку, и их номера через запятую
+    fields = QgsFields()
+    fields.append(QgsField("usage", QVariant.Int))
+    fields.append(QgsField("pairs", QVariant.String))
+
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = "GPKG"
+    options.fileEncoding = "UTF-8"
+    options.layerName = layer_name
+
+    transform_context = QgsProject.instance().transformContext()
+
+    QgsVectorFileWriter.create(
+        str(network_path),
+        fields,
+        QgsWkbTypes.LineString,
+        crs,
+        transform_context,
+        options,
+    )
+
+    uri = f"{str(network_path)}|layername={layer_name}"
+    return QgsVectorLayer(uri, layer_name, "ogr")
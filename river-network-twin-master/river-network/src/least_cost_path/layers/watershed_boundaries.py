@@ -1,5 +1,7 @@
 from pathlib import Path
-import networkx as nx
+
+import networkit as nk
+import numpy as np
 from qgis.core import (
     QgsFeature,
     QgsField,
@@ -13,27 +15,83 @@ from qgis.core import (
 from qgis.PyQt.QtCore import QVariant
 
 
+def _line_parts(geom):
+    if geom.isEmpty():
+        return []
+    return geom.asMultiPolyline() if geom.isMultipart() else [geom.asPolyline()]
+
+
+def _coordinate_keys(xy: np.ndarray, precision: int) -> np.ndarray:
+    """Целочисленные ключи координат, округлённых до ``precision`` знаков."""
+    return np.round(xy * 10**precision).astype(np.int64)
+
+
 def build_watershed_boundaries(
     lcp_layer,
     watershed_boundaries_path: Path,
     layer_name: str = "watershed_boundaries",
+    precision: int = 3,
 ):
-    # Собираем граф из сегментов линий
-    g = nx.Graph()
-    node_coords = {}
-
-    for feat in lcp_layer.getFeatures():
-        geom = feat.geometry()
-        lines = geom.asMultiPolyline() if geom.isMultipart() else [geom.asPolyline()]
-        for line in lines:
-            for i in range(len(line) - 1):
-                p1, p2 = line[i], line[i + 1]
-                precision = 3  # Можно сделать параметром функции
-                n1 = (round(p1.x(), precision), round(p1.y(), precision))
-                n2 = (round(p2.x(), precision), round(p2.y(), precision))
-                g.add_edge(n1, n2)
-                node_coords[n1] = p1
-                node_coords[n2] = p2
+    """Наибольший простой цикл сети путей для каждой компоненты связности.
+
+    Линии путей один раз разбиваются в точках пересечения (noding), грани
+    разбиения строятся GEOS polygonize, а компонента связности каждой грани
+    определяется по ключам координат её вершин. Грани компоненты
+    сливаются; внешнее кольцо наибольшей части слияния — это наибольший по
+    площади простой цикл, который прежде искался перебором циклов графа.
+    """
+    geoms = [
+        QgsGeometry(feat.geometry())
+        for feat in lcp_layer.getFeatures()
+        if not feat.geometry().isEmpty()
+    ]
+    noded = QgsGeometry.unaryUnion(geoms) if geoms else QgsGeometry()
+
+    # Узлы сети — уникальные округлённые концы отрезков
+    segments = []
+    for line in _line_parts(noded):
+        xy = np.array([(pt.x(), pt.y()) for pt in line], dtype=np.float64)
+        if len(xy) > 1:
+            segments.append(np.hstack([xy[:-1], xy[1:]]))
+    segments = np.vstack(segments) if segments else np.empty((0, 4))
+    keys = _coordinate_keys(segments.reshape(-1, 2), precision)
+    node_keys, node_ids = np.unique(keys, axis=0, return_inverse=True)
+    node_ids = node_ids.reshape(-1, 2).astype(np.int64)
+
+    component = np.empty(0, dtype=np.int64)
+    if len(node_keys):
+        graph = nk.GraphFromCoo(
+            (np.ones(len(node_ids)), (node_ids[:, 0], node_ids[:, 1])),
+            n=len(node_keys),
+            weighted=False,
+            directed=False,
+        )
+        components = nk.components.ConnectedComponents(graph)
+        components.run()
+        component = np.array(components.getPartition().getVector(), dtype=np.int64)
+
+    # Ограниченные грани и компонента, к которой относится каждая из них
+    faces = []
+    if len(node_keys):
+        faces = [
+            face
+            for face in QgsGeometry.polygonize([noded]).asGeometryCollection()
+            if face.type() == QgsWkbTypes.PolygonGeometry and not face.isEmpty()
+        ]
+    first_vertices = np.array(
+        [(face.vertexAt(0).x(), face.vertexAt(0).y()) for face in faces],
+        dtype=np.float64,
+    ).reshape(-1, 2)
+    face_keys = _coordinate_keys(first_vertices, precision)
+    face_nodes = _lookup_keys(node_keys, face_keys)
+
+    faces_by_comp = {}
+    for face_idx, node in enumerate(face_nodes.tolist()):
+        if node >= 0:
+            faces_by_comp.setdefault(int(component[node]), []).append(faces[face_idx])
+    best = {
+        comp: _outer_ring(comp_faces) for comp, comp_faces in faces_by_comp.items()
+    }
 
     fields = QgsFields()
     fields.append(QgsField("comp_id", QVariant.Int))
@@ -61,48 +119,50 @@ def build_watershed_boundaries(
     final_layer.startEditing()
     prov = final_layer.dataProvider()
 
-    comp_id = 0
-    for comp in nx.connected_components(g):
-        # Компонент с < 3 узлами не может содержать полигон
-        if len(comp) < 3:
-            continue
-
-        sub_g = g.subgraph(comp)
-        if not nx.cycle_basis(sub_g):
-            continue
-
-        d = sub_g.to_directed()
-        cycles = list(nx.simple_cycles(d))
-
-        max_area = 0.0
-        best_geom = None
-
-        for cycle in cycles:
-            pts = [node_coords[n] for n in cycle]
-            if len(pts) < 3:
-                continue
-
-            if pts[0] != pts[-1]:
-                pts.append(pts[0])
-
-            poly_geom = QgsGeometry.fromPolygonXY([pts])
-            if not poly_geom.isGeosValid() or poly_geom.isEmpty():
-                continue
-
-            area = poly_geom.area()
-            if area > max_area:
-                max_area = area
-                best_geom = poly_geom
-
-        if best_geom is not None:
-            feat = QgsFeature()
-            feat.setFields(fields)
-            feat.setAttribute("comp_id", comp_id)
-            feat.setGeometry(best_geom)
-            prov.addFeatures([feat])
-            comp_id += 1
+    features = []
+    for comp_id, ring in enumerate(best[comp] for comp in sorted(best)):
+        feat = QgsFeature()
+        feat.setFields(fields)
+        feat.setAttribute("comp_id", comp_id)
+        feat.setGeometry(ring)
+        features.append(feat)
+    prov.addFeatures(features)
 
     final_layer.commitChanges()
     final_layer.updateExtents()
     final_layer.triggerRepaint()
     return final_layer
+
+
+def _outer_ring(faces):
+    """Полигон по внешнему кольцу наибольшей части слияния граней.
+
+    Части, касающиеся друг друга лишь в точке, остаются раздельными, как и
+    блоки графа, которые не может обойти один простой цикл.
+    """
+    merged = QgsGeometry.unaryUnion(faces) if len(faces) > 1 else faces[0]
+    rings = [
+        QgsGeometry.fromPolygonXY([polygon[0]])
+        for polygon in (
+            merged.asMultiPolygon() if merged.isMultipart() else [merged.asPolygon()]
+        )
+        if polygon
+    ]
+    return max(rings, key=lambda ring: ring.area())
+
+
+def _lookup_keys(node_keys: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """Номера строк ``node_keys`` (отсортированы по np.unique) для ``keys``.
+
+    Возвращает -1 для ключей, которых нет среди узлов.
+    """
+    if len(node_keys) == 0 or len(keys) == 0:
+        return np.full(len(keys), -1, dtype=np.int64)
+    # Пара (x, y) упаковывается в одно сравнимое значение структурного типа
+    dtype = np.dtype([("x", np.int64), ("y", np.int64)])
+    packed_nodes = np.ascontiguousarray(node_keys).view(dtype).ravel()
+    packed_keys = np.ascontiguousarray(keys).view(dtype).ravel()
+    pos = np.searchsorted(packed_nodes, packed_keys)
+    pos = np.minimum(pos, len(packed_nodes) - 1)
+    found = packed_nodes[pos] == packed_keys
+    return np.where(found, pos, -1)
@@ -1,33 +1,146 @@
-import math
 import time
 from pathlib import Path
+from typing import Optional
 
 import networkit as nk
+import numpy as np
 from osgeo import gdal
 from qgis.core import (
     QgsCoordinateReferenceSystem,
     QgsCoordinateTransform,
     QgsFeature,
     QgsGeometry,
+    QgsLineString,
     QgsPointXY,
     QgsProject,
     QgsRasterLayer,
-    QgsSpatialIndex,
     QgsVectorFileWriter,
     QgsVectorLayer,
 )
 from qgis.PyQt.QtWidgets import QMessageBox
 from qgis.utils import iface
 
+from src.least_cost_path.cache import CACHE_DIR_NAME, cache_key
+from src.least_cost_path.components import cached_land_components
+from src.least_cost_path.corridor import (
+    cached_pyramid_level,
+    corridor_paths_from_source,
+)
+from src.least_cost_path.grid import (
+    NodeIndex,
+    grid_edges,
+    read_land_mask,
+)
+from src.least_cost_path.grid_search import load_cost_grid, voronoi_pair_paths
 from src.least_cost_path.layers.output_least_cost_path import (
     build_output_least_cost_path,
 )
+from src.least_cost_path.layers.output_path_network import build_output_path_network
+from src.least_cost_path.parallel import DEFAULT_WORKERS, iter_parallel
+from src.least_cost_path.path_encoding import encode_chain, path_vertices
+from src.least_cost_path.path_network import EdgeUsage
+from src.least_cost_path.path_store import (
+    PATH_STORE_NAME,
+    UNCHECKED,
+    PathStore,
+    prune_store,
+    update_surface,
+)
+from src.least_cost_path.snapping import NO_LAND, cached_nearest_land, snap_to_land
+from src.least_cost_path.sssp import (
+    SearchBounds,
+    SearchStats,
+    compare_elevation_floor,
+    paths_from_source,
+)
+from src.least_cost_path.validation import (
+    REJECT_HEIGHT,
+    REJECT_RIVER,
+    PathValidator,
+    RiverIndex,
+    rasterize_rivers,
+    read_elevation,
+)
 from src.least_cost_path.layers.watershed_boundaries import build_watershed_boundaries
 from src.progress_manager import ProgressManager
 from src.river.layers.water_rasterized import build_water_rasterized
 
-
-def least_cost_path_analysis(project_folder: Path) -> None:
+# ========== НАСТРОЙКА ПАРАМЕТРОВ ПОИСКА ПУТЕЙ ==========
+# "graph" — граф networkit в памяти, "grid" — поиск прямо по растру без
+# графа (O(пикселей) памяти, подходит для DEM без укрупнения, но поиск на
+# Python примерно в 10 раз медленнее), "corridor" — поиск на грубом уровне и
+# уточнение в коридоре на исходном разрешении DEM
+PATH_ENGINE = "graph"
+# "all" — дерево кратчайших путей от каждой точки ко всем последующим,
+# "voronoi" — один общий проход и пути только между соседними областями
+PAIR_MODE = "all"
+POOLING_FACTOR = 4  # Во сколько раз укрупняются пиксели DEM (1 — без укрупнения)
+PATH_WORKERS = DEFAULT_WORKERS  # Число потоков для расчета деревьев путей
+MAX_PATH_COST = None  # Предельная стоимость пути (None — без ограничения)
+MAX_PATH_RADIUS = None  # Предельное расстояние между точками пары, м
+CORRIDOR_FACTOR = 4  # Укрупнение грубого уровня в режиме "corridor"
+CORRIDOR_WIDTH = 8  # Полуширина коридора в пикселях исходного DEM
+PATH_WRITE_BATCH = 10000  # Сколько путей записывается в GPKG за один вызов
+# Допустимое понижение пути ниже меньшей из высот его концов, м
+ELEVATION_TOLERANCE = 15.0
+# Не раскрывать при поиске (растровый движок) пиксели ниже границы пары —
+# меньшей из высот концов минус допуск. Пути ищутся от нижнего конца пары.
+# Пара, кратчайший путь которой уходит ниже границы, получает кратчайший
+# путь над ней вместо удаления фильтром, а если такого нет — пропускается
+CONSTRAIN_ELEVATION = False
+# На скольких первых источниках сравнивать поиск с ограничением высоты и
+# без него, чтобы напечатать экономию (0 — не сравнивать)
+FLOOR_REPORT_SOURCES = 3
+SNAP_DISTANCE = 2  # Наибольшее расстояние привязки точек к суше, пикселей
+# Строгая проверка рек по растру: путь отклоняется при пересечении любой
+# реки (в том числе по диагонали между её пикселями), кроме рек в пределах
+# ENDPOINT_RADIUS от концов; реки перепроецируются в EPSG:3857. False —
+# прежнее правило фильтра слоя путей: линия каждого пути сравнивается
+# средствами GEOS с неперепроецированными реками, проверяется только
+# первая пересечённая река
+STRICT_RIVER_CHECK = True
+# При изменении DEM или маски воды пересчитывать только пути, которые могли
+# измениться: проходящие рядом с изменёнными пикселями (запас CHANGE_MARGIN
+# пикселей), а если правка удешевила рёбра — и те, что дороже нижней оценки
+# пути через изменения. Не применяется к движку "corridor"
+INCREMENTAL_UPDATE = True
+CHANGE_MARGIN = 2
+# Допуск упрощения линий путей Дугласом — Пекером в долях пикселя (0 — только
+# слияние прямолинейных участков, геометрия не меняется). При допуске не
+# больше половины пикселя линия не отходит от центров своих пикселей дальше
+# чем на полпикселя, а "лесенки" диагональных участков спрямляются. Но
+# упрощённые пути перестают проходить через общие вершины пикселей, и
+# unaryUnion в build_watershed_boundaries строит по ним лишние грани,
+# поэтому упрощение включается только явно
+PATH_SIMPLIFY_TOLERANCE = 0.0
+# Записывать вместо линии на каждую пару сеть без повторяющихся участков
+# с числом использующих участок пар
+NETWORK_OUTPUT = False
+
+
+# ============================================================
+
+
+def least_cost_path_analysis(
+    project_folder: Path,
+    engine: str = PATH_ENGINE,
+    pooling_factor: int = POOLING_FACTOR,
+    pair_mode: str = PAIR_MODE,
+    workers: int = PATH_WORKERS,
+    max_path_cost: Optional[float] = MAX_PATH_COST,
+    max_path_radius: Optional[float] = MAX_PATH_RADIUS,
+    corridor_factor: int = CORRIDOR_FACTOR,
+    corridor_width: int = CORRIDOR_WIDTH,
+    elevation_tolerance: float = ELEVATION_TOLERANCE,
+    constrain_elevation: bool = CONSTRAIN_ELEVATION,
+    floor_report_sources: int = FLOOR_REPORT_SOURCES,
+    snap_distance: float = SNAP_DISTANCE,
+    strict_river_check: bool = STRICT_RIVER_CHECK,
+    incremental_update: bool = INCREMENTAL_UPDATE,
+    change_margin: int = CHANGE_MARGIN,
+    simplify_tolerance: float = PATH_SIMPLIFY_TOLERANCE,
+    network_output: bool = NETWORK_OUTPUT,
+) -> None:
     # Инициализация прогресса
     progress = ProgressManager(
         title="Анализ оптимальных путей", label="Инициализация..."
@@ -37,6 +150,9 @@ def least_cost_path_analysis(project_folder: Path) -> None:
     # Переменные для хранения сообщений
     height_message = None
     rivers_message = None
+    bounds_message = None
+    components_message = None
+    path_store = None
 
     try:
         # Получение необходимых слоев
@@ -49,6 +165,12 @@ def least_cost_path_analysis(project_folder: Path) -> None:
             QMessageBox.warning(None, "Ошибка", "Слой 'MaxHeightPoints' не найден.")
             return
 
+        try:
+            rivers_layer = QgsProject.instance().mapLayersByName("rivers_and_points")[0]
+        except IndexError:
+            QMessageBox.warning(None, "Ошибка", "Слой 'rivers_and_points' не найден.")
+            return
+
         src_crs = points_layer.crs()
         tgt_crs = QgsCoordinateReferenceSystem("EPSG:3857")
         transform_context = QgsProject.instance().transformContext()
@@ -80,8 +202,8 @@ def least_cost_path_analysis(project_folder: Path) -> None:
         gdal.Warp(
             destNameOrDestDS=str(dem_pooled),
             srcDSOrSrcDSTab=str(dem_3857),
-            xRes=orig_xres * 4,
-            yRes=orig_yres * 4,
+            xRes=orig_xres * pooling_factor,
+            yRes=orig_yres * pooling_factor,
             resampleAlg="average",
             format="GTiff",
         )
@@ -113,46 +235,86 @@ def least_cost_path_analysis(project_folder: Path) -> None:
             )
             return
 
+        path_dem, path_water = Path(cost_layer.source()), water_rasterized
+        if engine == "corridor":
+            # Пути уточняются на исходном разрешении DEM, поэтому нужна
+            # маска воды того же разрешения
+            path_dem = dem_3857
+            path_water = build_water_rasterized(
+                project_folder / "merge_result.gpkg",
+                Path(QgsProject.instance().mapLayersByName("water")[0].source()),
+                dem_3857,
+                project_folder / "water_rasterized_full.tif",
+                0.001,
+            )
+
         t_paths_start = time.perf_counter()
 
-        # строим граф из cost_layer
-        g, gt, n_rows, n_cols = build_cost_graph(
-            Path(cost_layer.source()), water_rasterized
+        # строим граф из cost_layer (или загружаем растр для поиска без графа)
+        g = node_index = cost_grid = coarse_grid = None
+        # Ограничение высоты и разбиение Вороного требуют растра стоимости;
+        # поиск по нему, кроме движка "grid", идёт той же Дейкстрой networkit
+        use_grid = (
+            engine in ("grid", "corridor")
+            or pair_mode == "voronoi"
+            or constrain_elevation
         )
+        if use_grid:
+            cost_grid = load_cost_grid(path_dem, path_water)
+            cost_grid.implicit_search = engine == "grid"
+            gt, n_rows, n_cols = cost_grid.geotransform, cost_grid.rows, cost_grid.cols
+            if engine == "corridor":
+                coarse_grid = cached_pyramid_level(
+                    cost_grid, path_dem, path_water, corridor_factor
+                )
+        else:
+            g, gt, n_rows, n_cols, node_index = build_cost_graph(
+                path_dem, path_water
+            )
 
-        fid_to_node = {}
-        terminal_nodes_set = set()
-        ds_water = gdal.Open(water_rasterized)
-        arr_water = ds_water.GetRasterBand(1).ReadAsArray().astype(float)
-        nodata_water = ds_water.GetRasterBand(1).GetNoDataValue()
-        if nodata_water is not None:
-            arr_water[arr_water == nodata_water] = 0
-        sources_layer = QgsVectorLayer("Point?crs=EPSG:3857", "Moved sources", "memory")
-        sources_provider = sources_layer.dataProvider()
+        # Точки привязываются к ближайшей суше одной выборкой из
+        # преобразования расстояний, которое кэшируется вместе с маской воды
+        land = (
+            cost_grid.passable
+            if cost_grid is not None
+            else (node_index.nodes >= 0).reshape(n_rows, n_cols)
+        )
+        nearest = cached_nearest_land(path_water, snap_distance, land)
+        fids, xs, ys = [], [], []
         for feat in points_layer.getFeatures():
-            z = feat["z"]
-            if z is None:
+            if feat["z"] is None:
                 continue
+            pt3857 = coord_transform.transform(feat.geometry().asPoint())
+            fids.append(feat.id())
+            xs.append(pt3857.x())
+            ys.append(pt3857.y())
+        snapped = snap_to_land(nearest, gt, xs, ys)
 
-            pt = feat.geometry().asPoint()
-            pt3857 = coord_transform.transform(pt)
-
-            i, j = nearest_land(
-                pt3857.x(), pt3857.y(), gt, n_rows, n_cols, arr_water, 2
-            )
-            if i == -1 or j == -1:
+        fid_to_node = {}
+        node_to_fid = {}
+        terminal_nodes_set = set()
+        sources_layer = QgsVectorLayer("Point?crs=EPSG:3857", "Moved sources", "memory")
+        moved = []
+        for fid, node_idx in zip(fids, snapped.tolist()):
+            if node_idx == NO_LAND:
                 continue
-            node_idx = i * n_cols + j
-
             feature = QgsFeature()
+            i, j = divmod(node_idx, n_cols)
             point = QgsPointXY(*pixel_to_coord(i, j, gt))
             feature.setGeometry(QgsGeometry.fromPointXY(point))
-            sources_provider.addFeature(feature)
+            moved.append(feature)
 
-            fid_to_node[feat.id()] = node_idx
+            fid_to_node[fid] = node_idx
+            node_to_fid.setdefault(node_idx, fid)
             terminal_nodes_set.add(node_idx)
+        sources_layer.dataProvider().addFeatures(moved)
+        if len(moved) < len(fids):
+            print(
+                f"Не привязано к суше {len(fids) - len(moved)} точек из {len(fids)}",
+                flush=True,
+            )
 
-        terminal_nodes = list(terminal_nodes_set)
+        terminal_nodes = sorted(terminal_nodes_set)
 
         sources_layer.updateExtents()
         options = QgsVectorFileWriter.SaveVectorOptions()
@@ -166,178 +328,263 @@ def least_cost_path_analysis(project_folder: Path) -> None:
             str(project_folder / "moved_sources.gpkg"), "Moved sources", "ogr"
         )
         QgsProject.instance().addMapLayer(sources_layer)
-        arr_water = None
 
         lcp_layer_path = Path(project_folder) / "output_least_cost_path.gpkg"
-        lcp_layer = build_output_least_cost_path(lcp_layer_path)
-
-        if not progress.update(50, "Расчет оптимальных путей..."):
-            return
-
-        dp = lcp_layer.dataProvider()
-        total_pairs = len(terminal_nodes) * (len(terminal_nodes) - 1)
-        processed_pairs = 0
-
-        for i in range(len(terminal_nodes)):
-            src_node = terminal_nodes[i]
-            if progress.was_canceled():
-                return
-
-            progress.update(
-                50 + int(20 * i / len(terminal_nodes)),
-                f"Расчет путей из точки {i + 1}/{len(terminal_nodes)}",
+        if network_output:
+            lcp_layer = build_output_path_network(
+                Path(project_folder) / "output_least_cost_path_network.gpkg"
             )
-
-            src_node = terminal_nodes[i]
-            dijk = nk.distance.Dijkstra(g, src_node)
-            dijk.run()
-
-            for dst in terminal_nodes[i + 1 :]:
-                processed_pairs += 1
-                if processed_pairs % 10 == 0:
-                    progress.update(
-                        50 + int(20 * processed_pairs / total_pairs),
-                        f"Обработано {processed_pairs}/{total_pairs} пар",
-                    )
-                    if progress.was_canceled():
-                        return
-
-                node_path = dijk.getPath(dst)
-                if not node_path:
-                    continue
-
-                # Конвертируем узлы в координаты
-                path_pts = []
-                for u in node_path:
-                    if u != node_path[0] and u != node_path[-1]:
-                        if u in terminal_nodes_set:
-                            break
-                    path_pts.append(
-                        QgsPointXY(*pixel_to_coord(u // n_cols, u % n_cols, gt))
-                    )
-                else:
-                    feat_out = QgsFeature(lcp_layer.fields())
-                    feat_out.setGeometry(QgsGeometry.fromPolylineXY(path_pts))
-                    dp.addFeature(feat_out)
-
-        lcp_layer.updateExtents()
-        QgsProject.instance().addMapLayer(lcp_layer)
-        print("Создан слой с путями", flush=True)
-
-        t_paths_end = time.perf_counter()
-        print(
-            f"Для построения слоя с путями потребовалось: {t_paths_end - t_paths_start:.3f} s",
-            flush=True,
+        else:
+            lcp_layer = build_output_least_cost_path(lcp_layer_path)
+
+        # Пути проверяются по высоте и рекам до записи в слой
+        validator = PathValidator(
+            cols=n_cols,
+            gt=gt,
+            elevation=read_elevation(dem_pooled),
+            elevation_gt=gdal.Open(str(dem_pooled)).GetGeoTransform(),
+            max_drop=elevation_tolerance,
+            rivers=None if strict_river_check else RiverIndex(rivers_layer),
+            river_ids=(
+                rasterize_rivers(
+                    rivers_layer,
+                    QgsCoordinateTransform(
+                        rivers_layer.crs(), tgt_crs, transform_context
+                    ),
+                    gt,
+                    n_rows,
+                    n_cols,
+                )
+                if strict_river_check
+                else None
+            ),
         )
 
-        if not progress.update(75, "Фильтрация путей по высоте..."):
+        if not progress.update(50, "Расчет оптимальных путей..."):
             return
 
-        elevation_layer = QgsRasterLayer(
-            str(dem_pooled), "SRTM DEM Layer Pooled (3857)"
+        bounds = SearchBounds(
+            max_cost=max_path_cost,
+            max_radius=max_path_radius / abs(gt[1]) if max_path_radius else None,
+            max_drop=elevation_tolerance if constrain_elevation else None,
         )
-
-        # Фильтрация путей по критерию разницы высот
-        paths_to_delete = []
-        features = list(lcp_layer.getFeatures())
-        total_features = len(features)
-
-        for idx, feature in enumerate(features):
-            if progress.was_canceled():
-                break
-
-            progress.update(
-                75 + int(10 * idx / total_features),
-                f"Фильтрация по высоте {idx + 1}/{total_features}",
+        search_stats = SearchStats()
+
+        # Найденные пути сохраняются по поверхности стоимости и паре концов;
+        # результат проверки — вместе с ключом DEM, допуска и рек
+        search_params = dict(
+            engine=engine,
+            max_cost=bounds.max_cost,
+            max_radius=bounds.max_radius,
+            max_drop=bounds.max_drop,
+            corridor=(corridor_factor, corridor_width) if engine == "corridor" else None,
+        )
+        cache_dir = Path(path_dem).parent / CACHE_DIR_NAME
+        path_store = PathStore(
+            cache_dir / PATH_STORE_NAME,
+            surface=cache_key(path_dem, path_water, kind="paths", **search_params),
+            checks=cache_key(
+                dem_pooled,
+                kind="checks",
+                max_drop=elevation_tolerance,
+                rivers=validator.rivers_key(),
+            ),
+        )
+        lineage = cache_key(
+            kind="lineage",
+            dem=Path(path_dem).resolve(),
+            water=Path(path_water).resolve(),
+            **search_params,
+        )
+        # Пути коридорного поиска приближённые, и перенос не может доказать,
+        # что они совпали бы с новым поиском
+        if incremental_update and engine != "corridor":
+            # Поверхность тех же файлов до правки DEM или маски воды: её пути,
+            # заведомо оставшиеся кратчайшими, переносятся без пересчёта
+            values = (
+                cost_grid.values
+                if cost_grid is not None
+                else gdal.Open(str(path_dem)).GetRasterBand(1).ReadAsArray()
             )
-
-            geom = feature.geometry()
-            min_elev = calculate_minimum_elevation(elevation_layer, geom)
-            if min_elev is None:
-                continue
-
-            polyline = (
-                geom.asMultiPolyline()[0] if geom.isMultipart() else geom.asPolyline()
+            update_surface(
+                path_store, lineage, cache_dir, values, land, change_margin
+            )
+        else:
+            path_store.remember_surface(lineage)
+        # Пути поверхностей, заменённых новыми для тех же файлов, больше не
+        # понадобятся
+        prune_store(path_store, cache_dir)
+
+        def paths_from(src_node, targets):
+            if coarse_grid is not None:
+                return corridor_paths_from_source(
+                    cost_grid,
+                    coarse_grid,
+                    corridor_factor,
+                    src_node,
+                    targets,
+                    corridor_width,
+                    bounds,
+                    search_stats,
+                )
+            return paths_from_source(
+                src_node,
+                targets,
+                n_cols,
+                graph=g,
+                grid=cost_grid,
+                bounds=bounds,
+                index=node_index,
+                stats=search_stats,
             )
-            if not polyline:
-                continue
 
-            first_point = polyline[0]
-            last_point = polyline[-1]
-            sample_start = elevation_layer.dataProvider().sample(
-                QgsPointXY(first_point.x(), first_point.y()), 1
+        # Пути через другие точки отбрасываются до проверки по высоте и рекам
+        terminal_mask = np.zeros(n_rows * n_cols, dtype=bool)
+        terminal_mask[terminal_nodes] = True
+
+        floor_sample = []
+        if pair_mode == "voronoi":
+            progress.update(50, "Разбиение на области ближайших точек...")
+            pair_paths = _checked_pairs(
+                (
+                    (terminal_nodes[a], terminal_nodes[b], node_path)
+                    for a, b, node_path in voronoi_pair_paths(cost_grid, terminal_nodes)
+                ),
+                validator,
+                terminal_mask,
             )
-            sample_end = elevation_layer.dataProvider().sample(
-                QgsPointXY(last_point.x(), last_point.y()), 1
+        else:
+            # Пары с разных участков суши отбрасываются до поиска путей
+            terminal_components = np.asarray(
+                cached_land_components(path_water, land)
+            ).ravel()[terminal_nodes]
+            sizes = np.bincount(terminal_components)
+            n_terminals = len(terminal_nodes)
+            cross_pairs = n_terminals * (n_terminals - 1) // 2 - int(
+                (sizes * (sizes - 1) // 2).sum()
+            )
+            lonely = int((sizes[terminal_components] == 1).sum())
+            if cross_pairs:
+                components_message = (
+                    f"Пропущено {cross_pairs} пар точек на несвязанных участках "
+                    f"суши; от {lonely} точек, единственных на своём участке, "
+                    "пути не искались."
+                )
+                print(components_message, flush=True)
+            pair_terminals, pair_components = terminal_nodes, terminal_components
+            if constrain_elevation:
+                # Путь пары ищется от нижнего конца: граница пары — высота
+                # источника минус допуск, и на источник приходится один поиск
+                order = np.lexsort(
+                    (terminal_nodes, cost_grid.values.flat[terminal_nodes])
+                )
+                pair_terminals = [terminal_nodes[k] for k in order]
+                pair_components = terminal_components[order]
+                if coarse_grid is None:
+                    floor_sample = _first_sources(
+                        pair_terminals, pair_components, floor_report_sources
+                    )
+            pair_paths = _all_pair_paths(
+                pair_terminals,
+                paths_from,
+                progress,
+                workers,
+                validator,
+                path_store,
+                pair_components,
+                terminal_mask,
             )
-            if sample_start and sample_end:
-                z_start, valid_start = sample_start
-                z_end, valid_end = sample_end
-                if not (valid_start and valid_end):
-                    continue
-
-                z1 = min(z_start, z_end)
-                if min_elev < z1 - 15:
-                    paths_to_delete.append(feature.id())
-
-        if paths_to_delete:
-            lcp_layer.startEditing()
-            for fid in paths_to_delete:
-                lcp_layer.deleteFeature(fid)
-            lcp_layer.commitChanges()
-            height_message = f"Удалено {len(paths_to_delete)} путей по критерию высоты."
-
-        if not progress.update(90, "Фильтрация путей по рекам..."):
-            return
 
-        try:
-            rivers_layer = QgsProject.instance().mapLayersByName("rivers_and_points")[0]
-        except IndexError:
-            QMessageBox.warning(None, "Ошибка", "Слой 'rivers_and_points' не найден.")
-            return
+        dp = lcp_layer.dataProvider()
+        fields = lcp_layer.fields()
+
+        rejected = {REJECT_HEIGHT: 0, REJECT_RIVER: 0}
+        skipped_pairs = 0
+        network = EdgeUsage() if network_output else None
+        # Допуск упрощения задан в пикселях, path_vertices ждёт единицы СК
+        tolerance = simplify_tolerance * abs(gt[1])
+        batch = []
+        for src, dst, pixels, reason in pair_paths:
+            if not len(pixels):
+                skipped_pairs += 1
+                continue
 
-        spatial_index = QgsSpatialIndex(rivers_layer.getFeatures())
-        paths_to_delete = []
-        features = list(lcp_layer.getFeatures())
-        total_features = len(features)
+            # Пути, проходящие через другую точку, не сохраняются
+            if _through_terminal(pixels, terminal_mask):
+                continue
+            if reason is not None:
+                rejected[reason] += 1
+                continue
 
-        for idx, feature in enumerate(features):
-            if progress.was_canceled():
-                break
+            start_id, end_id = node_to_fid[src], node_to_fid[dst]
+            if network is not None:
+                network.add(pixels, f"{start_id}-{end_id}")
+                continue
 
-            progress.update(
-                90 + int(5 * idx / total_features),
-                f"Фильтрация по рекам {idx + 1}/{total_features}",
+            xs, ys = path_vertices(pixels, n_cols, gt, tolerance)
+            feat_out = QgsFeature(fields)
+            feat_out.setAttribute("start_id", start_id)
+            feat_out.setAttribute("end_id", end_id)
+            feat_out.setAttribute("chain", encode_chain(pixels, n_cols))
+            feat_out.setGeometry(QgsGeometry(QgsLineString(xs.tolist(), ys.tolist())))
+            batch.append(feat_out)
+            # Провайдер OGR записывает каждый вызов addFeatures одной транзакцией
+            if len(batch) >= PATH_WRITE_BATCH:
+                dp.addFeatures(batch)
+                batch = []
+
+        if network is not None:
+            # Общие участки путей записываются один раз
+            for segment, usage, labels in network.segments():
+                xs, ys = path_vertices(segment, n_cols, gt, tolerance)
+                feat_out = QgsFeature(fields)
+                feat_out.setAttribute("usage", usage)
+                feat_out.setAttribute("pairs", ",".join(labels))
+                feat_out.setGeometry(
+                    QgsGeometry(QgsLineString(xs.tolist(), ys.tolist()))
+                )
+                batch.append(feat_out)
+                if len(batch) >= PATH_WRITE_BATCH:
+                    dp.addFeatures(batch)
+                    batch = []
+        if batch:
+            dp.addFeatures(batch)
+
+        if progress.was_canceled():
+            return
+        if bounds and skipped_pairs:
+            bounds_message = (
+                f"Пропущено {skipped_pairs} пар точек: недостижимы или "
+                "выходят за ограничения стоимости/радиуса/высоты."
+            )
+        if constrain_elevation:
+            counters = f"найдено {search_stats.settled} пикселей"
+            if cost_grid.implicit_search:
+                counters += (
+                    f", {search_stats.relaxed} релаксаций, отсечено "
+                    f"{search_stats.pruned} переходов в низины"
+                )
+            print(f"Ограничение высоты при поиске: {counters}", flush=True)
+            if floor_sample:
+                compare_elevation_floor(cost_grid, floor_sample, bounds)
+        if rejected[REJECT_HEIGHT]:
+            height_message = (
+                f"Удалено {rejected[REJECT_HEIGHT]} путей по критерию высоты."
+            )
+        if rejected[REJECT_RIVER]:
+            rivers_message = (
+                f"Удалено {rejected[REJECT_RIVER]} путей, пересекающих реки."
             )
 
-            geom = feature.geometry()
-            if geom.isEmpty():
-                continue
-
-            pts = geom.asPolyline()
-            if not pts:
-                continue
+        lcp_layer.updateExtents()
+        QgsProject.instance().addMapLayer(lcp_layer)
+        print("Создан слой с путями", flush=True)
 
-            start_geom = QgsGeometry.fromPointXY(pts[0])
-            end_geom = QgsGeometry.fromPointXY(pts[-1])
-
-            candidate_ids = spatial_index.intersects(geom.boundingBox())
-            for cid in candidate_ids:
-                candidate = rivers_layer.getFeature(cid)
-                if geom.intersects(candidate.geometry()):
-                    if not (
-                        start_geom.intersects(candidate.geometry())
-                        or end_geom.intersects(candidate.geometry())
-                    ):
-                        paths_to_delete.append(feature.id())
-                    break
-
-        if paths_to_delete:
-            lcp_layer.startEditing()
-            for fid in paths_to_delete:
-                lcp_layer.deleteFeature(fid)
-            lcp_layer.commitChanges()
-            rivers_message = f"Удалено {len(paths_to_delete)} путей, пересекающих реки."
+        t_paths_end = time.perf_counter()
+        print(
+            f"Для построения слоя с путями потребовалось: {t_paths_end - t_paths_start:.3f} s",
+            flush=True,
+        )
 
         watershed_boundaries_path = Path(project_folder) / "watershed_boundaries.gpkg"
         progress.finish()
@@ -345,8 +592,7 @@ def least_cost_path_analysis(project_folder: Path) -> None:
         reply = QMessageBox.question(
             iface.mainWindow(),
             "Построить слой водоразделов?",
-            "Хотите построить слой замкнутых путей наибольших по площади?\n"
-            "ВНИМАНИЕ: обработка может занять очень много времени!",
+            "Хотите построить слой замкнутых путей наибольших по площади?",
             QMessageBox.Yes | QMessageBox.No,
             QMessageBox.No,
         )
@@ -360,54 +606,145 @@ def least_cost_path_analysis(project_folder: Path) -> None:
 
         return
     finally:
+        if path_store is not None:
+            path_store.close()
         progress.finish()
 
         # Показываем сообщения после закрытия прогресса
+        if components_message:
+            QMessageBox.information(None, "Информация", components_message)
+        if bounds_message:
+            QMessageBox.information(None, "Информация", bounds_message)
         if height_message:
             QMessageBox.information(None, "Информация", height_message)
         if rivers_message:
             QMessageBox.information(None, "Информация", rivers_message)
 
 
+def _all_pair_paths(
+    terminal_nodes,
+    paths_from,
+    progress,
+    workers,
+    validator,
+    store,
+    components,
+    terminal_mask,
+):
+    """Перебирает пути между всеми парами точек, строя дерево от каждой.
+
+    Перебираются только пары с одного участка суши (``components`` — номер
+    участка каждой точки); точка без пары на своём участке не обрабатывается.
+    Путь пары ищется от точки, стоящей в ``terminal_nodes`` раньше.
+    Пары, уже сохранённые в ``store``, читаются с диска; дерево строится
+    только до точек, пути к которым ещё не искались. Деревья строятся
+    параллельно в ``workers`` потоках; каждый поток сразу извлекает пути и
+    освобождает дерево. Выдаются ``(src, dst, pixels, reason)``, где
+    ``reason`` — причина отклонения пути проверкой (None — путь принят).
+    Пути через другие точки (``terminal_mask``) не записываются в слой и не
+    проверяются.
+    """
+    known = store.known_pairs(terminal_nodes)
+    components = np.asarray(components)
+    partners = [
+        [terminal_nodes[k] for k in i + 1 + np.flatnonzero(components[i + 1 :] == comp)]
+        for i, comp in enumerate(components.tolist())
+    ]
+
+    def solve(i):
+        src = terminal_nodes[i]
+        targets = [
+            dst for dst in partners[i] if (min(src, dst), max(src, dst)) not in known
+        ]
+        if not targets:
+            return {}
+        return dict(zip(targets, paths_from(src, targets)))
+
+    n_terminals = len(terminal_nodes)
+    solved_pairs = 0
+    for i, _, solved in iter_parallel(
+        solve, range(n_terminals), workers, progress.poll_canceled
+    ):
+        progress.update(
+            50 + int(20 * (i + 1) / n_terminals),
+            f"Расчет путей из точки {i + 1}/{n_terminals}",
+        )
+        src = terminal_nodes[i]
+        for dst in partners[i]:
+            if dst in solved:
+                pixels = np.asarray(solved[dst], dtype=np.int64)
+                reason = UNCHECKED
+                solved_pairs += 1
+            else:
+                pixels, reason = store.get(src, dst)
+            if reason == UNCHECKED:
+                if not _through_terminal(pixels, terminal_mask):
+                    reason = validator.reject_reason(pixels) if len(pixels) else None
+                store.put(src, dst, pixels, reason)
+            yield src, dst, pixels, reason
+        store.flush()
+
+    print(
+        f"Пути: рассчитано {solved_pairs} пар, из хранилища {len(known)}",
+        flush=True,
+    )
+
+
+def _first_sources(terminal_nodes, components, count):
+    """Первые ``count`` точек с парами на своём участке и их цели."""
+    components = np.asarray(components)
+    sample = []
+    for i, comp in enumerate(components.tolist()):
+        if len(sample) >= count:
+            break
+        later = i + 1 + np.flatnonzero(components[i + 1 :] == comp)
+        if len(later):
+            sample.append((terminal_nodes[i], [terminal_nodes[k] for k in later]))
+    return sample
+
+
+def _through_terminal(pixels, terminal_mask) -> bool:
+    """Путь проходит через другую точку (не считая своих концов)."""
+    return bool(terminal_mask[pixels[1:-1]].any())
+
+
+def _checked_pairs(pair_paths, validator, terminal_mask):
+    """Добавляет к путям ``(a, b, path)`` результат проверки.
+
+    Пути через другие точки не проверяются: они не записываются в слой.
+    """
+    for a, b, node_path in pair_paths:
+        pixels = np.asarray(node_path, dtype=np.int64)
+        reason = None
+        if len(pixels) and not _through_terminal(pixels, terminal_mask):
+            reason = validator.reject_reason(pixels)
+        yield a, b, pixels, reason
+
+
 def build_cost_graph(raster_path: Path, water_layer, eps=1e-6):
+    """Граф стоимости по пикселям суши с весом ``factor * (|dh| + eps)``.
+
+    Возвращает граф, геопривязку, размеры растра и нумерацию узлов
+    (NodeIndex), как и underground.network.build_cost_graph.
+    """
     ds_cost = gdal.Open(str(raster_path))
     arr = ds_cost.GetRasterBand(1).ReadAsArray().astype(float)
-    ds_water = gdal.Open(water_layer)
-    arr_water = ds_water.GetRasterBand(1).ReadAsArray().astype(float)
-    nodata_water = ds_water.GetRasterBand(1).GetNoDataValue()
-    if nodata_water is not None:
-        arr_water[arr_water == nodata_water] = 0
+    passable = read_land_mask(water_layer)
     rows, cols = arr.shape
-    g = nk.Graph(rows * cols, weighted=True, directed=False)
-
-    # 4 направления от вниз-влево до вправо
-    neigh = [
-        (1, 0, 1.0),  # вниз
-        (0, 1, 1.0),  # вправо
-        (1, -1, math.sqrt(2)),
-        (1, 1, math.sqrt(2)),
-    ]
 
-    def nid(i, j):
-        return i * cols + j
+    # Узлы графа — только пиксели суши; вода в граф не попадает
+    index = NodeIndex.from_mask(passable)
 
-    for i in range(rows):
-        for j in range(cols):
-            u = nid(i, j)
-            hu = arr[i, j]
-            if arr_water[i, j] != 0:
-                continue
-            for di, dj, factor in neigh:
-                ni, nj = i + di, j + dj
-                if 0 <= ni < rows and 0 <= nj < cols:
-                    hv = arr[ni, nj]
-                    dh = abs(hu - hv)
-                    w = factor * (dh + eps)
-                    if arr_water[ni, nj] == 0:
-                        g.addEdge(u, nid(ni, nj), w)
+    # Рёбра и веса считаются массивами и передаются в networkit одним вызовом
+    u, v, factor = grid_edges(passable, index)
+    flat = arr.ravel()[index.pixels]
+    weights = factor * (np.abs(flat[u] - flat[v]) + eps)
+    g = nk.GraphFromCoo(
+        (weights, (u, v)), n=index.size, weighted=True, directed=False
+    )
 
     gt = ds_cost.GetGeoTransform()
-    return g, gt, rows, cols
+    return g, gt, rows, cols, index
 
 
 def coord_to_pixel(x, y, gt):
@@ -441,29 +778,3 @@ def calculate_minimum_elevation(raster_layer, line_geom):
                 if valid and value is not None:
                     min_elev = min(min_elev, value)
     return min_elev if min_elev != float("inf") else None
-
-
-def nearest_land(x, y, gt, n_rows, n_cols, water, radius):
-    i, j = coord_to_pixel(x, y, gt)
-    if not 0 <= i < n_rows or not 0 <= j < n_cols:
-        print(f"({i}, {j})", flush=True)
-        return -1, -1
-
-    row_start = max(0, i - radius)
-    row_end = min(i + radius + 1, n_rows)
-    col_start = max(0, j - radius)
-    col_end = min(j + radius + 1, n_cols)
-
-    nearest_point = (i, j)
-    min_squared_distance = -1
-
-    for row in range(row_start, row_end):
-        for col in range(col_start, col_end):
-            if water[row, col] == 0:
-                coord_x, coord_y = pixel_to_coord(row, col, gt)
-                dist = (x - coord_x) ** 2 + (y - coord_y) ** 2
-                if min_squared_distance > dist or min_squared_distance == -1:
-                    nearest_point = (row, col)
-                    min_squared_distance = dist
-
-    return nearest_point
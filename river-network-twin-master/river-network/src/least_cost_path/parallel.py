@@ -0,0 +1,76 @@
+"""Параллельный расчёт деревьев кратчайших путей в пуле потоков.
+
+Потоки используют один и тот же граф (или растр) только для чтения, а
+результаты возвращаются в главный поток, который остаётся единственным
+писателем в GeoPackage. Реальное ускорение даёт движок networkit: его
+``Dijkstra.run`` выполняется без GIL.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+
+
+def iter_parallel(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    workers: int = DEFAULT_WORKERS,
+    is_canceled: Optional[Callable[[], bool]] = None,
+    poll_interval: float = 0.1,
+) -> Iterator[Tuple[int, T, R]]:
+    """Выполняет ``func`` для каждого элемента и выдаёт ``(index, item, result)``.
+
+    Результаты выдаются строго в порядке ``items``, независимо от порядка
+    завершения задач. Одновременно в работе или в ожидании выдачи держится
+    не больше ``2 * workers`` результатов, чтобы память не росла с числом
+    источников. ``is_canceled`` опрашивается в главном потоке; после отмены
+    новые задачи не запускаются, ожидающие снимаются с очереди, а функция
+    возвращается, не дожидаясь уже запущенных. Дейкстру networkit прервать
+    нельзя, поэтому запущенные задачи (не больше ``workers``) дорабатывают в
+    фоновых потоках, и их результаты отбрасываются; ``func`` не должна
+    ничего записывать сама.
+    """
+    items = list(items)
+    if workers <= 1:
+        for idx, item in enumerate(items):
+            if is_canceled is not None and is_canceled():
+                return
+            yield idx, item, func(item)
+        return
+
+    max_pending = 2 * workers
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending: Dict[int, Future] = {}
+    finished: Dict[int, R] = {}
+    next_submit = 0
+    next_yield = 0
+    canceled = False
+    try:
+        while next_yield < len(items):
+            while (
+                next_submit < len(items)
+                and len(pending) + len(finished) < max_pending
+            ):
+                pending[next_submit] = executor.submit(func, items[next_submit])
+                next_submit += 1
+
+            if next_yield in finished:
+                yield next_yield, items[next_yield], finished.pop(next_yield)
+                next_yield += 1
+                continue
+
+            wait(pending.values(), timeout=poll_interval, return_when=FIRST_COMPLETED)
+            if is_canceled is not None and is_canceled():
+                canceled = True
+                return
+            for idx in [idx for idx, future in pending.items() if future.done()]:
+                finished[idx] = pending.pop(idx).result()
+    finally:
+        executor.shutdown(wait=not canceled, cancel_futures=True)
@@ -0,0 +1,121 @@
+"""Компактная запись путей по пикселям.
+
+Путь из соседних пикселей хранится цепным кодом: начальный пиксель и
+направления шагов с длинами серий (``"1234:c14b3e"`` — 14 шагов в
+направлении ``c``, 3 в ``b``, 1 в ``e``). Геометрия пути строится только по
+точкам поворота: вершины внутри прямолинейной серии шагов лежат на одной
+прямой и геометрию не меняют. Дополнительно можно упростить линию
+алгоритмом Дугласа — Пекера с заданным допуском; в отличие от слияния
+серий он может изменить взаимное расположение путей. Допуск не больше
+половины пикселя лишь спрямляет "лесенки" и оставляет линию в пределах
+полупикселя от центров её пикселей.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from src.least_cost_path.grid import pixels_to_coords
+
+# Буква направления по номеру (di + 1) * 3 + (dj + 1); "." — нулевой шаг
+_CHAIN_LETTERS = "abcd.efgh"
+_CHAIN_RUN = re.compile(r"([a-h])(\d*)")
+
+
+def _steps(pixels: np.ndarray, cols: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Шаги пути по строкам и столбцам."""
+    i, j = np.divmod(np.asarray(pixels, dtype=np.int64), cols)
+    return np.diff(i), np.diff(j)
+
+
+def encode_chain(pixels: Sequence[int], cols: int) -> str:
+    """Цепной код пути из 8-связных пикселей с длинами серий."""
+    pixels = np.asarray(pixels, dtype=np.int64)
+    if pixels.size == 0:
+        return ""
+    di, dj = _steps(pixels, cols)
+    far = (np.abs(di) > 1) | (np.abs(dj) > 1) | ((di == 0) & (dj == 0))
+    if far.any():
+        raise ValueError("Путь содержит шаги не к соседнему пикселю")
+    codes = (di + 1) * 3 + (dj + 1)
+    if codes.size == 0:
+        return f"{int(pixels[0])}:"
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    runs = np.diff(np.r_[starts, codes.size])
+    parts = [
+        _CHAIN_LETTERS[code] + (str(run) if run > 1 else "")
+        for code, run in zip(codes[starts].tolist(), runs.tolist())
+    ]
+    return f"{int(pixels[0])}:" + "".join(parts)
+
+
+def decode_chain(chain: str, cols: int) -> np.ndarray:
+    """Плоские индексы пикселей пути, записанного encode_chain."""
+    if not chain:
+        return np.empty(0, dtype=np.int64)
+    start, body = chain.split(":", 1)
+    codes, runs = [], []
+    for letter, run in _CHAIN_RUN.findall(body):
+        codes.append(_CHAIN_LETTERS.index(letter))
+        runs.append(int(run) if run else 1)
+    di, dj = np.divmod(np.repeat(np.array(codes, dtype=np.int64), runs), 3)
+    steps = (di - 1) * cols + (dj - 1)
+    return np.cumsum(np.r_[int(start), steps])
+
+
+def turning_points(pixels: Sequence[int], cols: int) -> np.ndarray:
+    """Номера вершин пути, в которых меняется направление, и его концы."""
+    pixels = np.asarray(pixels, dtype=np.int64)
+    if pixels.size <= 2:
+        return np.arange(pixels.size)
+    di, dj = _steps(pixels, cols)
+    turns = np.flatnonzero((di[1:] != di[:-1]) | (dj[1:] != dj[:-1])) + 1
+    return np.r_[0, turns, pixels.size - 1]
+
+
+def douglas_peucker(xs: np.ndarray, ys: np.ndarray, tolerance: float) -> np.ndarray:
+    """Номера вершин, оставшихся после упрощения Дугласа — Пекера."""
+    n = len(xs)
+    if n <= 2 or tolerance <= 0:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, n - 1]] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        x0, y0, x1, y1 = xs[first], ys[first], xs[last], ys[last]
+        px = xs[first + 1 : last] - x0
+        py = ys[first + 1 : last] - y0
+        dx, dy = x1 - x0, y1 - y0
+        length2 = dx * dx + dy * dy
+        if length2 > 0:
+            t = np.clip((px * dx + py * dy) / length2, 0.0, 1.0)
+            dist = np.hypot(px - t * dx, py - t * dy)
+        else:
+            dist = np.hypot(px, py)
+        worst = int(np.argmax(dist))
+        if dist[worst] > tolerance:
+            split = first + 1 + worst
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(keep)
+
+
+def path_vertices(
+    pixels: Sequence[int],
+    cols: int,
+    gt: Sequence[float],
+    tolerance: float = 0.0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Координаты вершин линии пути: точки поворота, при ``tolerance > 0``
+    дополнительно упрощённые Дугласом — Пекером (допуск в единицах СК)."""
+    pixels = np.asarray(pixels, dtype=np.int64)
+    xs, ys = pixels_to_coords(pixels[turning_points(pixels, cols)], cols, gt)
+    keep = douglas_peucker(xs, ys, tolerance)
+    return xs[keep], ys[keep]
@@ -0,0 +1,92 @@
+"""Сеть путей без повторяющихся участков.
+
+Пути между парами точек часто идут по одним и тем же «стволам», и при
+записи по линии на пару общие участки дублируются десятки раз. Здесь пути
+раскладываются на рёбра между соседними пикселями, рёбра объединяются, а
+цепочки рёбер с одним и тем же набором пар склеиваются в линии между
+узлами сети.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+
+class EdgeUsage:
+    """Накопитель рёбер путей за один проход по последовательностям пикселей."""
+
+    def __init__(self):
+        self._u: List[np.ndarray] = []
+        self._v: List[np.ndarray] = []
+        self._pair: List[np.ndarray] = []
+        self.labels: List[str] = []
+
+    def add(self, pixels: np.ndarray, label: str) -> None:
+        """Добавляет путь пары ``label`` (плоские индексы пикселей)."""
+        pixels = np.asarray(pixels, dtype=np.int64)
+        if pixels.size < 2:
+            return
+        a, b = pixels[:-1], pixels[1:]
+        self._u.append(np.minimum(a, b))
+        self._v.append(np.maximum(a, b))
+        self._pair.append(np.full(a.size, len(self.labels), dtype=np.int32))
+        self.labels.append(label)
+
+    def segments(self) -> Iterator[Tuple[np.ndarray, int, List[str]]]:
+        """Линии сети: ``(pixels, usage, pair_labels)``.
+
+        Линия продолжается через пиксель, только если в нём сходятся ровно
+        два ребра с одинаковым набором пар; ``usage`` — число пар, чьи пути
+        проходят по линии.
+        """
+        if not self._u:
+            return
+        u = np.concatenate(self._u)
+        v = np.concatenate(self._v)
+        pair = np.concatenate(self._pair)
+
+        # Уникальные рёбра; одна пара не проходит ребро дважды
+        order = np.lexsort((pair, v, u))
+        u, v, pair = u[order], v[order], pair[order]
+        first = np.r_[True, (u[1:] != u[:-1]) | (v[1:] != v[:-1])]
+        starts = np.flatnonzero(first)
+        edge_u, edge_v = u[starts], v[starts]
+        pair_sets = [
+            tuple(group.tolist())
+            for group in np.split(pair, starts[1:])
+        ]
+
+        incident: Dict[int, List[int]] = defaultdict(list)
+        for e, (a, b) in enumerate(zip(edge_u.tolist(), edge_v.tolist())):
+            incident[a].append(e)
+            incident[b].append(e)
+
+        def passes(node: int) -> bool:
+            edges = incident[node]
+            return len(edges) == 2 and pair_sets[edges[0]] == pair_sets[edges[1]]
+
+        visited = np.zeros(len(pair_sets), dtype=bool)
+        ends = [node for node in incident if not passes(node)]
+        # Замкнутые цепочки без концов обходятся с любого своего узла
+        for start in ends + list(incident):
+            for e in incident[start]:
+                if visited[e]:
+                    continue
+                chain = [start]
+                node = start
+                while True:
+                    visited[e] = True
+                    node = int(edge_v[e]) if edge_u[e] == node else int(edge_u[e])
+                    chain.append(node)
+                    if node == start or not passes(node):
+                        break
+                    e = next(x for x in incident[node] if not visited[x])
+                pairs = pair_sets[e]
+                yield (
+                    np.array(chain, dtype=np.int64),
+                    len(pairs),
+                    [self.labels[p] for p in pairs],
+                )
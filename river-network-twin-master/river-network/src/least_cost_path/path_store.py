@@ -0,0 +1,346 @@
+"""Хранилище найденных путей между точками в SQLite.
+
+Пути хранятся по ключу поверхности стоимости (хэш растров и параметров
+поиска) и паре пикселей концов, поэтому при повторном запуске на той же
+территории заново ищутся только пути для новых пар точек. Вместе с путём
+хранится результат проверки по высоте и рекам и ключ данных, по которым
+она выполнялась: при смене рек или допуска по высоте путь проверяется
+заново, но не перестраивается.
+
+Для каждого набора входных растров (по их путям, а не содержимому)
+запоминается последняя поверхность и снимок её высот и маски суши. Если
+растры изменились, снимки сравниваются, и в новую поверхность переносятся
+только пути, которые заведомо остались оптимальными: путь не проходит
+рядом с изменёнными пикселями, и либо правка нигде не удешевила рёбра,
+либо его стоимость меньше нижней оценки любого пути через изменённые
+пиксели. Остальные пары ищутся заново. Пути и снимки поверхностей, которые
+не последние ни для одного набора растров, удаляются (prune_store).
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import zlib
+from pathlib import Path
+from typing import Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from src.least_cost_path.cache import evict_cache, mark_used
+from src.least_cost_path.grid import NEIGHBOUR_OFFSETS, dilate_mask
+from src.least_cost_path.grid_search import CostGrid, path_cost, shortest_path_tree
+
+PATH_STORE_NAME = "paths.sqlite"
+# Результат проверки ещё не известен для текущих данных проверки
+UNCHECKED = "unchecked"
+# Запас на расхождение стоимостей по float32-снимку и по исходному растру
+COST_SLACK = 1e-6
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS paths (
+    surface TEXT NOT NULL,
+    src INTEGER NOT NULL,
+    dst INTEGER NOT NULL,
+    pixels BLOB NOT NULL,
+    checks TEXT,
+    reason TEXT,
+    PRIMARY KEY (surface, src, dst)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS surfaces (
+    lineage TEXT PRIMARY KEY,
+    surface TEXT NOT NULL
+)
+"""
+
+
+def encode_pixels(pixels: np.ndarray) -> bytes:
+    """Разности соседних индексов пикселей, сжатые zlib."""
+    deltas = np.diff(np.asarray(pixels, dtype=np.int64), prepend=0)
+    return zlib.compress(deltas.tobytes())
+
+
+def decode_pixels(blob: bytes) -> np.ndarray:
+    return np.cumsum(np.frombuffer(zlib.decompress(blob), dtype=np.int64))
+
+
+class PathStore:
+    """Пути одной поверхности стоимости; пара хранится один раз, от меньшего
+    индекса пикселя к большему, и разворачивается при чтении.
+
+    Все методы вызываются из одного (главного) потока.
+    """
+
+    def __init__(self, db_path: Path, surface: str, checks: str):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.surface = surface
+        self.checks = checks
+        self._db = sqlite3.connect(str(db_path))
+        self._db.executescript(_SCHEMA)
+        self._pending: List[tuple] = []
+
+    def known_pairs(self, terminals: Iterable[int]) -> Set[Tuple[int, int]]:
+        """Сохранённые пары, оба конца которых есть среди ``terminals``."""
+        terminals = set(terminals)
+        rows = self._db.execute(
+            "SELECT src, dst FROM paths WHERE surface = ?", (self.surface,)
+        )
+        return {
+            (src, dst)
+            for src, dst in rows
+            if src in terminals and dst in terminals
+        }
+
+    def get(self, src: int, dst: int) -> Tuple[np.ndarray, Optional[str]]:
+        """Путь от ``src`` к ``dst`` и причина отклонения (или UNCHECKED)."""
+        a, b = min(src, dst), max(src, dst)
+        blob, checks, reason = self._db.execute(
+            "SELECT pixels, checks, reason FROM paths "
+            "WHERE surface = ? AND src = ? AND dst = ?",
+            (self.surface, a, b),
+        ).fetchone()
+        pixels = decode_pixels(blob)
+        if src != a:
+            pixels = pixels[::-1]
+        return pixels, reason if checks == self.checks else UNCHECKED
+
+    def put(
+        self, src: int, dst: int, pixels: np.ndarray, reason: Optional[str]
+    ) -> None:
+        """Запоминает путь (пустой — пара недостижима) и результат проверки."""
+        a, b = min(src, dst), max(src, dst)
+        if src != a:
+            pixels = pixels[::-1]
+        self._pending.append(
+            (self.surface, a, b, encode_pixels(pixels), self.checks, reason)
+        )
+
+    def previous_surface(self, lineage: str) -> Optional[str]:
+        """Поверхность, с которой последний раз работали для ``lineage``."""
+        row = self._db.execute(
+            "SELECT surface FROM surfaces WHERE lineage = ?", (lineage,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def remember_surface(self, lineage: str) -> None:
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO surfaces VALUES (?, ?)",
+                (lineage, self.surface),
+            )
+
+    def prune(self) -> Set[str]:
+        """Удаляет пути поверхностей, не запомненных ни для одного набора
+        растров, и возвращает запомненные поверхности."""
+        with self._db:
+            self._db.execute(
+                "DELETE FROM paths WHERE surface NOT IN "
+                "(SELECT surface FROM surfaces)"
+            )
+        return {row[0] for row in self._db.execute("SELECT surface FROM surfaces")}
+
+    def surface_paths(self, surface: str) -> List[tuple]:
+        """Строки ``(src, dst, pixels, checks, reason)`` поверхности ``surface``;
+        пиксели — как хранятся, в сжатом виде."""
+        return self._db.execute(
+            "SELECT src, dst, pixels, checks, reason FROM paths WHERE surface = ?",
+            (surface,),
+        ).fetchall()
+
+    def carry_over(self, previous: str, rows: Iterable[tuple]) -> None:
+        """Переносит строки surface_paths в текущую поверхность и удаляет
+        поверхность ``previous``."""
+        with self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO paths VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.surface, *row) for row in rows],
+            )
+            self._db.execute("DELETE FROM paths WHERE surface = ?", (previous,))
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO paths VALUES (?, ?, ?, ?, ?, ?)",
+                self._pending,
+            )
+        self._pending = []
+
+    def close(self) -> None:
+        self.flush()
+        self._db.close()
+
+
+def changed_cells(
+    old_values: np.ndarray,
+    old_passable: np.ndarray,
+    values: np.ndarray,
+    passable: np.ndarray,
+) -> np.ndarray:
+    """Маска пикселей, у которых изменилась высота или проходимость."""
+    # Снимки хранят высоты в float32, поэтому сравнение идёт в той же точности
+    values = np.asarray(values, dtype=np.float32)
+    changed = old_passable != passable
+    changed |= old_passable & passable & (old_values != values)
+    return changed
+
+
+def lowers_costs(
+    old_values: np.ndarray,
+    old_passable: np.ndarray,
+    values: np.ndarray,
+    passable: np.ndarray,
+    changed: np.ndarray,
+) -> bool:
+    """Удешевила ли правка хотя бы одно ребро (веса ``factor * (|dh| + eps)``).
+
+    Ребро дешевеет, если у него уменьшилась разность высот или оно
+    появилось (пиксель воды стал сушей). Рёбра без изменённых концов не
+    меняются, поэтому проверяется только окно вокруг изменений.
+    """
+    ii, jj = np.nonzero(changed)
+    if ii.size == 0:
+        return False
+    rows, cols = changed.shape
+    window = (
+        slice(max(0, ii.min() - 1), min(rows, ii.max() + 2)),
+        slice(max(0, jj.min() - 1), min(cols, jj.max() + 2)),
+    )
+    old_z = np.asarray(old_values[window], dtype=np.float32)
+    old_land = np.asarray(old_passable[window], dtype=bool)
+    new_z = np.asarray(values[window], dtype=np.float32)
+    new_land = np.asarray(passable[window], dtype=bool)
+    h, w = old_z.shape
+    for di, dj, _ in NEIGHBOUR_OFFSETS:
+        a = (slice(0, h - di), slice(max(0, -dj), w - max(0, dj)))
+        b = (slice(di, h), slice(max(0, dj), w - max(0, -dj)))
+        new_edge = new_land[a] & new_land[b]
+        old_edge = old_land[a] & old_land[b]
+        if (new_edge & ~old_edge).any():
+            return True
+        cheaper = np.abs(new_z[a] - new_z[b]) < np.abs(old_z[a] - old_z[b])
+        if (cheaper & new_edge & old_edge).any():
+            return True
+    return False
+
+
+def still_optimal(
+    rows: List[tuple],
+    old_values: np.ndarray,
+    old_passable: np.ndarray,
+    changed: np.ndarray,
+) -> List[tuple]:
+    """Строки путей, которые заведомо остаются кратчайшими после правки.
+
+    Путь новой поверхности, дешевле сохранённого, должен пройти по
+    изменённому ребру. Его начало до первого такого ребра и конец после
+    последнего есть и на старой поверхности, поэтому он стоит не меньше
+    ``d(s, C) + d(t, C)``, где ``C`` — концы изменённых рёбер, а расстояния
+    считаются по старой поверхности. Оба расстояния для всех концов пар
+    даёт один поиск от ``C``; путь сохраняется, если он дешевле этой
+    оценки. Поиск останавливается на стоимости самого дорогого пути:
+    дальше оценка заведомо достаточна.
+    """
+    if not rows:
+        return []
+    old = CostGrid(
+        values=np.asarray(old_values, dtype=np.float32),
+        passable=np.asarray(old_passable, dtype=bool),
+        geotransform=(0.0, 1.0, 0.0, 0.0, 0.0, -1.0),
+    )
+    costs = [path_cost(old, decode_pixels(blob)) for _, _, blob, _, _ in rows]
+    seeds = np.flatnonzero((dilate_mask(changed, 1) & old.passable).ravel())
+    terminals = {src for src, *_ in rows} | {dst for _, dst, *_ in rows}
+    distance = shortest_path_tree(
+        old, seeds.tolist(), targets=terminals, max_cost=max(costs)
+    ).cost.ravel()
+    return [
+        row
+        for row, cost in zip(rows, costs)
+        if cost * (1.0 + COST_SLACK) < distance[row[0]] + distance[row[1]]
+    ]
+
+
+def update_surface(
+    store: PathStore,
+    lineage: str,
+    cache_dir: Path,
+    values: np.ndarray,
+    passable: np.ndarray,
+    margin: int,
+) -> None:
+    """Переносит в текущую поверхность пути предыдущей, не задетые изменением.
+
+    ``lineage`` — ключ путей к растрам и параметров поиска; ``values`` и
+    ``passable`` — высоты и маска суши текущей поверхности. Переносятся
+    пути, не проходящие ближе ``margin`` пикселей к изменениям; если правка
+    где-то удешевила рёбра — только те из них, что прошли still_optimal.
+    Снимок текущей поверхности сохраняется для сравнения при следующем
+    изменении, снимок предыдущей удаляется.
+    """
+    previous = store.previous_surface(lineage)
+    if previous is not None and previous != store.surface:
+        old_values_path, old_passable_path = _snapshot_paths(cache_dir, previous)
+        rows = store.surface_paths(previous)
+        kept = []
+        if old_values_path.exists() and old_passable_path.exists():
+            old_values = np.load(old_values_path, mmap_mode="r")
+            old_passable = np.load(old_passable_path, mmap_mode="r")
+            if old_values.shape == values.shape:
+                changed = changed_cells(old_values, old_passable, values, passable)
+                # Вес ребра зависит от обоих его концов, поэтому к запасу
+                # добавляется ещё один пиксель
+                affected = dilate_mask(changed, margin + 1).ravel()
+                print(
+                    f"Изменено пикселей поверхности: {int(changed.sum())}",
+                    flush=True,
+                )
+                # Недостижимые пары не переносятся — изменение могло их соединить
+                for row in rows:
+                    pixels = decode_pixels(row[2])
+                    if len(pixels) and not affected[pixels].any():
+                        kept.append(row)
+                if lowers_costs(old_values, old_passable, values, passable, changed):
+                    untouched = len(kept)
+                    kept = still_optimal(kept, old_values, old_passable, changed)
+                    print(
+                        "Правка удешевила часть рёбер: из "
+                        f"{untouched} незадетых путей оптимальны {len(kept)}",
+                        flush=True,
+                    )
+            del old_values, old_passable
+        store.carry_over(previous, kept)
+        print(
+            f"Пути прежней поверхности: сохранено {len(kept)}, "
+            f"к пересчёту {len(rows) - len(kept)}",
+            flush=True,
+        )
+        old_values_path.unlink(missing_ok=True)
+        old_passable_path.unlink(missing_ok=True)
+
+    values_path, passable_path = _snapshot_paths(cache_dir, store.surface)
+    if values_path.exists() and passable_path.exists():
+        mark_used(values_path)
+    else:
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        np.save(values_path, np.asarray(values, dtype=np.float32))
+        np.save(passable_path, np.asarray(passable, dtype=bool))
+        evict_cache(Path(cache_dir))
+    store.remember_surface(lineage)
+
+
+def prune_store(store: PathStore, cache_dir: Path) -> None:
+    """Удаляет из хранилища и папки кэша поверхности, на которые не ссылается
+    ни один набор растров; без этого каждая правка DEM оставляла бы все
+    пути прежней поверхности."""
+    store.flush()
+    live = store.prune()
+    for snapshot in Path(cache_dir).glob("surface_*.npy"):
+        surface = snapshot.name[len("surface_") :].split(".", 1)[0]
+        if surface not in live:
+            snapshot.unlink(missing_ok=True)
+
+
+def _snapshot_paths(cache_dir: Path, surface: str) -> Tuple[Path, Path]:
+    base = Path(cache_dir) / f"surface_{surface}"
+    return base.with_suffix(".values.npy"), base.with_suffix(".passable.npy")
@@ -0,0 +1,114 @@
+"""Привязка точек к ближайшей суше по преобразованию расстояний.
+
+Для каждого пикселя растра один раз вычисляется ближайший пиксель суши
+(евклидово расстояние между центрами пикселей). Результат кэшируется
+вместе с маской воды, а привязка любого числа точек сводится к выборке
+из массива.
+"""
+
+from __future__ import annotations
+
+import math
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+
+from src.least_cost_path.cache import (
+    CACHE_DIR_NAME,
+    cache_key,
+    evict_cache,
+    mark_used,
+    remember,
+)
+from src.least_cost_path.grid import coords_to_pixels, read_land_mask
+
+NO_LAND = -1
+
+_nearest: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+
+def nearest_land_transform(land: np.ndarray, max_distance: float) -> np.ndarray:
+    """Индекс ``i * cols + j`` ближайшего пикселя суши для каждого пикселя.
+
+    Расстояние считается в пикселях; если суши ближе ``max_distance`` нет,
+    записывается NO_LAND. Преобразование раскладывается на два прохода —
+    по столбцам и по строкам — и точно в пределах ``max_distance``.
+    """
+    rows, cols = land.shape
+    radius = int(math.floor(max_distance))
+
+    # Проход 1: ближайшая суша в том же столбце
+    vertical = np.full((rows, cols), np.inf)
+    land_row = np.full((rows, cols), NO_LAND, dtype=np.int64)
+    for di in sorted(range(-radius, radius + 1), key=abs):
+        src = slice(max(0, di), rows + min(0, di))
+        dst = slice(max(0, -di), rows - max(0, di))
+        found = land[src] & np.isinf(vertical[dst])
+        vertical[dst][found] = abs(di)
+        land_row[dst][found] = np.nonzero(found)[0] + max(0, di)
+
+    # Проход 2: лучший столбец с учётом вертикальных расстояний
+    best = np.full((rows, cols), np.inf)
+    nearest = np.full((rows, cols), NO_LAND, dtype=np.int32)
+    for dj in range(-radius, radius + 1):
+        src = slice(max(0, dj), cols + min(0, dj))
+        dst = slice(max(0, -dj), cols - max(0, dj))
+        dist = vertical[:, src] ** 2 + dj * dj
+        better = dist < best[:, dst]
+        best[:, dst][better] = dist[better]
+        j = np.nonzero(better)[1] + max(0, dj)
+        nearest[:, dst][better] = land_row[:, src][better] * cols + j
+
+    nearest[best > max_distance * max_distance] = NO_LAND
+    return nearest
+
+
+def cached_nearest_land(
+    water_path: Path,
+    max_distance: float,
+    land: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """nearest_land_transform для растра воды с кэшем в памяти и на диске.
+
+    ``land`` — уже прочитанная маска суши этого растра; без неё маска
+    читается из файла только при промахе кэша.
+    """
+    key = cache_key(water_path, kind="nearest_land", max_distance=max_distance)
+    if key in _nearest:
+        _nearest.move_to_end(key)
+        return _nearest[key]
+
+    path = Path(water_path).parent / CACHE_DIR_NAME / f"nearest_land_{key}.npy"
+    if path.exists():
+        mark_used(path)
+        nearest = np.load(path, mmap_mode="r")
+    else:
+        if land is None:
+            land = read_land_mask(water_path)
+        nearest = nearest_land_transform(land, max_distance)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.save(path, nearest)
+        evict_cache(path.parent)
+    remember(_nearest, key, nearest)
+    return nearest
+
+
+def snap_to_land(
+    nearest: np.ndarray,
+    gt: Sequence[float],
+    xs: Sequence[float],
+    ys: Sequence[float],
+) -> np.ndarray:
+    """Пиксели суши для точек с координатами ``xs``, ``ys``.
+
+    Возвращает плоские индексы пикселей; NO_LAND — точка вне растра или
+    суши нет в пределах расстояния привязки.
+    """
+    rows, cols = nearest.shape
+    i, j = coords_to_pixels(xs, ys, gt)
+    inside = (i >= 0) & (i < rows) & (j >= 0) & (j < cols)
+    result = np.full(i.shape, NO_LAND, dtype=np.int64)
+    result[inside] = nearest[i[inside], j[inside]]
+    return result
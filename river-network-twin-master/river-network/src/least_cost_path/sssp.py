@@ -0,0 +1,213 @@
+"""Единая точка запуска поиска путей от одного источника для обоих движков."""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import networkit as nk
+
+from src.least_cost_path.grid import NodeIndex
+from src.least_cost_path.grid_search import (
+    CostGrid,
+    UNREACHABLE,
+    SearchResult,
+    shortest_path_tree,
+    trace_path,
+)
+
+@dataclass
+class SearchBounds:
+    """Ограничения поиска: предельная стоимость пути и радиус в пикселях.
+
+    ``max_drop`` — насколько путь может опуститься ниже меньшей из высот
+    своих концов; пиксели ниже этой границы пары поиск не раскрывает. Пара,
+    кратчайший путь которой уходит ниже границы, получает кратчайший путь
+    над ней, а если такого нет — считается недостижимой. Применяется только
+    при поиске по растру (``grid``), значения которого — высоты.
+    """
+
+    max_cost: Optional[float] = None
+    max_radius: Optional[float] = None
+    max_drop: Optional[float] = None
+
+    def __bool__(self) -> bool:
+        return (
+            self.max_cost is not None
+            or self.max_radius is not None
+            or self.max_drop is not None
+        )
+
+
+@dataclass
+class SearchStats:
+    """Счётчики поиска, общие для всех потоков одного расчёта.
+
+    ``relaxed`` и ``pruned`` считает только поиск без графа networkit.
+    """
+
+    settled: int = 0
+    relaxed: int = 0
+    pruned: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, result: SearchResult) -> None:
+        with self._lock:
+            self.settled += result.settled
+            self.relaxed += result.relaxed
+            self.pruned += result.pruned
+
+
+def within_radius(
+    source: int, targets: Sequence[int], cols: int, max_radius: Optional[float]
+) -> List[bool]:
+    """Для каждой цели проверяет, лежит ли она в радиусе от источника."""
+    if max_radius is None:
+        return [True] * len(targets)
+    si, sj = divmod(source, cols)
+    radius_sq = max_radius * max_radius
+    result = []
+    for target in targets:
+        ti, tj = divmod(target, cols)
+        result.append((ti - si) ** 2 + (tj - sj) ** 2 <= radius_sq)
+    return result
+
+
+def paths_from_source(
+    source: int,
+    targets: Sequence[int],
+    cols: int,
+    graph: Optional[nk.Graph] = None,
+    grid: Optional[CostGrid] = None,
+    bounds: Optional[SearchBounds] = None,
+    index: Optional[NodeIndex] = None,
+    stats: Optional[SearchStats] = None,
+) -> List[List[int]]:
+    """Возвращает пути от ``source`` до каждой из ``targets``.
+
+    Для пар за пределами ``bounds`` и недостижимых пар возвращается пустой
+    список. Если ни одна цель не проходит по радиусу, поиск не запускается.
+    Поиск останавливается, как только найдены все цели. По растру
+    (``grid``) поиск также не выходит за ``max_radius`` и границу высоты, а
+    без графа networkit (``grid.implicit_search``) — и за ``max_cost``.
+
+    ``source``, ``targets`` и пути задаются индексами пикселей. Если граф
+    построен на плотной нумерации суши (``index``), индексы переводятся в
+    номера узлов и обратно; пары с пикселем воды считаются недостижимыми.
+    В ``stats`` (если задан) накапливаются счётчики поисков по растру.
+    """
+    if bounds is None:
+        bounds = SearchBounds()
+    in_radius = within_radius(source, targets, cols, bounds.max_radius)
+    wanted = [t for t, ok in zip(targets, in_radius) if ok]
+    if not wanted:
+        return [[] for _ in targets]
+
+    if grid is not None:
+        paths = {}
+        for floor, group in _floor_groups(grid, source, wanted, bounds.max_drop):
+            tree = shortest_path_tree(
+                grid,
+                [source],
+                targets=group,
+                max_cost=bounds.max_cost,
+                max_radius=bounds.max_radius,
+                min_value=floor,
+            )
+            if stats is not None:
+                stats.add(tree)
+            paths.update((t, trace_path(tree, t)) for t in group)
+        return [paths[t] if ok else [] for t, ok in zip(targets, in_radius)]
+
+    if index is not None:
+        source = index.to_node(source)
+        targets = [index.to_node(t) for t in targets]
+        in_radius = [ok and t >= 0 for t, ok in zip(targets, in_radius)]
+        if source < 0 or not any(in_radius):
+            return [[] for _ in targets]
+
+    # Расстояния до целей с остановкой на последней из них; путей
+    # MultiTargetDijkstra не хранит, поэтому затем дерево с путями строится
+    # до самой дальней нужной цели — к этому моменту найдены и остальные
+    wanted = [t for t, ok in zip(targets, in_radius) if ok]
+    multi = nk.distance.MultiTargetDijkstra(graph, source, wanted)
+    multi.run()
+    reached = {
+        t: d
+        for t, d in zip(wanted, multi.getDistances())
+        if d < UNREACHABLE
+        and (bounds.max_cost is None or d <= bounds.max_cost)
+    }
+    if not reached:
+        return [[] for _ in targets]
+    farthest = max(reached, key=reached.get)
+    dijk = nk.distance.Dijkstra(graph, source, storePaths=True, target=farthest)
+    dijk.run()
+    paths = []
+    for target in targets:
+        if target not in reached:
+            paths.append([])
+        elif index is not None:
+            paths.append(index.to_pixels(dijk.getPath(target)))
+        else:
+            paths.append(dijk.getPath(target))
+    return paths
+
+
+def _floor_groups(
+    grid: CostGrid, source: int, targets: Sequence[int], max_drop: Optional[float]
+) -> List[Tuple[Optional[float], List[int]]]:
+    """Цели, сгруппированные по границе высоты пары с ``source``.
+
+    Граница пары — ``min(z_s, z_t) - max_drop``. У целей не ниже источника
+    она общая, и они ищутся одним поиском; каждая более низкая цель —
+    отдельным поиском со своей границей. Поэтому пути удобнее искать от
+    нижнего конца пары: тогда на источник приходится ровно один поиск.
+    """
+    if max_drop is None:
+        return [(None, list(targets))]
+    heights = grid.values.flat
+    z_source = float(heights[source])
+    higher = [t for t in targets if heights[t] >= z_source]
+    groups = [(z_source - max_drop, higher)] if higher else []
+    groups.extend(
+        (float(heights[t]) - max_drop, [t]) for t in targets if heights[t] < z_source
+    )
+    return groups
+
+
+def compare_elevation_floor(
+    grid: CostGrid,
+    pairs: Sequence[Tuple[int, Sequence[int]]],
+    bounds: SearchBounds,
+) -> Dict[str, float]:
+    """Сравнивает поиск с ограничением высоты ``bounds.max_drop`` и без него.
+
+    ``pairs`` — источники с их целями. Возвращает и печатает число
+    найденных пикселей и время обоих вариантов.
+    """
+    row: Dict[str, float] = {}
+    for name, drop in (("unconstrained", None), ("constrained", bounds.max_drop)):
+        stats = SearchStats()
+        run_bounds = replace(bounds, max_drop=drop)
+        started = time.perf_counter()
+        for source, targets in pairs:
+            paths_from_source(
+                source, targets, grid.cols, grid=grid, bounds=run_bounds, stats=stats
+            )
+        row[f"{name}_settled"] = stats.settled
+        row[f"{name}_seconds"] = time.perf_counter() - started
+    row["saved"] = row["unconstrained_settled"] - row["constrained_settled"]
+    total = row["unconstrained_settled"]
+    share = row["saved"] / total if total else 0.0
+    print(
+        f"Найдено пикселей на {len(pairs)} источниках без ограничения высоты: "
+        f"{row['unconstrained_settled']} ({row['unconstrained_seconds']:.2f} с), "
+        f"с ограничением: {row['constrained_settled']} "
+        f"({row['constrained_seconds']:.2f} с); сэкономлено {row['saved']} "
+        f"({share:.0%})",
+        flush=True,
+    )
+    return row
@@ -0,0 +1,213 @@
+"""Проверка путей до записи в слой.
+
+Заменяет фильтры по готовому слою путей: минимальная высота берётся из
+массива DEM по индексам пикселей пути. Пересечение рек по умолчанию
+проверяется по растру номеров рек на сетке путей (rasterize_rivers) —
+выборкой по индексам пикселей, без геометрии пути. Прежнее правило фильтра
+слоя — линия пути против неперепроецированных рек по пространственному
+индексу (RiverIndex) — остаётся для сравнения с прежними результатами.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+from osgeo import gdal
+from qgis.core import QgsGeometry, QgsLineString, QgsPointXY, QgsSpatialIndex
+
+from src.least_cost_path.grid import coords_to_pixels, pixels_to_coords
+
+MAX_ELEVATION_DROP = 15.0  # Допустимое понижение пути ниже концов, м
+# Радиус (в пикселях) вокруг концов пути, в котором реки считаются
+# «своими» при строгой проверке: точки привязываются к суше в том же радиусе
+ENDPOINT_RADIUS = 2
+
+# Причины отклонения пути
+REJECT_HEIGHT = "height"
+REJECT_RIVER = "river"
+
+
+def read_elevation(raster_path: Path) -> np.ndarray:
+    """Читает DEM как float64; пиксели nodata заменяются на NaN."""
+    band = gdal.Open(str(raster_path)).GetRasterBand(1)
+    values = band.ReadAsArray().astype(np.float64)
+    nodata = band.GetNoDataValue()
+    if nodata is not None:
+        values[values == nodata] = np.nan
+    return values
+
+
+def rasterize_rivers(
+    rivers_layer, transform, gt: Sequence[float], rows: int, cols: int
+) -> np.ndarray:
+    """Растр номеров рек на сетке путей (-1 — реки нет).
+
+    Линии переводятся в EPSG:3857 через ``transform`` и проходятся с шагом
+    в четверть пикселя, так что отмечается каждый пиксель, через который
+    проходит река.
+    """
+    river_ids = np.full((rows, cols), -1, dtype=np.int32)
+    step = min(abs(gt[1]), abs(gt[5])) / 4
+    for number, feature in enumerate(rivers_layer.getFeatures()):
+        geom = QgsGeometry(feature.geometry())
+        if geom.isEmpty():
+            continue
+        geom.transform(transform)
+        lines = geom.asMultiPolyline() if geom.isMultipart() else [geom.asPolyline()]
+        for line in lines:
+            if not line:
+                continue
+            xy = np.array([(pt.x(), pt.y()) for pt in line], dtype=np.float64)
+            seg = np.diff(xy, axis=0)
+            counts = np.maximum(
+                1, np.ceil(np.hypot(seg[:, 0], seg[:, 1]) / step)
+            ).astype(np.int64)
+            offsets = np.arange(counts.sum()) - np.repeat(
+                np.cumsum(counts) - counts, counts
+            )
+            frac = offsets / np.repeat(counts, counts)
+            points = np.repeat(xy[:-1], counts, axis=0) + np.repeat(
+                seg, counts, axis=0
+            ) * frac[:, None]
+            points = np.vstack([points, xy[-1:]])
+            i, j = coords_to_pixels(points[:, 0], points[:, 1], gt)
+            inside = (i >= 0) & (i < rows) & (j >= 0) & (j < cols)
+            river_ids[i[inside], j[inside]] = number
+    return river_ids
+
+
+class RiverIndex:
+    """Геометрии рек с пространственным индексом для проверки линий путей.
+
+    Геометрии сравниваются с путями в EPSG:3857 без перепроецирования, как
+    в прежнем фильтре слоя путей.
+    """
+
+    def __init__(self, rivers_layer):
+        self.geometries = {
+            feature.id(): QgsGeometry(feature.geometry())
+            for feature in rivers_layer.getFeatures()
+        }
+        self.index = QgsSpatialIndex(rivers_layer.getFeatures())
+
+    def digest(self) -> str:
+        """Хэш геометрий рек для ключа результатов проверки."""
+        sha = hashlib.sha1()
+        for fid in sorted(self.geometries):
+            sha.update(str(fid).encode())
+            sha.update(bytes(self.geometries[fid].asWkb()))
+        return sha.hexdigest()
+
+
+@dataclass
+class PathValidator:
+    """Проверки пути по высоте и по рекам на сетке пикселей путей.
+
+    ``elevation`` может иметь другую сетку (``elevation_gt``), чем пути
+    (``gt``): пиксели пути переводятся в пиксели DEM по координатам центров,
+    как при выборке значений растра в точках вершин.
+
+    Реки проверяются строго по растру рек ``river_ids`` или, если задан
+    только ``rivers``, по прежнему правилу.
+    """
+
+    cols: int
+    gt: Sequence[float]
+    elevation: Optional[np.ndarray] = None
+    elevation_gt: Optional[Sequence[float]] = None
+    rivers: Optional[RiverIndex] = None
+    river_ids: Optional[np.ndarray] = None
+    max_drop: float = MAX_ELEVATION_DROP
+    endpoint_radius: int = ENDPOINT_RADIUS
+
+    def elevation_along(self, pixels: np.ndarray) -> np.ndarray:
+        """Высоты в вершинах пути; NaN там, где значение не определено."""
+        xs, ys = pixels_to_coords(pixels, self.cols, self.gt)
+        i, j = coords_to_pixels(xs, ys, self.elevation_gt)
+        rows, cols = self.elevation.shape
+        inside = (i >= 0) & (i < rows) & (j >= 0) & (j < cols)
+        z = np.full(len(pixels), np.nan)
+        z[inside] = self.elevation[i[inside], j[inside]]
+        return z
+
+    def drops_too_low(self, pixels: np.ndarray) -> bool:
+        """Путь опускается ниже меньшей из высот концов больше чем на max_drop."""
+        z = self.elevation_along(pixels)
+        if np.isnan(z[0]) or np.isnan(z[-1]) or np.isnan(z).all():
+            return False
+        return bool(np.nanmin(z) < min(z[0], z[-1]) - self.max_drop)
+
+    def crosses_river(self, pixels: np.ndarray) -> bool:
+        """Прежнее правило фильтра слоя путей.
+
+        Среди рек, чей охват пересекает охват линии пути, берётся первая
+        пересекающая линию; путь отклоняется, если ни начальная, ни конечная
+        его точка эту реку не пересекают. Остальные реки не проверяются.
+        """
+        if len(pixels) < 2:
+            return False
+        xs, ys = pixels_to_coords(pixels, self.cols, self.gt)
+        line = QgsGeometry(QgsLineString(xs.tolist(), ys.tolist()))
+        start = QgsGeometry.fromPointXY(QgsPointXY(xs[0], ys[0]))
+        end = QgsGeometry.fromPointXY(QgsPointXY(xs[-1], ys[-1]))
+        for fid in self.rivers.index.intersects(line.boundingBox()):
+            river = self.rivers.geometries[fid]
+            if line.intersects(river):
+                return not (start.intersects(river) or end.intersects(river))
+        return False
+
+    def crosses_river_strict(self, pixels: np.ndarray) -> bool:
+        """Путь проходит через реку, не подходящую ни к одному из его концов.
+
+        Диагональный шаг между двумя пикселями одной реки тоже считается
+        пересечением: линия реки проходит между вершинами пути.
+        """
+        rivers = self.river_ids.ravel()
+        crossed = rivers[pixels]
+        i, j = np.divmod(pixels, self.cols)
+        diagonal = (np.diff(i) != 0) & (np.diff(j) != 0)
+        corner_a = rivers[i[:-1][diagonal] * self.cols + j[1:][diagonal]]
+        corner_b = rivers[i[1:][diagonal] * self.cols + j[:-1][diagonal]]
+        crossed = np.concatenate(
+            [crossed, corner_a[corner_a == corner_b]]
+        )
+        crossed = np.unique(crossed[crossed >= 0])
+        if crossed.size == 0:
+            return False
+        own = np.concatenate(
+            [self._rivers_near(pixels[0]), self._rivers_near(pixels[-1])]
+        )
+        return bool(np.setdiff1d(crossed, own).size)
+
+    def _rivers_near(self, pixel: int) -> np.ndarray:
+        rows, cols = self.river_ids.shape
+        i, j = divmod(int(pixel), cols)
+        r = self.endpoint_radius
+        window = self.river_ids[
+            max(0, i - r) : min(rows, i + r + 1), max(0, j - r) : min(cols, j + r + 1)
+        ]
+        return window[window >= 0]
+
+    def reject_reason(self, pixels: np.ndarray) -> Optional[str]:
+        """Причина отклонения пути или None, если путь проходит проверки."""
+        if self.elevation is not None and self.drops_too_low(pixels):
+            return REJECT_HEIGHT
+        if self.river_ids is not None:
+            if self.crosses_river_strict(pixels):
+                return REJECT_RIVER
+        elif self.rivers is not None and self.crosses_river(pixels):
+            return REJECT_RIVER
+        return None
+
+    def rivers_key(self) -> str:
+        """Ключ данных и правила проверки рек."""
+        if self.river_ids is not None:
+            digest = hashlib.sha1(self.river_ids.tobytes()).hexdigest()
+            return f"strict:{self.endpoint_radius}:{digest}"
+        if self.rivers is not None:
+            return f"layer:{self.rivers.digest()}"
+        return "none"
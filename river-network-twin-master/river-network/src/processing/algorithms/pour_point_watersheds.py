@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from qgis.core import (
+    QgsProcessingAlgorithm,
+    QgsProcessingContext,
+    QgsProcessingFeedback,
+    QgsProcessingParameterFileDestination,
+    QgsProcessingParameterRasterDestination,
+    QgsProcessingParameterRasterLayer,
+    QgsProcessingParameterVectorLayer,
+)
+from src.river.layers.watersheds import build_pour_point_watersheds
+
+
+class PourPointWatershedsAlgorithm(QgsProcessingAlgorithm):
+    INPUT_DEM = "INPUT_DEM"
+    INPUT_POINTS = "INPUT_POINTS"
+    OUTPUT_RASTER = "OUTPUT_RASTER"
+    OUTPUT_POLYGONS = "OUTPUT_POLYGONS"
+
+    def initAlgorithm(self, config=None) -> None:
+        self.addParameter(QgsProcessingParameterRasterLayer(self.INPUT_DEM, "DEM"))
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(self.INPUT_POINTS, "Pour points")
+        )
+        self.addParameter(
+            QgsProcessingParameterRasterDestination(
+                self.OUTPUT_RASTER, "Output watersheds raster"
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                self.OUTPUT_POLYGONS,
+                "Output watersheds (GPKG)",
+                fileFilter="GeoPackage (*.gpkg)",
+            )
+        )
+
+    def processAlgorithm(
+        self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback
+    ):
+        dem_layer = self.parameterAsRasterLayer(parameters, self.INPUT_DEM, context)
+        points_layer = self.parameterAsVectorLayer(parameters, self.INPUT_POINTS, context)
+        raster_output = Path(
+            self.parameterAsOutputLayer(parameters, self.OUTPUT_RASTER, context)
+        )
+        polygon_output = Path(
+            self.parameterAsFileOutput(parameters, self.OUTPUT_POLYGONS, context)
+        )
+
+        raster_layer, polygon_layer = build_pour_point_watersheds(
+            Path(dem_layer.source()), points_layer, raster_output, polygon_output
+        )
+        feedback.pushInfo("Водосборы точек замыкания построены.")
+        return {
+            self.OUTPUT_RASTER: raster_layer.source(),
+            self.OUTPUT_POLYGONS: polygon_layer.source(),
+        }
+
+    def name(self) -> str:
+        return "pour_point_watersheds"
+
+    def displayName(self) -> str:
+        return "Водосборы по точкам замыкания (D8)"
+
+    def group(self) -> str:
+        return "Hydrology"
+
+    def groupId(self) -> str:
+        return "hydrology"
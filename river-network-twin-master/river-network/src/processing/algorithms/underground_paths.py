@@ -12,7 +12,7 @@ from qgis.core import (
     QgsVectorLayer,
 )
 from src.underground.network import run_network_analysis
-from src.underground.polygonizer import polygonize_paths
+from src.underground.polygonizer import allocate_basins
 
 
 class UndergroundPathsAlgorithm(QgsProcessingAlgorithm):
@@ -60,7 +60,9 @@ class UndergroundPathsAlgorithm(QgsProcessingAlgorithm):
             cost_layer.crs().authid(),
             progress=None,
         )
-        polygon_layer = polygonize_paths(path_layer, polygon_output)
+        polygon_layer = allocate_basins(
+            Path(cost_layer.source()), sinks_layer, polygon_output
+        )
         feedback.pushInfo("Подземные пути и водоразделы построены.")
         return {
             self.OUTPUT_PATHS: path_layer.source(),
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from qgis.core import (
+    QgsProcessingAlgorithm,
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingFeedback,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterFolderDestination,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterRasterLayer,
+    QgsProcessingParameterString,
+    QgsProcessingParameterVectorLayer,
+)
+
+from src.underground.config import UndergroundInputs
+from src.underground.scenarios import (
+    parse_scenarios,
+    run_weight_scenarios,
+    weight_grid,
+)
+
+
+class UndergroundScenariosAlgorithm(QgsProcessingAlgorithm):
+    INPUT_DEM = "INPUT_DEM"
+    INPUT_GW = "INPUT_GW"
+    INPUT_PERMEABILITY = "INPUT_PERMEABILITY"
+    INPUT_KARST = "INPUT_KARST"
+    SCENARIOS = "SCENARIOS"
+    GRID_STEP = "GRID_STEP"
+    INPUT_SOURCES = "INPUT_SOURCES"
+    INPUT_SINKS = "INPUT_SINKS"
+    KEEP_COST = "KEEP_COST"
+    OUTPUT_FOLDER = "OUTPUT_FOLDER"
+
+    def initAlgorithm(self, config=None) -> None:
+        self.addParameter(
+            QgsProcessingParameterRasterLayer(self.INPUT_DEM, "DEM (GeoTIFF)")
+        )
+        self.addParameter(
+            QgsProcessingParameterRasterLayer(
+                self.INPUT_GW, "Groundwater surface (GeoTIFF)"
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterRasterLayer(
+                self.INPUT_PERMEABILITY, "Permeability raster (GeoTIFF)"
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterRasterLayer(
+                self.INPUT_KARST, "Karst index raster (GeoTIFF)"
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.SCENARIOS,
+                "Weight sets: slope,permeability,karst[,depth]; separated by ';'",
+                multiLine=True,
+                optional=True,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.GRID_STEP,
+                "Weight grid step (0 - do not use grid)",
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=0.0,
+                minValue=0,
+                maxValue=1,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.INPUT_SOURCES, "Source points", optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.INPUT_SINKS, "Outlet points", optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.KEEP_COST, "Keep cost rasters", defaultValue=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFolderDestination(
+                self.OUTPUT_FOLDER, "Output folder"
+            )
+        )
+
+    def processAlgorithm(
+        self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback
+    ):
+        dem_layer = self.parameterAsRasterLayer(parameters, self.INPUT_DEM, context)
+        gw_layer = self.parameterAsRasterLayer(parameters, self.INPUT_GW, context)
+        perm_layer = self.parameterAsRasterLayer(
+            parameters, self.INPUT_PERMEABILITY, context
+        )
+        karst_layer = self.parameterAsRasterLayer(parameters, self.INPUT_KARST, context)
+        scenarios_text = self.parameterAsString(parameters, self.SCENARIOS, context)
+        grid_step = self.parameterAsDouble(parameters, self.GRID_STEP, context)
+        sources_layer = self.parameterAsVectorLayer(
+            parameters, self.INPUT_SOURCES, context
+        )
+        sinks_layer = self.parameterAsVectorLayer(parameters, self.INPUT_SINKS, context)
+        keep_cost = self.parameterAsBoolean(parameters, self.KEEP_COST, context)
+        output_folder = Path(
+            self.parameterAsString(parameters, self.OUTPUT_FOLDER, context)
+        )
+
+        try:
+            scenarios = parse_scenarios(scenarios_text or "")
+            if grid_step > 0:
+                scenarios += weight_grid(grid_step)
+        except ValueError as exc:
+            raise QgsProcessingException(str(exc)) from exc
+        if not scenarios:
+            raise QgsProcessingException("Не задано ни одного набора весов.")
+
+        inputs = UndergroundInputs(
+            dem_path=Path(dem_layer.source()),
+            groundwater_path=Path(gw_layer.source()),
+            permeability_path=Path(perm_layer.source()),
+            karst_path=Path(karst_layer.source()),
+            crs_auth_id=dem_layer.crs().authid(),
+        )
+        results = run_weight_scenarios(
+            inputs,
+            scenarios,
+            output_folder,
+            sources_layer,
+            sinks_layer,
+            keep_cost=keep_cost,
+            feedback=feedback,
+        )
+        feedback.pushInfo(f"Сценариев весов: {len(results)}")
+        for result in results:
+            outputs = ", ".join(
+                result[key] for key in ("cost", "paths", "basins") if key in result
+            )
+            feedback.pushInfo(f"{result['name']}: {outputs}")
+        return {self.OUTPUT_FOLDER: str(output_folder)}
+
+    def name(self) -> str:
+        return "underground_scenarios"
+
+    def displayName(self) -> str:
+        return "Сценарии весов подземного стока"
+
+    def group(self) -> str:
+        return "Underground"
+
+    def groupId(self) -> str:
+        return "underground"
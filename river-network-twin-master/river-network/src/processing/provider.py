@@ -1,9 +1,11 @@
 from qgis.core import QgsProcessingProvider
 
 from .algorithms.build_underground_cost import BuildUndergroundCostAlgorithm
+from .algorithms.pour_point_watersheds import PourPointWatershedsAlgorithm
 from .algorithms.protection_zone import ProtectionZoneAlgorithm
 from .algorithms.soil_erosion import SoilErosionAlgorithm
 from .algorithms.underground_paths import UndergroundPathsAlgorithm
+from .algorithms.underground_scenarios import UndergroundScenariosAlgorithm
 from .algorithms.weathering_zones import WeatheringZonesAlgorithm
 
 
@@ -11,9 +13,11 @@ class RiverNetworkProvider(QgsProcessingProvider):
     def loadAlgorithms(self) -> None:
         self.addAlgorithm(BuildUndergroundCostAlgorithm())
         self.addAlgorithm(UndergroundPathsAlgorithm())
+        self.addAlgorithm(UndergroundScenariosAlgorithm())
         self.addAlgorithm(ProtectionZoneAlgorithm())
         self.addAlgorithm(SoilErosionAlgorithm())
         self.addAlgorithm(WeatheringZonesAlgorithm())
+        self.addAlgorithm(PourPointWatershedsAlgorithm())
 
     def id(self) -> str:
         return "rivernetwork"
@@ -51,6 +51,11 @@ class ProgressManager:
         """Проверяет, была ли операция отменена."""
         return self.progress.wasCanceled() if self.progress else False
 
+    def poll_canceled(self) -> bool:
+        """Обрабатывает события GUI и проверяет, была ли операция отменена."""
+        self._keep_active()
+        return self.was_canceled()
+
     def finish(self) -> None:
         """Завершает работу с прогрессом."""
         if self.progress:
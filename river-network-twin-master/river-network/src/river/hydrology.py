@@ -0,0 +1,442 @@
+"""Направления стока D8 и водосборы по точкам замыкания без GRASS.
+
+Все проходы по растру выполняются массивами NumPy; поштучно в Python
+обрабатывается только граф понижений при заполнении DEM. Направления
+определены всюду, кроме выходов на границе растра и у пикселей nodata.
+Растр направлений кэшируется (по умолчанию в папке cache рядом с DEM) и
+переиспользуется при повторных построениях водосборов. Плоские индексы
+пикселей хранятся в int32, а связи «пиксель — притоки» не строятся: метки
+переносятся вверх по течению удвоением указателей, поэтому проходы по
+растру требуют порядка 20 байт памяти на пиксель.
+"""
+
+from __future__ import annotations
+
+import math
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from osgeo import gdal
+
+from src.least_cost_path.cache import (
+    CACHE_DIR_NAME,
+    cache_key,
+    evict_cache,
+    mark_used,
+    remember,
+)
+
+# Направления D8 (di, dj, длина шага). Индекс направления хранится в растре
+# направлений, поэтому порядок элементов менять нельзя.
+D8_DIRECTIONS = (
+    (-1, -1, math.sqrt(2)),
+    (-1, 0, 1.0),
+    (-1, 1, math.sqrt(2)),
+    (0, -1, 1.0),
+    (0, 1, 1.0),
+    (1, -1, math.sqrt(2)),
+    (1, 0, 1.0),
+    (1, 1, math.sqrt(2)),
+)
+NO_FLOW = -1  # Выход с растра или пиксель nodata
+NO_BASIN = 0
+# Входит в ключ кэша направлений; увеличивается при изменении их расчёта,
+# чтобы не использовать растры, посчитанные прежним способом (2 — сток с
+# плоских участков к ближайшему пикселю с выходом)
+FLOW_ROUTING_VERSION = 2
+
+_flow_directions: "OrderedDict[str, Tuple[np.ndarray, Tuple[float, ...], str]]" = (
+    OrderedDict()
+)
+
+
+def read_dem(dem_path: Path) -> Tuple[np.ndarray, np.ndarray, Tuple[float, ...], str]:
+    """Читает DEM: значения float32, маска валидных пикселей, геопривязка и проекция."""
+    dataset = gdal.Open(str(dem_path))
+    band = dataset.GetRasterBand(1)
+    values = band.ReadAsArray().astype(np.float32)
+    valid = np.isfinite(values)
+    nodata = band.GetNoDataValue()
+    if nodata is not None:
+        valid &= values != nodata
+    return values, valid, dataset.GetGeoTransform(), dataset.GetProjection()
+
+
+def _shifted(rows: int, cols: int, di: int, dj: int):
+    """Срезы (откуда, куда) для сдвига растра на (di, dj)."""
+    src = (
+        slice(max(0, di), rows + min(0, di)),
+        slice(max(0, dj), cols + min(0, dj)),
+    )
+    dst = (
+        slice(max(0, -di), rows - max(0, di)),
+        slice(max(0, -dj), cols - max(0, dj)),
+    )
+    return src, dst
+
+
+def _outlet_mask(valid: np.ndarray) -> np.ndarray:
+    """Пиксели, из которых вода может уйти с растра: граница и края nodata."""
+    rows, cols = valid.shape
+    edge = np.zeros((rows, cols), dtype=bool)
+    edge[[0, -1], :] = True
+    edge[:, [0, -1]] = True
+    for di, dj, _ in D8_DIRECTIONS:
+        src, dst = _shifted(rows, cols, di, dj)
+        edge[dst] |= ~valid[src]
+    return edge & valid
+
+
+def _steepest_descent(values: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """Направление D8 строго вниз; NO_FLOW там, где соседей ниже нет."""
+    rows, cols = values.shape
+    best = np.zeros((rows, cols), dtype=np.float32)
+    direction = np.full((rows, cols), NO_FLOW, dtype=np.int8)
+    for k, (di, dj, length) in enumerate(D8_DIRECTIONS):
+        src, dst = _shifted(rows, cols, di, dj)
+        drop = (values[dst] - values[src]) / np.float32(length)
+        better = valid[src] & (drop > best[dst])
+        best[dst][better] = drop[better]
+        direction[dst][better] = k
+    direction[~valid] = NO_FLOW
+    return direction
+
+
+def _index_dtype(size: int) -> type:
+    """Тип плоских индексов: int32, если растр меньше 2**31 пикселей."""
+    return np.int32 if size < 2**31 else np.int64
+
+
+def _inflow(direction: np.ndarray, source: Optional[np.ndarray] = None) -> np.ndarray:
+    """Число соседей, стекающих в каждый пиксель (плоский массив int8).
+
+    ``source`` — маска пикселей, сток которых учитывается.
+    """
+    rows, cols = direction.shape
+    inflow = np.zeros((rows, cols), dtype=np.int8)
+    for k, (di, dj, _) in enumerate(D8_DIRECTIONS):
+        src, dst = _shifted(rows, cols, di, dj)
+        # Пиксель dst с направлением k стекает в соседа src
+        flows = direction[dst] == k
+        if source is not None:
+            flows &= source[dst]
+        inflow[src] += flows
+    return inflow.ravel()
+
+
+def _propagate_upstream(down: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """Распространяет ненулевые метки вверх по течению до других меток.
+
+    Каждый пиксель получает метку ближайшего размеченного пикселя ниже по
+    течению. Он находится удвоением указателей: ``jump`` указывает на
+    пиксель через 1, 2, 4, ... шагов вниз и останавливается на размеченных
+    пикселях и выходах, так что проходов по растру — логарифм длины пути
+    стока, а памяти — два массива индексов. ``labels`` изменяется на месте.
+    """
+    stop = (labels != NO_BASIN) | (down < 0)
+    jump = down.copy()
+    jump[stop] = np.flatnonzero(stop)
+    del stop
+    while True:
+        further = jump[jump]
+        if np.array_equal(further, jump):
+            break
+        jump = further
+    del further
+    labels[:] = labels[jump]
+    return labels
+
+
+def _expand(indptr: np.ndarray, frontier: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Рёбра CSR всех вершин фронта и позиция исходной вершины во фронте."""
+    starts = indptr[frontier]
+    counts = indptr[frontier + 1] - starts
+    origin = np.repeat(np.arange(frontier.size), counts)
+    edges = np.arange(origin.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    return edges + starts[origin], origin
+
+
+def priority_flood(values: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """Заполнение понижений DEM: priority-flood по графу водосборов понижений.
+
+    Пиксели группируются по локальным минимумам, в которые они стекают
+    (направления строго вниз). Для соседних групп находится высота перелива,
+    и priority-flood идёт уже по этому графу от внешней границы растра.
+    Каждый пиксель поднимается до уровня перелива своей группы.
+    """
+    rows, cols = values.shape
+    n = rows * cols
+    # Плоские участки с выходом стекают к нему; пиксели плоских понижений
+    # связываются с соседом той же высоты выше-левее, чтобы каждое такое
+    # понижение давало одну группу, а не по группе на пиксель
+    direction = d8_flow_directions(values, valid)
+    pits = valid & (direction == NO_FLOW) & ~_outlet_mask(valid)
+    for k, (di, dj, _) in enumerate(D8_DIRECTIONS[:4]):
+        src, dst = _shifted(rows, cols, di, dj)
+        take = pits[dst] & (direction[dst] == NO_FLOW) & pits[src]
+        take &= values[src] == values[dst]
+        direction[dst][take] = k
+    down = downstream_pixels(direction)
+
+    # Группа пикселя — номер конечного пикселя его пути стока (с 1)
+    terminals = np.flatnonzero(valid.ravel() & (down < 0))
+    group = np.full(n, NO_BASIN, dtype=np.int32)
+    group[terminals] = np.arange(1, terminals.size + 1, dtype=np.int32)
+    _propagate_upstream(down, group)
+    group = group.reshape(rows, cols)
+    n_groups = terminals.size + 1  # группа 0 — область за пределами растра
+    del direction, pits, down, terminals
+
+    # Высоты перелива между соседними группами и наружу
+    keys, spills = [], []
+    for di, dj, _ in D8_DIRECTIONS[4:]:
+        src, dst = _shifted(rows, cols, di, dj)
+        ga = group[dst]
+        gb = group[src]
+        boundary = valid[dst] & valid[src] & (ga != gb)
+        ga = ga[boundary]
+        gb = gb[boundary]
+        key = np.minimum(ga, gb).astype(np.int64)
+        key *= n_groups
+        key += np.maximum(ga, gb)
+        del ga, gb
+        key, value = _lowest_per_key(
+            key, np.maximum(values[dst][boundary], values[src][boundary])
+        )
+        keys.append(key)
+        spills.append(value)
+    outlets = _outlet_mask(valid)
+    keys.append(group[outlets].astype(np.int64))
+    spills.append(values[outlets])
+    keys, spill = _lowest_per_key(np.concatenate(keys), np.concatenate(spills))
+    a, b = np.divmod(keys, n_groups)
+
+    # Уровень группы — минимакс-путь до внешней области. Уровни уточняются
+    # фронтом: после каждого шага дальше идут только изменившиеся группы
+    edge_u = np.concatenate([a, b])
+    order = np.argsort(edge_u, kind="stable")
+    neighbours = np.concatenate([b, a])[order]
+    weights = np.concatenate([spill, spill])[order]
+    indptr = np.zeros(n_groups + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edge_u, minlength=n_groups), out=indptr[1:])
+
+    level = np.full(n_groups, np.inf, dtype=np.float32)
+    level[0] = -np.inf
+    frontier = np.zeros(1, dtype=np.int64)
+    while frontier.size:
+        edges, origin = _expand(indptr, frontier)
+        targets = neighbours[edges]
+        candidate = np.maximum(level[frontier][origin], weights[edges])
+        better = candidate < level[targets]
+        targets = targets[better]
+        np.minimum.at(level, targets, candidate[better])
+        frontier = np.unique(targets)
+
+    filled = np.maximum(values, level[group])
+    filled[~valid] = values[~valid]
+    return filled
+
+
+def _lowest_per_key(
+    keys: np.ndarray, values: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Уникальные ключи и наименьшее значение для каждого из них."""
+    order = np.argsort(keys)
+    keys = keys[order]
+    values = values[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[starts], np.minimum.reduceat(values, starts)
+
+
+def d8_flow_directions(filled: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """Направления D8 по заполненному DEM, включая пиксели плоских участков.
+
+    Пиксели без соседа ниже (кроме выходов на границе) направляются к
+    ближайшему по числу шагов пикселю той же высоты, у которого сток уже
+    определён, — обход в ширину от краёв плоского участка.
+    """
+    rows, cols = filled.shape
+    direction = _steepest_descent(filled, valid)
+    unresolved = valid & (direction == NO_FLOW) & ~_outlet_mask(valid)
+
+    # Первый слой: соседи плоских пикселей, у которых сток уже есть
+    fresh = np.zeros((rows, cols), dtype=bool)
+    for k, (di, dj, _) in enumerate(D8_DIRECTIONS):
+        src, dst = _shifted(rows, cols, di, dj)
+        take = (
+            unresolved[dst]
+            & ~fresh[dst]
+            & ~unresolved[src]
+            & valid[src]
+            & (filled[src] == filled[dst])
+        )
+        direction[dst][take] = k
+        fresh[dst] |= take
+    unresolved &= ~fresh
+
+    heights = filled.ravel()
+    flat_dir = direction.reshape(-1)
+    open_cells = unresolved.ravel()
+    frontier = np.flatnonzero(fresh.ravel())
+    steps = [(di, dj, di * cols + dj) for di, dj, _ in D8_DIRECTIONS]
+    while frontier.size:
+        fi, fj = np.divmod(frontier, cols)
+        found, toward = [], []
+        for k, (di, dj, step) in enumerate(steps):
+            inside = (fi + di >= 0) & (fi + di < rows) & (fj + dj >= 0) & (fj + dj < cols)
+            u = frontier[inside]
+            v = u + step
+            take = open_cells[v] & (heights[v] == heights[u])
+            found.append(v[take])
+            # Из v вода течёт обратно в u: противоположное направление
+            toward.append(np.full(int(take.sum()), len(steps) - 1 - k, dtype=np.int8))
+        found = np.concatenate(found)
+        toward = np.concatenate(toward)
+        found, first = np.unique(found, return_index=True)
+        flat_dir[found] = toward[first]
+        open_cells[found] = False
+        frontier = found
+    return direction
+
+
+def downstream_pixels(direction: np.ndarray) -> np.ndarray:
+    """Плоский индекс пикселя ниже по течению (-1 для выходов и nodata)."""
+    rows, cols = direction.shape
+    dtype = _index_dtype(direction.size)
+    # Последний элемент соответствует NO_FLOW (индекс -1)
+    offsets = np.zeros(len(D8_DIRECTIONS) + 1, dtype=dtype)
+    offsets[:-1] = [di * cols + dj for di, dj, _ in D8_DIRECTIONS]
+    flat = direction.ravel()
+    down = np.arange(flat.size, dtype=dtype)
+    down += offsets[flat]
+    down[flat == NO_FLOW] = -1
+    return down
+
+
+def flow_accumulation(direction: np.ndarray) -> np.ndarray:
+    """Число пикселей, стекающих через каждый пиксель (включая его самого).
+
+    Пиксели обрабатываются слоями от истоков: пиксель попадает в слой,
+    когда обработаны все его притоки.
+    """
+    down = downstream_pixels(direction)
+    inflow = _inflow(direction)
+    accumulation = np.ones(down.size, dtype=np.int32)
+    frontier = np.flatnonzero(inflow == 0).astype(down.dtype)
+    while frontier.size:
+        targets = down[frontier]
+        moving = targets >= 0
+        targets = targets[moving]
+        np.add.at(accumulation, targets, accumulation[frontier[moving]])
+        np.subtract.at(inflow, targets, 1)
+        targets = np.unique(targets)
+        frontier = targets[inflow[targets] == 0]
+    return accumulation.reshape(direction.shape)
+
+
+def delineate_watersheds(
+    direction: np.ndarray, pour_pixels: Sequence[int]
+) -> np.ndarray:
+    """Водосборы точек замыкания за один проход вверх по течению.
+
+    Возвращает растр номеров: ``k + 1`` для водосбора ``pour_pixels[k]``,
+    NO_BASIN для пикселей, не стекающих ни в одну из точек. Если одна точка
+    лежит выше другой, её водосбор вырезается из водосбора нижней.
+    """
+    down = downstream_pixels(direction)
+    labels = np.full(down.size, NO_BASIN, dtype=np.int32)
+    pour = np.asarray(pour_pixels, dtype=np.int64)
+    # При совпадении пикселей остаётся номер первой точки
+    labels[pour[::-1]] = np.arange(len(pour), 0, -1, dtype=np.int32)
+    return _propagate_upstream(down, labels).reshape(direction.shape)
+
+
+def label_basins(
+    direction: np.ndarray, accumulation: np.ndarray, threshold: int
+) -> np.ndarray:
+    """Водосборы участков водотоков, как ``basin`` в r.watershed.
+
+    Водоток — пиксели с накоплением не меньше ``threshold``. Участок
+    водотока идёт от истока или слияния до следующего слияния; каждый
+    участок и всё, что в него стекает, получает свой номер.
+    """
+    down = downstream_pixels(direction)
+    stream = accumulation.ravel() >= threshold
+    stream_inflow = _inflow(direction, stream.reshape(direction.shape))
+
+    # Участок начинается в истоке и в каждом слиянии
+    starts = np.flatnonzero(stream & (stream_inflow != 1))
+    labels = np.full(down.size, NO_BASIN, dtype=np.int32)
+    labels[starts] = np.arange(1, starts.size + 1, dtype=np.int32)
+    frontier = starts
+    while frontier.size:
+        nxt = down[frontier]
+        keep = nxt >= 0
+        keep[keep] = stream[nxt[keep]] & (labels[nxt[keep]] == NO_BASIN)
+        labels[nxt[keep]] = labels[frontier[keep]]
+        frontier = nxt[keep]
+    return _propagate_upstream(down, labels).reshape(direction.shape)
+
+
+def cached_flow_directions(
+    dem_path: Path, cache_dir: Optional[Path] = None
+) -> Tuple[np.ndarray, Tuple[float, ...], str]:
+    """Растр направлений D8 для DEM; хранится в GeoTIFF в ``cache_dir``.
+
+    По умолчанию — папка cache рядом с DEM. Для DEM во временном файле
+    нужно передать постоянную папку, иначе кэш не будет найден: ключ
+    строится по содержимому DEM, а не по его пути.
+    """
+    key = cache_key(dem_path, kind="flowdir", routing=FLOW_ROUTING_VERSION)
+    if key in _flow_directions:
+        _flow_directions.move_to_end(key)
+        return _flow_directions[key]
+
+    if cache_dir is None:
+        cache_dir = Path(dem_path).parent / CACHE_DIR_NAME
+    path = Path(cache_dir) / f"flowdir_{key}.tif"
+    if path.exists():
+        mark_used(path)
+        dataset = gdal.Open(str(path))
+        direction = dataset.GetRasterBand(1).ReadAsArray().astype(np.int8)
+        result = (direction, dataset.GetGeoTransform(), dataset.GetProjection())
+    else:
+        values, valid, gt, projection = read_dem(dem_path)
+        direction = d8_flow_directions(priority_flood(values, valid), valid)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_raster(path, direction, gt, projection, gdal.GDT_Int16, NO_FLOW)
+        evict_cache(path.parent)
+        result = (direction, gt, projection)
+
+    remember(_flow_directions, key, result)
+    return result
+
+
+def write_raster(
+    path: Path,
+    array: np.ndarray,
+    gt: Sequence[float],
+    projection: str,
+    data_type: int,
+    nodata: float,
+) -> Path:
+    """Сохраняет массив в сжатый GeoTIFF."""
+    driver = gdal.GetDriverByName("GTiff")
+    dataset = driver.Create(
+        str(path),
+        array.shape[1],
+        array.shape[0],
+        1,
+        data_type,
+        options=["COMPRESS=DEFLATE", "TILED=YES"],
+    )
+    dataset.SetGeoTransform(tuple(gt))
+    dataset.SetProjection(projection)
+    band = dataset.GetRasterBand(1)
+    band.SetNoDataValue(nodata)
+    band.WriteArray(array)
+    band.FlushCache()
+    dataset = None
+    return Path(path)
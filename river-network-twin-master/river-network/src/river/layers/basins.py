@@ -1,24 +1,37 @@
 from pathlib import Path
-import processing
+from typing import Optional
+
+from osgeo import gdal
 from qgis.core import QgsRasterLayer
 
+from src.river.hydrology import (
+    NO_BASIN,
+    cached_flow_directions,
+    flow_accumulation,
+    label_basins,
+    write_raster,
+)
+
+BASIN_THRESHOLD = 1000  # Минимальная площадь водосбора водотока, пикселей
+
 
-def build_basins_layer(reprojected_relief, basins_path: Path) -> QgsRasterLayer:
-    """Заполняет DEM.
+def build_basins_layer(
+    reprojected_relief,
+    basins_path: Path,
+    threshold: int = BASIN_THRESHOLD,
+    cache_dir: Optional[Path] = None,
+) -> QgsRasterLayer:
+    """Заполняет DEM, считает направления и накопление стока и строит водосборы.
 
-    Считает потоковые направления и строит водосборы через GRASS r.watershed (аналог SAGA FillSinks + Watershed).
+    Водосбор строится для каждого участка водотока между слияниями, как
+    ``basin`` в r.watershed (аналог SAGA FillSinks + Watershed). Направления
+    кэшируются в ``cache_dir`` (см. cached_flow_directions).
     """
-    processing.run(
-        "grass7:r.watershed",
-        {
-            "elevation": reprojected_relief,
-            "threshold": 1000,
-            "basin": str(basins_path),
-            "memory": 300,  # MB для GRASS
-            "GRASS_REGION_PARAMETER": None,
-            "GRASS_RASTER_FORMAT_OPT": "",
-            "GRASS_RASTER_FORMAT_META": "",
-        },
+    direction, gt, projection = cached_flow_directions(
+        Path(reprojected_relief), cache_dir
     )
+    accumulation = flow_accumulation(direction)
+    basins = label_basins(direction, accumulation, threshold)
+    write_raster(basins_path, basins, gt, projection, gdal.GDT_Int32, NO_BASIN)
     # Сохранить и добавить заполненные области водосбора в проект
     return QgsRasterLayer(str(basins_path), "basins")
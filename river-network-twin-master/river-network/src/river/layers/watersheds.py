@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+import processing
+from osgeo import gdal
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransform,
+    QgsProject,
+    QgsRasterLayer,
+    QgsVectorLayer,
+)
+
+from src.least_cost_path.grid import coords_to_pixels
+from src.river.hydrology import (
+    NO_BASIN,
+    cached_flow_directions,
+    delineate_watersheds,
+    write_raster,
+)
+
+
+def build_pour_point_watersheds(
+    dem_path: Path,
+    pour_points_layer: QgsVectorLayer,
+    labels_path: Path,
+    polygons_path: Path,
+    layer_name: str = "watersheds",
+) -> Tuple[QgsRasterLayer, QgsVectorLayer]:
+    """Строит водосборы точек замыкания по направлениям стока D8.
+
+    Args:
+        dem_path: DEM, по которому считаются (или берутся из кэша) направления
+        pour_points_layer: Точки замыкания (устья рек, MaxHeightPoints и т.п.)
+        labels_path: GeoTIFF с номерами водосборов
+        polygons_path: GeoPackage с полигонами водосборов
+
+    Returns:
+        Tuple[QgsRasterLayer, QgsVectorLayer]: Растр и полигоны водосборов;
+        поле ``basin_id`` равно порядковому номеру точки, начиная с 1
+    """
+    direction, gt, projection = cached_flow_directions(dem_path)
+    rows, cols = direction.shape
+
+    transform = QgsCoordinateTransform(
+        pour_points_layer.crs(),
+        QgsCoordinateReferenceSystem.fromWkt(projection),
+        QgsProject.instance(),
+    )
+    xs, ys = [], []
+    for feat in pour_points_layer.getFeatures():
+        pt = transform.transform(feat.geometry().asPoint())
+        xs.append(pt.x())
+        ys.append(pt.y())
+    i, j = coords_to_pixels(xs, ys, gt)
+    inside = (i >= 0) & (i < rows) & (j >= 0) & (j < cols)
+    pour_pixels = (i * cols + j)[inside]
+
+    labels = delineate_watersheds(direction, pour_pixels)
+    # Номера водосборов соответствуют номерам точек во входном слое
+    point_ids = np.flatnonzero(inside).astype(np.int32) + 1
+    labels = np.where(labels == NO_BASIN, NO_BASIN, point_ids[labels - 1])
+    write_raster(labels_path, labels, gt, projection, gdal.GDT_Int32, NO_BASIN)
+
+    processing.run(
+        "gdal:polygonize",
+        {
+            "INPUT": str(labels_path),
+            "BAND": 1,
+            "FIELD": "basin_id",
+            "EIGHT_CONNECTEDNESS": True,
+            "OUTPUT": str(polygons_path),
+        },
+    )
+    return (
+        QgsRasterLayer(str(labels_path), f"{layer_name}_raster"),
+        QgsVectorLayer(str(polygons_path), layer_name, "ogr"),
+    )
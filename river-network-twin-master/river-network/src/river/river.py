@@ -28,6 +28,7 @@ from src.common import (
     set_project_crs,
     transform_coordinates,
 )
+from src.least_cost_path.cache import CACHE_DIR_NAME
 from src.progress_manager import ProgressManager
 
 from .layers.basins import build_basins_layer
@@ -121,8 +122,14 @@ def river(project_folder: Path, with_clustering) -> None:
         # Анализ водосборных бассейнов
         if not progress.update(20, "Анализ водосборных бассейнов"):
             return
-        basins_path = Path(project_folder) / "basins.sdat"
-        basins = build_basins_layer(reprojected_relief, basins_path)
+        basins_path = Path(project_folder) / "basins.tif"
+        # DEM перепроецирован во временный файл, поэтому направления стока
+        # кэшируются в папке проекта
+        basins = build_basins_layer(
+            reprojected_relief,
+            basins_path,
+            cache_dir=Path(project_folder) / CACHE_DIR_NAME,
+        )
         QgsProject.instance().addMapLayer(basins)
 
         # Анализ речной сети
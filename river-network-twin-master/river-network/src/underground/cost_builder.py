@@ -1,45 +1,159 @@
 from __future__ import annotations
 
+import os
 from pathlib import Path
+from typing import Dict, Iterator, List, Sequence, Tuple
 
 import numpy as np
 from osgeo import gdal
 
+from src.least_cost_path.cache import CACHE_DIR_NAME, cache_key, evict_cache, mark_used
+
 from .config import UndergroundCostWeights, UndergroundInputs
 
+# Высота полосы строк, обрабатываемой за раз; кратна размеру тайла GeoTIFF
+BLOCK_ROWS = 512
+TILE_SIZE = 256
+# Порядок факторов в кэше совпадает с порядком слагаемых в weighted_cost
+FACTOR_NAMES = ("slope", "perm", "karst", "depth")
+# Сколько выходных растров сценариев открыто одновременно
+SCENARIO_CHUNK = 8
+
 
 def build_cost_raster(
     inputs: UndergroundInputs,
     weights: UndergroundCostWeights,
     output_path: Path,
+    block_rows: int = BLOCK_ROWS,
 ) -> Path:
+    """Растр стоимости подземного стока, посчитанный полосами строк.
+
+    Первый проход собирает минимумы и максимумы факторов для нормировки,
+    второй считает взвешенную стоимость и пишет её в тайловый сжатый
+    GeoTIFF. Для градиента уровня грунтовых вод к полосе читается по строке
+    сверху и снизу, поэтому результат совпадает с расчётом по целому растру,
+    а в памяти одновременно находится только одна полоса.
+    """
+    dem, bands = _open_bands(inputs)
+    rows = dem.RasterYSize
+    ranges = _factor_ranges(bands, rows, block_rows)
+
+    out_ds = _create_output(dem, output_path)
+    out_band = out_ds.GetRasterBand(1)
+    for r0, r1 in _strips(rows, block_rows):
+        factors = _normalized_strip(bands, ranges, r0, r1, rows)
+        out_band.WriteArray(weighted_cost(weights, factors), 0, r0)
+    out_band.FlushCache()
+    out_ds = None
+    return output_path
+
+
+def build_cost_scenarios(
+    inputs: UndergroundInputs,
+    scenarios: Sequence[UndergroundCostWeights],
+    output_paths: Sequence[Path],
+    block_rows: int = BLOCK_ROWS,
+    chunk: int = SCENARIO_CHUNK,
+) -> List[Path]:
+    """Растры стоимости для набора весов за одно чтение факторов.
+
+    Стоимость линейна по нормированным факторам, поэтому факторы
+    нормируются один раз (normalized_factors), а каждый сценарий — это
+    взвешенная сумма четырёх слоёв. Сценарии обрабатываются группами по
+    ``chunk`` файлов: полоса кэша читается один раз на группу, а открытыми
+    одновременно остаются только её выходные растры.
+    """
+    if len(scenarios) != len(output_paths):
+        raise ValueError("Число сценариев не совпадает с числом выходных файлов")
+    resolved = [Path(path).resolve() for path in output_paths]
+    if len(set(resolved)) != len(resolved):
+        raise ValueError("Выходные файлы сценариев повторяются")
+    factors = normalized_factors(inputs, block_rows)
     dem = gdal.Open(str(inputs.dem_path))
-    gw = gdal.Open(str(inputs.groundwater_path))
-    permeability = gdal.Open(str(inputs.permeability_path))
-    karst = gdal.Open(str(inputs.karst_path))
+    rows = dem.RasterYSize
+
+    for c0 in range(0, len(scenarios), chunk):
+        group = list(zip(scenarios[c0 : c0 + chunk], output_paths[c0 : c0 + chunk]))
+        outputs = [_create_output(dem, path) for _, path in group]
+        bands = [ds.GetRasterBand(1) for ds in outputs]
+        for r0, r1 in _strips(rows, block_rows):
+            strip = np.asarray(factors[:, r0:r1])
+            for (weights, _), band in zip(group, bands):
+                band.WriteArray(weighted_cost(weights, strip), 0, r0)
+        for band in bands:
+            band.FlushCache()
+        outputs = bands = None
+    return list(output_paths)
+
+
+def normalized_factors(
+    inputs: UndergroundInputs, block_rows: int = BLOCK_ROWS
+) -> np.ndarray:
+    """Нормированные факторы стоимости, shape ``(4, rows, cols)``, float32.
 
-    dem_arr = dem.GetRasterBand(1).ReadAsArray().astype("float32")
-    gw_arr = gw.GetRasterBand(1).ReadAsArray().astype("float32")
-    perm_arr = permeability.GetRasterBand(1).ReadAsArray().astype("float32")
-    karst_arr = karst.GetRasterBand(1).ReadAsArray().astype("float32")
+    Проницаемость и карст уже обращены (``1 - norm``), так что стоимость —
+    взвешенная сумма факторов (weighted_cost). Результат хранится в
+    папке кэша рядом с DEM и открывается как memmap без повторного чтения
+    исходных растров.
+    """
+    key = cache_key(
+        inputs.dem_path,
+        inputs.groundwater_path,
+        inputs.permeability_path,
+        inputs.karst_path,
+        kind="underground_factors",
+    )
+    path = Path(inputs.dem_path).parent / CACHE_DIR_NAME / f"underground_factors_{key}.npy"
+    if path.exists():
+        mark_used(path)
+        return np.load(path, mmap_mode="r")
+
+    dem, bands = _open_bands(inputs)
+    rows, cols = dem.RasterYSize, dem.RasterXSize
+    ranges = _factor_ranges(bands, rows, block_rows)
 
-    slope_x, slope_y = np.gradient(gw_arr)
-    slope = np.abs(slope_x) + np.abs(slope_y)
-    slope = normalize_array(slope)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_suffix(".part.npy")
+    factors = np.lib.format.open_memmap(
+        partial, mode="w+", dtype=np.float32, shape=(len(FACTOR_NAMES), rows, cols)
+    )
+    for r0, r1 in _strips(rows, block_rows):
+        factors[:, r0:r1] = _normalized_strip(bands, ranges, r0, r1, rows)
+    factors.flush()
+    del factors
+    # Недописанный файл не должен попасть в кэш
+    os.replace(partial, path)
+    evict_cache(path.parent)
+    return np.load(path, mmap_mode="r")
 
-    perm_norm = 1.0 - normalize_array(perm_arr)
-    karst_norm = 1.0 - normalize_array(karst_arr)
 
-    depth = dem_arr - gw_arr
-    depth_penalty = normalize_array(np.clip(depth, 0, None))
+def weighted_cost(weights: UndergroundCostWeights, factors: np.ndarray) -> np.ndarray:
+    """Стоимость по нормированным факторам в порядке FACTOR_NAMES.
 
-    cost = (
+    Слагаемые складываются в том же порядке и в той же точности float32, что
+    и в расчёте по целому растру, поэтому результат совпадает с ним побитно.
+    """
+    slope, perm, karst, depth = factors
+    return (
         weights.slope * slope
-        + weights.permeability * perm_norm
-        + weights.karst * karst_norm
-        + weights.depth * depth_penalty
+        + weights.permeability * perm
+        + weights.karst * karst
+        + weights.depth * depth
     ).astype("float32")
 
+
+def _open_bands(inputs: UndergroundInputs):
+    dem = gdal.Open(str(inputs.dem_path))
+    bands = {
+        "dem": dem.GetRasterBand(1),
+        "gw": gdal.Open(str(inputs.groundwater_path)).GetRasterBand(1),
+        "perm": gdal.Open(str(inputs.permeability_path)).GetRasterBand(1),
+        "karst": gdal.Open(str(inputs.karst_path)).GetRasterBand(1),
+    }
+    return dem, bands
+
+
+def _create_output(dem, output_path: Path):
     driver = gdal.GetDriverByName("GTiff")
     out_ds = driver.Create(
         str(output_path),
@@ -47,19 +161,79 @@ def build_cost_raster(
         dem.RasterYSize,
         1,
         gdal.GDT_Float32,
+        options=[
+            "TILED=YES",
+            f"BLOCKXSIZE={TILE_SIZE}",
+            f"BLOCKYSIZE={TILE_SIZE}",
+            "COMPRESS=DEFLATE",
+            "BIGTIFF=IF_SAFER",
+        ],
     )
     out_ds.SetGeoTransform(dem.GetGeoTransform())
     out_ds.SetProjection(dem.GetProjection())
-    out_ds.GetRasterBand(1).WriteArray(cost)
-    out_ds.FlushCache()
-    out_ds = None
-    return output_path
+    return out_ds
+
+
+def _strips(rows: int, block_rows: int) -> Iterator[Tuple[int, int]]:
+    for r0 in range(0, rows, block_rows):
+        yield r0, min(rows, r0 + block_rows)
+
+
+def _read_rows(band, r0: int, r1: int) -> np.ndarray:
+    return band.ReadAsArray(0, r0, band.XSize, r1 - r0).astype("float32")
 
 
-def normalize_array(arr: np.ndarray) -> np.ndarray:
-    arr_min = np.nanmin(arr)
-    arr_max = np.nanmax(arr)
+def _factors(bands, r0: int, r1: int, rows: int) -> Dict[str, np.ndarray]:
+    """Ненормированные факторы стоимости для строк ``r0:r1``."""
+    # Соседние строки нужны центральным разностям на краях полосы
+    h0, h1 = max(0, r0 - 1), min(rows, r1 + 1)
+    gw_halo = _read_rows(bands["gw"], h0, h1)
+    slope_x, slope_y = np.gradient(gw_halo)
+    inner = slice(r0 - h0, r0 - h0 + (r1 - r0))
+    slope = np.abs(slope_x[inner]) + np.abs(slope_y[inner])
+    gw = gw_halo[inner]
+    return {
+        "slope": slope,
+        "perm": _read_rows(bands["perm"], r0, r1),
+        "karst": _read_rows(bands["karst"], r0, r1),
+        "depth": np.clip(_read_rows(bands["dem"], r0, r1) - gw, 0, None),
+    }
+
+
+def _factor_ranges(bands, rows: int, block_rows: int) -> Dict[str, Tuple[float, float]]:
+    """Глобальные минимумы и максимумы факторов по всем полосам."""
+    ranges = {name: (np.inf, -np.inf) for name in FACTOR_NAMES}
+    for r0, r1 in _strips(rows, block_rows):
+        for name, values in _factors(bands, r0, r1, rows).items():
+            low, high = ranges[name]
+            ranges[name] = (
+                min(low, float(np.nanmin(values))),
+                max(high, float(np.nanmax(values))),
+            )
+    return ranges
+
+
+def _normalized_strip(bands, ranges, r0: int, r1: int, rows: int) -> np.ndarray:
+    """Нормированные факторы полосы в порядке FACTOR_NAMES."""
+    factors = _factors(bands, r0, r1, rows)
+    return np.stack(
+        [
+            normalize_array(factors["slope"], *ranges["slope"]),
+            1.0 - normalize_array(factors["perm"], *ranges["perm"]),
+            1.0 - normalize_array(factors["karst"], *ranges["karst"]),
+            normalize_array(factors["depth"], *ranges["depth"]),
+        ]
+    ).astype("float32")
+
+
+def normalize_array(
+    arr: np.ndarray, arr_min: float = None, arr_max: float = None
+) -> np.ndarray:
+    """Приводит значения к [0, 1]; границы по умолчанию — по самому массиву."""
+    if arr_min is None:
+        arr_min = np.nanmin(arr)
+    if arr_max is None:
+        arr_max = np.nanmax(arr)
     if arr_max - arr_min == 0:
         return np.zeros_like(arr, dtype="float32")
     return ((arr - arr_min) / (arr_max - arr_min)).astype("float32")
-
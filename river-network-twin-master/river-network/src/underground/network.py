@@ -1,65 +1,68 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Dict, List, Sequence, Tuple
+from typing import List, Optional, Sequence, Tuple
 
 import networkit as nk
+import numpy as np
 from osgeo import gdal
 from qgis.core import (
     QgsCoordinateReferenceSystem,
     QgsFeature,
     QgsGeometry,
-    QgsPointXY,
+    QgsLineString,
     QgsProject,
     QgsVectorLayer,
 )
-from src.least_cost_path.least_cost_path import pixel_to_coord
+from src.least_cost_path.grid import NodeIndex, grid_edges
+from src.least_cost_path.grid_search import MEAN_COST, load_cost_grid
 from src.least_cost_path.layers.output_least_cost_path import build_output_least_cost_path
+from src.least_cost_path.parallel import DEFAULT_WORKERS, iter_parallel
+from src.least_cost_path.path_encoding import encode_chain, path_vertices
+from src.least_cost_path.sssp import SearchBounds, paths_from_source
 from src.underground.datasource import features_to_nodes
 
+PATH_WRITE_BATCH = 10000  # Сколько путей записывается в GPKG за один вызов
 
-def build_cost_graph(raster_path: Path) -> Tuple[nk.Graph, Tuple[float, ...], int, int]:
+
+def build_cost_graph(
+    raster_path: Path,
+) -> Tuple[nk.Graph, Tuple[float, ...], int, int, NodeIndex]:
+    """Граф стоимости со средней стоимостью концов ребра в качестве веса.
+
+    Возвращает то же, что least_cost_path.build_cost_graph: граф, геопривязку,
+    размеры растра и нумерацию узлов. Проходимы все пиксели, поэтому номер
+    узла совпадает с индексом пикселя.
+    """
     dataset = gdal.Open(str(raster_path))
     arr = dataset.GetRasterBand(1).ReadAsArray().astype("float32")
     rows, cols = arr.shape
-    graph = nk.Graph(rows * cols, weighted=True, directed=False)
-    neighbors = [
-        (1, 0, 1.0),
-        (0, 1, 1.0),
-        (1, 1, 2**0.5),
-        (1, -1, 2**0.5),
-    ]
-
-    def node_id(i: int, j: int) -> int:
-        return i * cols + j
-
-    for i in range(rows):
-        for j in range(cols):
-            for di, dj, factor in neighbors:
-                ni, nj = i + di, j + dj
-                if 0 <= ni < rows and 0 <= nj < cols:
-                    weight = factor * (arr[i, j] + arr[ni, nj]) / 2
-                    graph.addEdge(node_id(i, j), node_id(ni, nj), float(weight))
-
-    return graph, dataset.GetGeoTransform(), rows, cols
-
-
-def add_paths_to_layer(
-    layer,
+
+    index = NodeIndex.from_mask(np.ones(arr.shape, dtype=bool))
+    sources, targets, factors = grid_edges(np.ones(arr.shape, dtype=bool), index)
+    flat = arr.ravel().astype("float64")
+    weights = factors * (flat[sources] + flat[targets]) / 2
+    graph = nk.GraphFromCoo(
+        (weights, (sources, targets)), n=index.size, weighted=True, directed=False
+    )
+
+    return graph, dataset.GetGeoTransform(), rows, cols, index
+
+
+def path_feature(
+    fields,
     node_path: Sequence[int],
     cols: int,
     geotransform: Sequence[float],
     start_id: int,
     end_id: int,
-):
-    geometry = [
-        QgsPointXY(*pixel_to_coord(idx // cols, idx % cols, geotransform))
-        for idx in node_path
-    ]
-    feature = QgsFeature(layer.fields())
-    feature.setAttributes([start_id, end_id])
-    feature.setGeometry(QgsGeometry.fromPolylineXY(geometry))
-    layer.dataProvider().addFeature(feature)
+    simplify_tolerance: float = 0.0,
+) -> QgsFeature:
+    xs, ys = path_vertices(node_path, cols, geotransform, simplify_tolerance)
+    feature = QgsFeature(fields)
+    feature.setAttributes([start_id, end_id, encode_chain(node_path, cols)])
+    feature.setGeometry(QgsGeometry(QgsLineString(xs.tolist(), ys.tolist())))
+    return feature
 
 
 def _update(progress, value, message):
@@ -75,8 +78,28 @@ def run_network_analysis(
     output_path: Path,
     crs_auth_id: str,
     progress=None,
+    workers: int = DEFAULT_WORKERS,
+    engine: str = "graph",
+    bounds: Optional[SearchBounds] = None,
+    simplify_tolerance: float = 0.0,
 ) -> QgsVectorLayer:
-    graph, geotransform, rows, cols = build_cost_graph(cost_raster)
+    """Пути наименьшей стоимости от каждого источника до каждого стока.
+
+    Граф неориентированный, поэтому деревья путей строятся с той стороны
+    (источники или стоки), где точек меньше; пути от стоков разворачиваются.
+    Каждое дерево живёт только пока из него извлекаются пути, а готовые
+    объекты пишутся в слой пачками по PATH_WRITE_BATCH, так что память
+    ограничена ``workers`` деревьями и буфером записи. С ``engine="grid"``
+    пути ищутся прямо по растру без графа: памяти нужно меньше, но поиск
+    медленнее.
+    """
+    graph = grid = index = None
+    if engine == "grid":
+        grid = load_cost_grid(cost_raster, edge_weight=MEAN_COST)
+        grid.implicit_search = True
+        geotransform, rows, cols = grid.geotransform, grid.rows, grid.cols
+    else:
+        graph, geotransform, rows, cols, index = build_cost_graph(cost_raster)
 
     dataset = gdal.Open(str(cost_raster))
     raster_crs = QgsCoordinateReferenceSystem(dataset.GetProjection())
@@ -89,42 +112,51 @@ def run_network_analysis(
         crs_auth_id=crs_auth_id,
     )
 
-    dijkstras: Dict[int, nk.distance.Dijkstra] = {}
-    total = len(source_nodes) * len(sink_nodes)
-    processed = 0
-    for src_idx, src_node in enumerate(source_nodes):
-        if progress and progress.was_canceled():
-            break
+    reverse = len(sink_nodes) < len(source_nodes)
+    roots, leaves = (sink_nodes, source_nodes) if reverse else (source_nodes, sink_nodes)
+    root_name = "стока" if reverse else "источника"
+
+    def solve(root_node: int) -> List[List[int]]:
+        return paths_from_source(
+            root_node,
+            leaves,
+            cols,
+            graph=graph,
+            grid=grid,
+            bounds=bounds,
+            index=index,
+        )
+
+    dp = path_layer.dataProvider()
+    fields = path_layer.fields()
+    batch = []
+    is_canceled = progress.poll_canceled if progress is not None else None
+    for root_idx, _, paths in iter_parallel(solve, roots, workers, is_canceled):
         _update(
             progress,
-            40 + int(40 * src_idx / max(1, len(source_nodes))),
-            f"Пути от источника {src_idx + 1}/{len(source_nodes)}",
+            40 + int(40 * (root_idx + 1) / max(1, len(roots))),
+            f"Пути от {root_name} {root_idx + 1}/{len(roots)}",
         )
-        if src_node not in dijkstras:
-            dijk = nk.distance.Dijkstra(graph, src_node, storePaths=True)
-            dijk.run()
-            dijkstras[src_node] = dijk
-        else:
-            dijk = dijkstras[src_node]
-        for sink_idx, sink_node in enumerate(sink_nodes):
-            processed += 1
-            if processed % 10 == 0:
-                _update(
-                    progress,
-                    40 + int(40 * processed / max(1, total)),
-                    f"Комбинации {processed}/{total}",
-                )
-            path = dijk.getPath(sink_node)
+        for leaf_idx, path in enumerate(paths):
             if len(path) < 2:
                 continue
-            add_paths_to_layer(
-                path_layer,
-                path,
-                cols,
-                geotransform,
-                start_id=src_idx + 1,
-                end_id=sink_idx + 1,
+            src_idx, sink_idx = (leaf_idx, root_idx) if reverse else (root_idx, leaf_idx)
+            batch.append(
+                path_feature(
+                    fields,
+                    path[::-1] if reverse else path,
+                    cols,
+                    geotransform,
+                    start_id=src_idx + 1,
+                    end_id=sink_idx + 1,
+                    simplify_tolerance=simplify_tolerance,
+                )
             )
+            if len(batch) >= PATH_WRITE_BATCH:
+                dp.addFeatures(batch)
+                batch = []
+    if batch:
+        dp.addFeatures(batch)
 
     path_layer.updateExtents()
     QgsProject.instance().addMapLayer(path_layer)
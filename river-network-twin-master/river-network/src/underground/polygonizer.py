@@ -1,21 +1,60 @@
 from __future__ import annotations
 
 from pathlib import Path
+from typing import Optional
 
+import numpy as np
 import processing
-from qgis.core import QgsProject, QgsVectorLayer
-
-
-def polygonize_paths(path_layer: QgsVectorLayer, output_path: Path) -> QgsVectorLayer:
-    dissolve = processing.run(
-        "native:dissolve",
-        {"INPUT": path_layer, "OUTPUT": "TEMPORARY_OUTPUT"},
-    )["OUTPUT"]
-    polygons = processing.run(
-        "native:polygonize",
-        {"INPUT": dissolve, "OUTPUT": str(output_path)},
-    )["OUTPUT"]
+from osgeo import gdal
+from qgis.core import QgsCoordinateReferenceSystem, QgsProject, QgsVectorLayer
+
+from src.least_cost_path.grid_search import MEAN_COST, load_cost_grid, shortest_path_tree
+from src.river.hydrology import NO_BASIN, write_raster
+from src.underground.datasource import features_to_nodes
+
+
+def allocate_basins(
+    cost_raster: Path,
+    sinks_layer: QgsVectorLayer,
+    output_path: Path,
+    labels_path: Optional[Path] = None,
+) -> QgsVectorLayer:
+    """Подземные водосборы как зоны стоков с наименьшей накопленной стоимостью.
+
+    Один проход Дейкстры от всех стоков сразу относит каждый пиксель к стоку,
+    до которого путь дешевле всего; растр номеров стоков полигонизуется один
+    раз. Время зависит от размера растра, а не от числа пар источник — сток.
+    Поле ``sink_id`` совпадает с ``end_id`` в слое подземных путей.
+    """
+    grid = load_cost_grid(cost_raster, edge_weight=MEAN_COST)
+    dataset = gdal.Open(str(cost_raster))
+    projection = dataset.GetProjection()
+    sink_nodes = features_to_nodes(
+        sinks_layer,
+        QgsCoordinateReferenceSystem(projection),
+        grid.geotransform,
+        grid.rows,
+        grid.cols,
+    )
+
+    result = shortest_path_tree(grid, sink_nodes, with_labels=True)
+    # Номера стоков с 1; недостижимые пиксели остаются NO_BASIN
+    labels = (result.label + 1).astype(np.int32).reshape(grid.rows, grid.cols)
+    labels_path = labels_path or Path(output_path).with_suffix(".tif")
+    write_raster(
+        labels_path, labels, grid.geotransform, projection, gdal.GDT_Int32, NO_BASIN
+    )
+
+    processing.run(
+        "gdal:polygonize",
+        {
+            "INPUT": str(labels_path),
+            "BAND": 1,
+            "FIELD": "sink_id",
+            "EIGHT_CONNECTEDNESS": True,
+            "OUTPUT": str(output_path),
+        },
+    )
+    polygons = QgsVectorLayer(str(output_path), "Underground basins", "ogr")
     QgsProject.instance().addMapLayer(polygons)
-    polygons.setName("Underground basins")
     return polygons
-
@@ -10,7 +10,7 @@ from .config import UndergroundCostWeights, UndergroundInputs
 from .cost_builder import build_cost_raster
 from .datasource import load_vector_layer
 from .network import run_network_analysis
-from .polygonizer import polygonize_paths
+from .polygonizer import allocate_basins
 
 
 def prompt_file_path(caption: str, filter_mask: str) -> Path | None:
@@ -81,7 +81,7 @@ def underground_river_analysis(project_folder: Path) -> None:
 
         if not progress.update(30, "Расчёт путей"):
             return
-        path_layer = run_network_analysis(
+        run_network_analysis(
             cost_raster,
             sources_layer,
             sinks_layer,
@@ -92,7 +92,9 @@ def underground_river_analysis(project_folder: Path) -> None:
 
         if not progress.update(90, "Построение полигонов"):
             return
-        polygonize_paths(path_layer, project_folder / "underground_basins.gpkg")
+        allocate_basins(
+            cost_raster, sinks_layer, project_folder / "underground_basins.gpkg"
+        )
         progress.update(100, "Готово!")
     finally:
         progress.finish()
@@ -0,0 +1,150 @@
+"""Пакетный расчёт подземного стока для набора весов стоимости.
+
+Веса подбираются перебором, и каждый отдельный запуск заново читал и
+нормировал все четыре растра. Здесь факторы нормируются один раз
+(cost_builder.normalized_factors), а каждый сценарий даёт растр стоимости
+и, если заданы точки, подземные пути и водосборы.
+"""
+
+from __future__ import annotations
+
+import itertools
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from qgis.core import QgsVectorLayer
+
+from .config import UndergroundCostWeights, UndergroundInputs
+from .cost_builder import build_cost_scenarios
+from .network import run_network_analysis
+from .polygonizer import allocate_basins
+
+
+def scenario_name(index: int, weights: UndergroundCostWeights) -> str:
+    """Имя сценария для файлов: номер и округлённые веса уклона,
+    проницаемости, карста и глубины.
+
+    Округлённые веса близких наборов совпадают, уникальность имени даёт номер.
+    """
+    return "{:03d}_s{:.2f}_p{:.2f}_k{:.2f}_d{:.2f}".format(
+        index, weights.slope, weights.permeability, weights.karst, weights.depth
+    )
+
+
+def unique_scenarios(
+    scenarios: Sequence[UndergroundCostWeights],
+) -> List[UndergroundCostWeights]:
+    """Наборы весов без повторов, в порядке первого появления."""
+    seen = set()
+    result = []
+    for weights in scenarios:
+        key = tuple(
+            round(w, 9)
+            for w in (weights.slope, weights.permeability, weights.karst, weights.depth)
+        )
+        if key not in seen:
+            seen.add(key)
+            result.append(weights)
+    return result
+
+
+def _with_depth(slope: float, permeability: float, karst: float) -> UndergroundCostWeights:
+    # Как и в одиночном запуске, вес глубины — остаток до единицы
+    return UndergroundCostWeights(
+        slope=slope,
+        permeability=permeability,
+        karst=karst,
+        depth=max(0.0, 1.0 - slope - permeability - karst),
+    )
+
+
+def weight_grid(step: float) -> List[UndergroundCostWeights]:
+    """Все наборы весов на сетке с шагом ``step`` и суммой, равной единице."""
+    if not 0 < step <= 1:
+        raise ValueError("Шаг сетки весов должен быть в интервале (0, 1]")
+    count = int(round(1.0 / step))
+    values = [round(i * step, 6) for i in range(count + 1)]
+    return [
+        _with_depth(slope, permeability, karst)
+        for slope, permeability, karst in itertools.product(values, repeat=3)
+        if slope + permeability + karst <= 1.0 + 1e-9
+    ]
+
+
+def parse_scenarios(text: str) -> List[UndergroundCostWeights]:
+    """Сценарии из строки ``"0.4,0.25,0.2; 0.3,0.3,0.2,0.2"``.
+
+    Наборы разделяются ``;`` или переводом строки, веса — запятой в порядке
+    уклон, проницаемость, карст[, глубина]; без глубины она дополняет сумму
+    до единицы.
+    """
+    scenarios = []
+    for chunk in text.replace("\n", ";").split(";"):
+        if not chunk.strip():
+            continue
+        try:
+            values = [float(v) for v in chunk.split(",")]
+        except ValueError:
+            raise ValueError(f"Некорректный набор весов: {chunk.strip()!r}") from None
+        if len(values) == 3:
+            scenarios.append(_with_depth(*values))
+        elif len(values) == 4:
+            scenarios.append(UndergroundCostWeights(*values))
+        else:
+            raise ValueError(
+                f"Ожидалось 3 или 4 веса, получено {len(values)}: {chunk.strip()!r}"
+            )
+    return scenarios
+
+
+def run_weight_scenarios(
+    inputs: UndergroundInputs,
+    scenarios: Sequence[UndergroundCostWeights],
+    output_folder: Path,
+    sources_layer: Optional[QgsVectorLayer] = None,
+    sinks_layer: Optional[QgsVectorLayer] = None,
+    keep_cost: bool = True,
+    feedback=None,
+) -> List[dict]:
+    """Считает все сценарии; для каждого возвращает словарь путей к результатам.
+
+    Повторяющиеся наборы весов считаются один раз. Растры стоимости пишутся
+    по кэшу факторов. При заданных источниках и стоках для каждого сценария
+    строятся пути и водосборы; ``keep_cost=False`` удаляет растры стоимости
+    после этого.
+    """
+    output_folder = Path(output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    scenarios = unique_scenarios(scenarios)
+    names = [scenario_name(i, w) for i, w in enumerate(scenarios, start=1)]
+    cost_paths = [output_folder / f"underground_cost_{name}.tif" for name in names]
+    build_cost_scenarios(inputs, scenarios, cost_paths)
+
+    with_network = sources_layer is not None and sinks_layer is not None
+    results = []
+    for index, (name, weights, cost_path) in enumerate(zip(names, scenarios, cost_paths)):
+        if feedback is not None:
+            if feedback.isCanceled():
+                break
+            feedback.setProgress(100 * index / len(scenarios))
+        result = {"name": name, "weights": weights}
+        if with_network:
+            paths_layer = run_network_analysis(
+                cost_path,
+                sources_layer,
+                sinks_layer,
+                output_folder / f"underground_paths_{name}.gpkg",
+                inputs.crs_auth_id,
+                progress=None,
+            )
+            basins_layer = allocate_basins(
+                cost_path, sinks_layer, output_folder / f"underground_basins_{name}.gpkg"
+            )
+            result["paths"] = paths_layer.source()
+            result["basins"] = basins_layer.source()
+        if keep_cost or not with_network:
+            result["cost"] = str(cost_path)
+        else:
+            cost_path.unlink(missing_ok=True)
+        results.append(result)
+    return results
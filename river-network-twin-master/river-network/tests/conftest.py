@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Модули плагина импортируются как пакет src
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,91 @@
+"""Рёбра grid_edges против построения графа циклом по пикселям.
+
+Эталон повторяет прежние построители build_cost_graph: обход растра по
+строкам, для каждого пикселя суши — перебор половины окрестности.
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+from src.least_cost_path.grid import NEIGHBOUR_OFFSETS, NodeIndex, grid_edges
+from src.least_cost_path.grid_search import (
+    HEIGHT_DIFF,
+    MEAN_COST,
+    CostGrid,
+    edge_weights,
+    grid_graph,
+)
+
+
+def loop_edges(values, passable, edge_weight=HEIGHT_DIFF, eps=1e-6):
+    """Рёбра ``(u, v, w)`` в порядке добавления прежним циклом."""
+    rows, cols = values.shape
+    edges = []
+    for i in range(rows):
+        for j in range(cols):
+            if not passable[i, j]:
+                continue
+            for di, dj, factor in NEIGHBOUR_OFFSETS:
+                ni, nj = i + di, j + dj
+                if 0 <= ni < rows and 0 <= nj < cols and passable[ni, nj]:
+                    hu, hv = float(values[i, j]), float(values[ni, nj])
+                    if edge_weight == MEAN_COST:
+                        w = factor * (hu + hv) / 2
+                    else:
+                        w = factor * (abs(hu - hv) + eps)
+                    edges.append((i * cols + j, ni * cols + nj, w))
+    return edges
+
+
+def random_grid(rows, cols, water, seed):
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(0, 100, size=(rows, cols)).astype(np.float32)
+    passable = rng.random((rows, cols)) >= water
+    return values, passable
+
+
+@pytest.mark.parametrize(
+    "rows, cols, water", [(1, 1, 0.0), (1, 7, 0.0), (6, 1, 0.2), (9, 13, 0.3)]
+)
+def test_edges_match_loop_order(rows, cols, water):
+    values, passable = random_grid(rows, cols, water, seed=rows * cols)
+    u, v, factor = grid_edges(passable)
+    expected = loop_edges(values, passable)
+    assert list(zip(u.tolist(), v.tolist())) == [(a, b) for a, b, _ in expected]
+    diagonal = (u // cols != v // cols) & (u % cols != v % cols)
+    assert factor.tolist() == np.where(diagonal, math.sqrt(2), 1.0).tolist()
+
+
+def test_node_index_keeps_order():
+    values, passable = random_grid(12, 10, 0.25, seed=1)
+    index = NodeIndex.from_mask(passable)
+    u_pixels, v_pixels, _ = grid_edges(passable)
+    u_nodes, v_nodes, _ = grid_edges(passable, index)
+    assert (index.pixels[u_nodes] == u_pixels).all()
+    assert (index.pixels[v_nodes] == v_pixels).all()
+
+
+@pytest.mark.parametrize("edge_weight", [HEIGHT_DIFF, MEAN_COST])
+def test_graph_weights_match_loop(edge_weight):
+    values, passable = random_grid(15, 11, 0.2, seed=7)
+    grid = CostGrid(values, passable, (0, 1, 0, 0, 0, -1), edge_weight=edge_weight)
+    graph, index = grid_graph(grid)
+    expected = {
+        (a, b): w for a, b, w in loop_edges(values, passable, edge_weight, grid.eps)
+    }
+    actual = {}
+    for a, b, w in graph.iterEdgesWeights():
+        a, b = sorted((int(index.pixels[a]), int(index.pixels[b])))
+        actual[a, b] = w
+    assert actual.keys() == expected.keys()
+    for key, w in expected.items():
+        assert actual[key] == pytest.approx(w, rel=1e-12)
+
+    u, v, factor = grid_edges(passable)
+    flat = values.ravel()
+    weights = edge_weights(grid, flat[u], flat[v], factor)
+    assert weights.tolist() == pytest.approx(
+        [expected[a, b] for a, b in zip(u.tolist(), v.tolist())], rel=1e-12
+    )